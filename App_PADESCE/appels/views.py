@@ -5,6 +5,7 @@ from decimal import Decimal
 from pathlib import Path
 
 import openpyxl
+import pandas as pd
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models import Case, DecimalField, ExpressionWrapper, F, When
@@ -16,11 +17,26 @@ from django.utils.text import slugify
 from django.views.decorators.http import require_POST
 
 from App_PADESCE.appels.models import Appel
+from App_PADESCE.core.importing import HeaderIndex, required, stream_rows
+from App_PADESCE.core.normalization import clean_text, to_decimal
 from App_PADESCE.formations.models import Classe
 
 
-def _normalize_header(value):
-    return (value or "").strip().lower()
+# Champ -> en-tete de la feuille "Feuil2".
+APPEL_COLUMNS = {
+    "code": "Code",
+    "nom": "Nom",
+    "prestataire": "Prestataire",
+    "beneficiaire": "Beneficiaire",
+    "lieu": "Lieux",
+    "classe_label": "Classe",
+    "taux_presence": "Taux de presence",
+    "telephone1": "1er No tél 0 Tel No",
+    "telephone2": "2e No tél 0 Tel No",
+    "type_formation_declaree": "Type de formation declarée",
+    "formation_padesce": "Formation Padesce",
+}
+APPEL_INDEX = HeaderIndex({field: [label] for field, label in APPEL_COLUMNS.items()})
 
 
 def _parse_excel(file_obj):
@@ -32,54 +48,20 @@ def _parse_excel(file_obj):
     header = next(rows, None)
     if not header:
         return []
-    header_map = {_normalize_header(col): idx for idx, col in enumerate(header)}
-
-    def get(row, key):
-        idx = header_map.get(_normalize_header(key))
-        if idx is None or idx >= len(row):
-            return ""
-        return row[idx] or ""
-
-    data = []
-    for row in rows:
-        nom = get(row, "Nom")
-        code = get(row, "Code")
-        if not nom or not code:
-            continue
-        prestataire = get(row, "Prestataire")
-        beneficiaire = get(row, "Beneficiaire")
-        lieu = get(row, "Lieux")
-        classe_label = get(row, "Classe")
-        taux_presence = get(row, "Taux de presence") or 0
-        tel1 = get(row, "1er No tél 0 Tel No")
-        tel2 = get(row, "2e No tél 0 Tel No")
-        type_formation = get(row, "Type de formation declarée")
-        formation_padesce = get(row, "Formation Padesce")
-        try:
-            taux_presence = Decimal(str(taux_presence))
-        except Exception:
-            taux_presence = Decimal("0")
-        pct = Decimal("0")
-        try:
-            pct = taux_presence * 100
-        except Exception:
-            pct = Decimal("0")
-        data.append(
-            {
-                "code": str(code).strip(),
-                "nom": str(nom).strip(),
-                "prestataire": str(prestataire).strip(),
-                "beneficiaire": str(beneficiaire).strip(),
-                "lieu": str(lieu).strip(),
-                "classe_label": str(classe_label).strip(),
-                "taux_presence": pct,
-                "telephone1": str(tel1).strip() if tel1 not in (None, "") else "",
-                "telephone2": str(tel2).strip() if tel2 not in (None, "") else "",
-                "type_formation_declaree": str(type_formation).strip(),
-                "formation_padesce": str(formation_padesce).strip(),
-            }
-        )
-    return data
+    columns = APPEL_INDEX.resolve(header)
+    sink = stream_rows(columns, enumerate(rows, start=2), [required("nom", "code")])
+    frame = pd.DataFrame(sink.rows, columns=list(APPEL_COLUMNS), dtype=object)
+    if frame.empty:
+        return []
+    # Cellule "fausse" (0, chaine vide) traitee comme vide, comme avant.
+    frame = frame.where(frame.astype(bool), None)
+    # Nettoyage colonne par colonne (core/normalization.py).
+    for field in APPEL_COLUMNS:
+        if field != "taux_presence":
+            frame[field] = clean_text(frame[field])
+    taux = to_decimal(frame["taux_presence"])
+    frame["taux_presence"] = [value * 100 if value is not None else Decimal("0") for value in taux]
+    return frame.to_dict("records")
 
 
 def _parse_bool_flag(value):
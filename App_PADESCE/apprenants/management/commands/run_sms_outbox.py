@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from App_PADESCE.apprenants.outbox import dispatch_pending, requeue_interrupted
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispatcher des SMS : expedie les messages en file (SmsLog en attente), plusieurs a la fois, "
+        "avec limitation de debit par fournisseur et nouvelles tentatives differees. Un seul dispatcher a la fois."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Traite les messages dus puis s'arrete.")
+        parser.add_argument("--poll", type=float, default=2.0, help="Attente (s) entre deux lectures de la file vide.")
+        parser.add_argument("--workers", type=int, help="Envois simultanes (defaut : SMS_WORKERS).")
+
+    def handle(self, *args, **options):
+        if options["poll"] <= 0:
+            raise CommandError("--poll doit etre > 0.")
+        if options["workers"] is not None and options["workers"] <= 0:
+            raise CommandError("--workers doit etre > 0.")
+        requeued = requeue_interrupted()
+        if requeued:
+            self.stderr.write(f"{requeued} SMS interrompu(s) remis en file.")
+        try:
+            while True:
+                totals = dispatch_pending(options["workers"])
+                if any(totals.values()):
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"SMS : {totals['sent']} envoye(s), {totals['failed']} en echec, "
+                            f"{totals['queued']} nouvelle(s) tentative(s) programmee(s)."
+                        )
+                    )
+                if options["once"]:
+                    return
+                time.sleep(options["poll"])
+        except KeyboardInterrupt:
+            self.stdout.write("Arret du dispatcher.")
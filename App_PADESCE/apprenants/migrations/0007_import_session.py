@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-18 00:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apprenants', '0006_import_columns'),
+        ('formations', '0002_prestation_durees_jalons'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('generate_codes', models.BooleanField(default=False)),
+                ('column_defs', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('open', 'En correction'), ('committed', 'Importe')], default='open', max_length=20)),
+                ('classe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_sessions', to='formations.classe')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line', models.PositiveIntegerField()),
+                ('data', models.JSONField(default=dict)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('valid', models.BooleanField(default=True)),
+                ('nom_complet', models.CharField(blank=True, max_length=255)),
+                ('telephone1', models.CharField(blank=True, max_length=30)),
+                ('numero', models.CharField(blank=True, max_length=50)),
+                ('code', models.CharField(blank=True, max_length=50)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='apprenants.importsession')),
+            ],
+            options={
+                'ordering': ['line'],
+                'indexes': [models.Index(fields=['session', 'nom_complet'], name='apprenants__session_18f7f2_idx'), models.Index(fields=['session', 'telephone1'], name='apprenants__session_9d067c_idx'), models.Index(fields=['session', 'numero'], name='apprenants__session_5fb445_idx'), models.Index(fields=['session', 'code'], name='apprenants__session_060e46_idx')],
+                'constraints': [models.UniqueConstraint(fields=('session', 'line'), name='unique_ligne_par_import')],
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 from App_PADESCE.core.models import TimeStampedModel
@@ -49,12 +50,55 @@ class Apprenant(TimeStampedModel):
         return f"{self.code} - {self.nom_complet}"
 
 
+class SmsJob(TimeStampedModel):
+    """Envoi groupe de SMS : ses messages (SmsLog) sont expedies par la commande run_sms_outbox."""
+
+    classe = models.ForeignKey(Classe, on_delete=models.SET_NULL, null=True, blank=True, related_name="sms_jobs")
+    total = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"Envoi SMS {self.pk} ({self.total} messages)"
+
+    def progress(self) -> dict:
+        """Etat expose par l'API de suivi : compteurs par statut et resultat par apprenant."""
+        counts = dict.fromkeys(SmsLog.STATUSES, 0)
+        results = []
+        for apprenant_id, status, detail in self.logs.values_list("apprenant_id", "status", "detail"):
+            counts[status] += 1
+            if status in SmsLog.FINISHED:
+                results.append({"id": apprenant_id, "ok": status == SmsLog.SENT, "detail": detail})
+        pending = counts[SmsLog.QUEUED] + counts[SmsLog.SENDING]
+        return {
+            "id": self.pk,
+            "total": self.total,
+            **counts,
+            "finished": not pending,
+            "results": results,
+            "created_at": self.created_at,
+        }
+
+
 class SmsLog(TimeStampedModel):
+    QUEUED = "queued"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
     STATUS_CHOICES = [
-        ("sent", "Envoye"),
-        ("failed", "Echec"),
+        (QUEUED, "En attente"),
+        (SENDING, "En cours"),
+        (SENT, "Envoye"),
+        (FAILED, "Echec"),
     ]
+    STATUSES = tuple(value for value, _ in STATUS_CHOICES)
+    FINISHED = (SENT, FAILED)
 
+    job = models.ForeignKey(SmsJob, on_delete=models.CASCADE, null=True, blank=True, related_name="logs")
     apprenant = models.ForeignKey(
         Apprenant, on_delete=models.SET_NULL, null=True, blank=True, related_name="sms_logs"
     )
@@ -65,6 +109,10 @@ class SmsLog(TimeStampedModel):
     message = models.TextField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
     detail = models.CharField(max_length=255, blank=True)
+    # Fournisseur retenu a la mise en file, tentatives et prochaine tentative (reprise avec attente).
+    provider = models.CharField(max_length=20, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
     sent_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -72,8 +120,68 @@ class SmsLog(TimeStampedModel):
         indexes = [
             models.Index(fields=["status"]),
             models.Index(fields=["sent_at"]),
+            models.Index(fields=["status", "next_attempt_at"]),
         ]
 
     def __str__(self) -> str:
         target = self.apprenant or "inconnu"
         return f"SMS {self.status} - {target}"
+
+
+class ImportSession(TimeStampedModel):
+    """Import d'apprenants en cours de correction : lignes lues et validees cote serveur."""
+
+    OPEN = "open"
+    COMMITTED = "committed"
+    STATUS_CHOICES = [
+        (OPEN, "En correction"),
+        (COMMITTED, "Importe"),
+    ]
+
+    classe = models.ForeignKey(Classe, on_delete=models.CASCADE, related_name="import_sessions")
+    file_name = models.CharField(max_length=255, blank=True)
+    generate_codes = models.BooleanField(default=False)
+    column_defs = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=OPEN)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"Import {self.pk} - {self.classe}"
+
+
+class ImportRow(models.Model):
+    """
+    Ligne d'un import en cours. Les valeurs soumises aux controles de doublons sont
+    recopiees dans des colonnes indexees : les lignes en conflit avec une ligne corrigee
+    se retrouvent par requete, sans relire tout le lot.
+    """
+
+    session = models.ForeignKey(ImportSession, on_delete=models.CASCADE, related_name="rows")
+    line = models.PositiveIntegerField()
+    data = models.JSONField(default=dict)
+    errors = models.JSONField(default=list, blank=True)
+    valid = models.BooleanField(default=True)
+    nom_complet = models.CharField(max_length=255, blank=True)
+    telephone1 = models.CharField(max_length=30, blank=True)
+    numero = models.CharField(max_length=50, blank=True)
+    code = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        ordering = ["line"]
+        constraints = [
+            models.UniqueConstraint(fields=["session", "line"], name="unique_ligne_par_import"),
+        ]
+        indexes = [
+            models.Index(fields=["session", "nom_complet"]),
+            models.Index(fields=["session", "telephone1"]),
+            models.Index(fields=["session", "numero"]),
+            models.Index(fields=["session", "code"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"Import {self.session_id} ligne {self.line}"
@@ -0,0 +1,148 @@
+"""
+File d'envoi des SMS, sans broker externe.
+
+La vue `send_sms` ne fait que mettre les messages en file (SmsLog "queued", rattaches a un
+SmsJob) et rend la main ; la commande `run_sms_outbox`, lancee dans son propre processus,
+les expedie. Le dispatcher reserve un lot de messages dus (mise a jour conditionnelle du
+statut) et le confie a un pool de fils : SMS_WORKERS envois simultanes, debit limite par
+fournisseur (sms.RateLimiter). Les resultats du lot sont enregistres en une ecriture ; les
+fils ne touchent pas a la base.
+
+Un echec passager (reseau, HTTP 429 / 5xx) remet le message en file, a tenter de nouveau
+apres SMS_RETRY_DELAY secondes, delai double a chaque echec (plafond SMS_RETRY_MAX_DELAY),
+jusqu'a SMS_MAX_ATTEMPTS tentatives. Un seul dispatcher doit tourner : au demarrage, les
+messages restes "en cours" (arret brutal du precedent) sont remis en file.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from App_PADESCE.apprenants.models import SmsJob, SmsLog
+from App_PADESCE.apprenants.sms import RateLimiter, SmsResult, code_message, default_provider, get_provider, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Messages reserves par lot : quelques tours du pool entre deux ecritures en base.
+BATCH_PER_WORKER = 10
+
+_limiters: Dict[str, RateLimiter] = {}
+
+
+def enqueue_sms(apprenants: Iterable, classe=None, user=None, provider: Optional[str] = None) -> SmsJob:
+    """Met en file le code de chaque apprenant ; un numero invalide est aussitot en echec."""
+    provider = provider or default_provider()
+    logs: List[SmsLog] = []
+    for apprenant in apprenants:
+        phone = normalize_phone(apprenant.telephone1 or "")
+        log = SmsLog(
+            apprenant=apprenant,
+            classe_id=apprenant.classe_id,
+            telephone=phone or apprenant.telephone1 or "",
+            message=code_message(apprenant),
+            status=SmsLog.QUEUED,
+            provider=provider,
+        )
+        if not phone:
+            log.status = SmsLog.FAILED
+            log.detail = "Numero invalide"
+        logs.append(log)
+    with transaction.atomic():
+        job = SmsJob.objects.create(
+            classe=classe,
+            total=len(logs),
+            created_by=user if getattr(user, "is_authenticated", False) else None,
+        )
+        for log in logs:
+            log.job = job
+        SmsLog.objects.bulk_create(logs, batch_size=500)
+    return job
+
+
+def claim_batch(limit: int) -> List[SmsLog]:
+    """Reserve jusqu'a `limit` messages dus, les plus anciens d'abord."""
+    due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now())
+    ids = list(
+        SmsLog.objects.filter(due, status=SmsLog.QUEUED).order_by("pk").values_list("pk", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    SmsLog.objects.filter(pk__in=ids, status=SmsLog.QUEUED).update(status=SmsLog.SENDING, attempts=F("attempts") + 1)
+    return list(SmsLog.objects.filter(pk__in=ids, status=SmsLog.SENDING).order_by("pk"))
+
+
+def requeue_interrupted() -> int:
+    """Messages restes "en cours" apres l'arret brutal du dispatcher precedent : remis en file."""
+    return SmsLog.objects.filter(status=SmsLog.SENDING).update(status=SmsLog.QUEUED)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Attente avant la tentative suivante : SMS_RETRY_DELAY, doublee a chaque echec."""
+    delay = settings.SMS_RETRY_DELAY * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, settings.SMS_RETRY_MAX_DELAY))
+
+
+def _limiter(name: str) -> RateLimiter:
+    if name not in _limiters:
+        _limiters[name] = RateLimiter(get_provider(name).rate)
+    return _limiters[name]
+
+
+def _deliver(log: SmsLog) -> SmsResult:
+    """Execute dans un fil du pool : attend son tour de debit et appelle le fournisseur."""
+    try:
+        _limiters[log.provider].acquire()
+        return get_provider(log.provider).send(log.telephone, log.message)
+    except Exception as exc:
+        logger.exception("Envoi SMS en echec. sms=%s", log.pk)
+        return SmsResult(False, f"Exception: {exc}"[:255], retry=True)
+
+
+def _record(logs: List[SmsLog], results: List[SmsResult]) -> Dict[str, int]:
+    now = timezone.now()
+    counts = {SmsLog.SENT: 0, SmsLog.FAILED: 0, SmsLog.QUEUED: 0}
+    for log, result in zip(logs, results):
+        log.detail = result.detail[:255]
+        if result.ok:
+            log.status = SmsLog.SENT
+            log.sent_at = now
+        elif result.retry and log.attempts < settings.SMS_MAX_ATTEMPTS:
+            log.status = SmsLog.QUEUED
+            log.next_attempt_at = now + retry_delay(log.attempts)
+        else:
+            log.status = SmsLog.FAILED
+        counts[log.status] += 1
+    SmsLog.objects.bulk_update(logs, ["status", "detail", "provider", "sent_at", "next_attempt_at"], batch_size=500)
+    return counts
+
+
+def dispatch_pending(workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Expedie tous les messages dus (les nouvelles tentatives differees restent en file) ;
+    renvoie le nombre de messages envoyes, en echec et remis en file.
+    """
+    workers = max(1, workers or settings.SMS_WORKERS)
+    totals = {SmsLog.SENT: 0, SmsLog.FAILED: 0, SmsLog.QUEUED: 0}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms") as pool:
+        while True:
+            logs = claim_batch(workers * BATCH_PER_WORKER)
+            if not logs:
+                return totals
+            # Fournisseurs et limiteurs prepares ici, avant le passage dans les fils.
+            for log in logs:
+                log.provider = log.provider or default_provider()
+                _limiter(log.provider)
+            counts = _record(logs, list(pool.map(_deliver, logs)))
+            for status, count in counts.items():
+                totals[status] += count
+            logger.info(
+                "Lot SMS traite. envoyes=%s echecs=%s reessais=%s",
+                counts[SmsLog.SENT],
+                counts[SmsLog.FAILED],
+                counts[SmsLog.QUEUED],
+            )
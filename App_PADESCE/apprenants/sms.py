@@ -0,0 +1,158 @@
+"""
+Fournisseurs d'envoi de SMS et limitation de debit.
+
+Un fournisseur expose `send(numero_local, message)` et renvoie un `SmsResult` : envoye,
+detail, et `retry` quand l'echec est passager (reseau, HTTP 429 / 5xx) et merite une
+nouvelle tentative. Le choix se fait par nom (`SMS_PROVIDER`) :
+
+- "obit" : API HTTP Obit SMS (`OBIT_*`), debit limite a `OBIT_RATE_LIMIT` messages/s ;
+- "fake" : fournisseur local, sans reseau, pour tester toute la chaine hors ligne. Il
+  garde les messages en memoire (`FakeProvider.outbox`) ; un numero finissant par 99 est
+  refuse, un numero finissant par 98 echoue une fois (erreur passagere) puis passe.
+
+Les fournisseurs sont appeles depuis les fils du dispatcher (voir outbox.py) : ils ne
+touchent pas a la base.
+"""
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, NamedTuple, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_phone(value: str) -> str:
+    """Numero local a 9 chiffres (indicatif pays retire), ou "" s'il est invalide."""
+    if not value:
+        return ""
+    digits = "".join(ch for ch in str(value) if ch.isdigit())
+    if len(digits) > 9:
+        if digits.startswith(settings.OBIT_COUNTRY) and len(digits) == len(settings.OBIT_COUNTRY) + 9:
+            digits = digits[len(settings.OBIT_COUNTRY):]
+        else:
+            digits = digits[-9:]
+    return digits if len(digits) == 9 else ""
+
+
+def code_message(apprenant) -> str:
+    return f"Bonjour Mr/Mlle, votre code PADESCE est: {apprenant.code}. "
+
+
+class SmsResult(NamedTuple):
+    ok: bool
+    detail: str
+    retry: bool = False
+
+
+class RateLimiter:
+    """Seau a jetons partage entre fils : au plus `rate` envois par seconde (0 : sans limite)."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ObitProvider:
+    name = "obit"
+
+    @property
+    def rate(self) -> float:
+        return settings.OBIT_RATE_LIMIT
+
+    def send(self, local_number: str, message: str) -> SmsResult:
+        if not settings.OBIT_API_KEY:
+            return SmsResult(False, "API key manquante")
+        params = {
+            "key_api": settings.OBIT_API_KEY,
+            "sender": settings.OBIT_SENDER,
+            "destination": f"{settings.OBIT_COUNTRY}{local_number}",
+            "message": message,
+        }
+        url = f"{settings.OBIT_API_URL}?{urllib.parse.urlencode(params)}"
+        try:
+            with urllib.request.urlopen(url, timeout=15) as resp:
+                body = resp.read().decode("utf-8", "ignore")
+                if getattr(resp, "status", 200) != 200:
+                    return SmsResult(False, f"HTTP {resp.status}", retry=resp.status >= 500)
+        except urllib.error.HTTPError as exc:
+            return SmsResult(False, f"HTTP {exc.code}", retry=exc.code == 429 or exc.code >= 500)
+        except Exception as exc:  # pragma: no cover - network errors
+            logger.warning("SMS request failed: %s", exc)
+            return SmsResult(False, f"Exception: {exc}"[:255], retry=True)
+
+        try:
+            data = json.loads(body)
+            if isinstance(data, dict) and data.get("success") is True:
+                return SmsResult(True, "OK")
+        except json.JSONDecodeError:
+            pass
+        if '"success":true' in body.replace(" ", "").lower():
+            return SmsResult(True, "OK")
+        if "error" in body.lower():
+            return SmsResult(False, "Erreur API")
+        return SmsResult(False, "Reponse inconnue")
+
+
+class FakeProvider:
+    name = "fake"
+    outbox: List[Tuple[str, str]] = []
+    _failed_once: set = set()
+    _lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return settings.SMS_FAKE_RATE_LIMIT
+
+    def send(self, local_number: str, message: str) -> SmsResult:
+        if settings.SMS_FAKE_LATENCY > 0:
+            time.sleep(settings.SMS_FAKE_LATENCY)
+        with self._lock:
+            if local_number.endswith("99"):
+                return SmsResult(False, "Numero refuse (fournisseur fictif)")
+            if local_number.endswith("98") and local_number not in self._failed_once:
+                self._failed_once.add(local_number)
+                return SmsResult(False, "Indisponible (fournisseur fictif)", retry=True)
+            self.outbox.append((local_number, message))
+        return SmsResult(True, "OK")
+
+
+PROVIDERS = {provider.name: provider for provider in (ObitProvider, FakeProvider)}
+_instances: Dict[str, object] = {}
+
+
+def default_provider() -> str:
+    if settings.SMS_PROVIDER not in PROVIDERS:
+        raise ValueError(f"Fournisseur SMS inconnu : {settings.SMS_PROVIDER}")
+    return settings.SMS_PROVIDER
+
+
+def get_provider(name: str):
+    """Instance partagee du fournisseur `name`."""
+    if name not in _instances:
+        if name not in PROVIDERS:
+            raise ValueError(f"Fournisseur SMS inconnu : {name}")
+        _instances[name] = PROVIDERS[name]()
+    return _instances[name]
@@ -1,3 +1,249 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from App_PADESCE.apprenants import outbox
+from App_PADESCE.apprenants.models import Apprenant, ImportRow, ImportSession, SmsLog
+from App_PADESCE.apprenants.sms import FakeProvider
+from App_PADESCE.apprenants.views import _validate_preview
+from App_PADESCE.core.bloom import BloomFilter
+from App_PADESCE.core.middleware import set_current_user
+from App_PADESCE.formations.models import Classe, Formation, Prestataire, Prestation
+from App_PADESCE.reporting.cache import get_reporting_cache
+
+
+class ApprenantDataMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(code="F-APP", nom="Formation")
+        prestataire = Prestataire.objects.create(code="PR-APP", raison_sociale="Prestataire")
+        prestation = Prestation.objects.create(code="PS-APP", prestataire=prestataire, formation=cls.formation)
+        cls.classe = Classe.objects.create(
+            code="C-APP", prestation=prestation, formation=cls.formation, intitule_formation="Formation"
+        )
+        for n in range(1, 4):
+            Apprenant.objects.create(
+                code=f"AB{n:02d}",
+                classe=cls.classe,
+                formation=cls.formation,
+                nom_complet=f"Apprenant {n}",
+                telephone1=f"67700000{n}",
+            )
+
+    def setUp(self):
+        super().setUp()
+        get_reporting_cache().clear()
+        user = get_user_model().objects.create_user(username="apprenants", password="x")
+        self.client.force_login(user)
+        self.addCleanup(set_current_user, None)
+
+
+class ApprenantCodeCheckTests(ApprenantDataMixin, TestCase):
+    def check(self, **payload):
+        return self.client.post(
+            reverse("apprenants_api_codes"), json.dumps(payload), content_type="application/json"
+        )
+
+    def test_batch_check_returns_existing_values_only(self):
+        body = self.check(
+            codes=["AB01", "ZZ99", "AB03"], telephones=["677000002", "699999999"], formation_id=self.formation.pk
+        ).json()
+        self.assertEqual((body["codes"], body["telephones"]), (["AB01", "AB03"], ["677000002"]))
+        # Telephones uniques par formation : une autre formation ne les voit pas.
+        body = self.check(telephones=["677000002"], formation_id=self.formation.pk + 1).json()
+        self.assertEqual(body["telephones"], [])
+        self.assertEqual(self.client.get(reverse("apprenants_api_codes")).status_code, 405)
+
+    def test_batch_check_is_capped(self):
+        response = self.check(codes=[f"C{n}" for n in range(5001)])
+        self.assertEqual(response.status_code, 400)
+
+    def test_filter_snapshot(self):
+        url = reverse("apprenants_api_codes_filter") + f"?formation={self.formation.pk}"
+        response = self.client.get(url)
+        payload = response.json()
+        codes = BloomFilter(payload["codes"]["m"], payload["codes"]["k"])
+        codes.array = bytearray(base64.b64decode(payload["codes"]["bits"]))
+        self.assertEqual(payload["codes"]["count"], 3)
+        self.assertTrue(all(f"AB{n:02d}" in codes for n in range(1, 4)))
+        self.assertEqual(payload["telephones"]["count"], 3)
+        # Donnees inchangees : 304 ; un nouvel apprenant change l'ETag.
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        Apprenant.objects.create(code="AB04", classe=self.classe, formation=self.formation, nom_complet="Apprenant 4")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+
+class ImportPreviewValidationTests(ApprenantDataMixin, TestCase):
+    def row(self, n: int, **values) -> dict:
+        row = {"numero": str(n), "nom_complet": f"Nouveau {n}", "age": 25, "telephone1": f"69900000{n}", "_code": ""}
+        row.update(values)
+        return row
+
+    def test_conflicts_are_looked_up_from_file_values(self):
+        rows = [self.row(1), self.row(2, telephone1="677000002"), self.row(3, _code="AB03"), self.row(4, _code="ZZ01")]
+        errors = []
+        # Une requete par colonne controlee, quel que soit le nombre d'apprenants en base.
+        with self.assertNumQueries(2):
+            conflicts = _validate_preview(rows, self.formation, False, errors)
+        self.assertEqual(conflicts, [(2, "telephone1", "677000002"), (3, "_code", "AB03")])
+        self.assertEqual(
+            errors,
+            [
+                "Telephones deja utilises pour cette formation: ligne 2 (677000002)",
+                "Codes deja utilises: ligne 3 (AB03)",
+            ],
+        )
+
+    def test_generated_codes_skip_code_lookup(self):
+        errors = []
+        with self.assertNumQueries(1):
+            conflicts = _validate_preview([self.row(1, _code="AB01")], self.formation, True, errors)
+        self.assertEqual((conflicts, errors), ([], []))
+
+
+class ImportSessionTests(ApprenantDataMixin, TestCase):
+    def open_session(self, lines, generate_codes=True):
+        content = "Nom complet,Age,1er numero\n" + "".join(f"{line}\n" for line in lines)
+        response = self.client.post(
+            reverse("apprenants_import_session", args=[self.classe.pk]),
+            {"fichier": SimpleUploadedFile("apprenants.csv", content.encode()), "generate_codes": generate_codes},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def patch(self, session, *cells):
+        return self.client.patch(
+            reverse("apprenants_import_session_detail", args=[session]),
+            json.dumps({"cells": [{"line": line, "field": field, "value": value} for line, field, value in cells]}),
+            content_type="application/json",
+        )
+
+    def commit(self, session):
+        return self.client.post(reverse("apprenants_import_session_commit", args=[session]))
+
+    def test_create_validates_every_row(self):
+        body = self.open_session(["Nouveau 1,25,699000001", "Nouveau 2,30,699000001", "Nouveau 3,28,677000001"])
+        self.assertEqual((body["total"], body["invalid"]), (3, 3))
+        kinds = {row["line"]: [error["kind"] for error in row["errors"]] for row in body["rows"]}
+        self.assertEqual(kinds, {1: ["doublon"], 2: ["doublon"], 3: ["base"]})
+        self.assertEqual(ImportRow.objects.filter(session_id=body["session"], telephone1="699000001").count(), 2)
+
+    def test_patch_revalidates_edited_and_related_rows_only(self):
+        session = self.open_session(
+            ["Nouveau 1,25,699000001", "Nouveau 2,30,699000001", "Nouveau 3,28,677000001", "Nouveau 4,22,699000004"]
+        )["session"]
+        body = self.patch(session, (2, "telephone1", "699000002")).json()
+        # Ligne corrigee et ligne qui partageait son telephone ; les lignes 3 et 4 ne sont pas renvoyees.
+        self.assertEqual([(row["line"], row["errors"]) for row in body["rows"]], [(1, []), (2, [])])
+        self.assertEqual(body["invalid"], 1)
+        self.assertEqual(self.patch(session, (99, "telephone1", "1")).status_code, 400)
+
+    def test_commit_requires_valid_rows(self):
+        session = self.open_session(["Nouveau 1,25,699000001", "Nouveau 2,30,677000001"])["session"]
+        response = self.commit(session)
+        self.assertEqual((response.status_code, response.json()["invalid"]), (400, 1))
+
+        self.patch(session, (2, "telephone1", "699000002"))
+        body = self.commit(session).json()
+        self.assertEqual(body["created"], 2)
+        self.assertEqual(
+            sorted(self.classe.apprenants.values_list("nom_complet", flat=True)),
+            ["Apprenant 1", "Apprenant 2", "Apprenant 3", "Nouveau 1", "Nouveau 2"],
+        )
+        self.assertEqual(ImportSession.objects.get(pk=session).status, ImportSession.COMMITTED)
+        self.assertFalse(ImportRow.objects.filter(session_id=session).exists())
+        self.assertEqual(self.commit(session).status_code, 409)
+        self.assertEqual(self.patch(session, (1, "age", "26")).status_code, 409)
+
+
+@override_settings(SMS_PROVIDER="fake", SMS_FAKE_LATENCY=0, SMS_FAKE_RATE_LIMIT=0, SMS_WORKERS=2)
+class SmsOutboxTests(TestCase):
+    """File d'envoi des SMS avec le fournisseur fictif (fin 99 : refuse, fin 98 : echoue une fois)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        formation = Formation.objects.create(code="F-SMS", nom="Formation SMS")
+        prestataire = Prestataire.objects.create(code="PR-SMS", raison_sociale="Prestataire")
+        prestation = Prestation.objects.create(code="PS-SMS", prestataire=prestataire, formation=formation)
+        cls.classe = Classe.objects.create(
+            code="C-SMS", prestation=prestation, formation=formation, intitule_formation="Formation SMS"
+        )
+        phones = {"ok": "677000001", "refuse": "+237 677 000 099", "passager": "677000098", "invalide": "12"}
+        cls.apprenants = {
+            key: Apprenant.objects.create(
+                code=f"A-{key}", classe=cls.classe, formation=formation, nom_complet=key, telephone1=phone
+            )
+            for key, phone in phones.items()
+        }
+
+    def setUp(self):
+        FakeProvider.outbox.clear()
+        FakeProvider._failed_once.clear()
+        outbox._limiters.clear()
+
+    def statuses(self, job):
+        return {log.apprenant.nom_complet: log for log in job.logs.select_related("apprenant")}
+
+    def test_enqueue_only_queues(self):
+        job = outbox.enqueue_sms(self.apprenants.values(), classe=self.classe)
+        logs = self.statuses(job)
+        self.assertEqual(job.total, 4)
+        self.assertEqual(logs["ok"].status, SmsLog.QUEUED)
+        self.assertEqual(logs["ok"].provider, "fake")
+        self.assertEqual(logs["refuse"].telephone, "677000099")
+        self.assertEqual(logs["invalide"].status, SmsLog.FAILED)
+        self.assertEqual(FakeProvider.outbox, [])
+
+    def test_dispatch_sent_refused_and_retried(self):
+        job = outbox.enqueue_sms(self.apprenants.values(), classe=self.classe)
+
+        totals = outbox.dispatch_pending()
+        self.assertEqual(totals, {SmsLog.SENT: 1, SmsLog.FAILED: 1, SmsLog.QUEUED: 1})
+        logs = self.statuses(job)
+        self.assertEqual(logs["ok"].status, SmsLog.SENT)
+        self.assertEqual(logs["refuse"].status, SmsLog.FAILED)
+        self.assertEqual(logs["refuse"].attempts, 1)
+        # Echec passager : remis en file, tentative suivante differee de SMS_RETRY_DELAY.
+        self.assertEqual(logs["passager"].status, SmsLog.QUEUED)
+        self.assertGreater(logs["passager"].next_attempt_at, timezone.now())
+        self.assertFalse(job.progress()["finished"])
+
+        # Pas encore du : rien a envoyer.
+        self.assertEqual(outbox.dispatch_pending(), {SmsLog.SENT: 0, SmsLog.FAILED: 0, SmsLog.QUEUED: 0})
+
+        SmsLog.objects.filter(pk=logs["passager"].pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.dispatch_pending(), {SmsLog.SENT: 1, SmsLog.FAILED: 0, SmsLog.QUEUED: 0})
+        logs = self.statuses(job)
+        self.assertEqual(logs["passager"].status, SmsLog.SENT)
+        self.assertEqual(logs["passager"].attempts, 2)
+        self.assertEqual(sorted(number for number, _ in FakeProvider.outbox), ["677000001", "677000098"])
+
+        progress = job.progress()
+        self.assertTrue(progress["finished"])
+        self.assertEqual((progress[SmsLog.SENT], progress[SmsLog.FAILED]), (2, 2))
+
+    @override_settings(SMS_RETRY_DELAY=0)
+    def test_retry_without_delay_in_same_pass(self):
+        outbox.enqueue_sms([self.apprenants["passager"]])
+        self.assertEqual(outbox.dispatch_pending(), {SmsLog.SENT: 1, SmsLog.FAILED: 0, SmsLog.QUEUED: 1})
+        self.assertEqual([number for number, _ in FakeProvider.outbox], ["677000098"])
+
+    @override_settings(SMS_MAX_ATTEMPTS=1)
+    def test_transient_failure_stops_after_max_attempts(self):
+        job = outbox.enqueue_sms([self.apprenants["passager"]])
+        self.assertEqual(outbox.dispatch_pending(), {SmsLog.SENT: 0, SmsLog.FAILED: 1, SmsLog.QUEUED: 0})
+        self.assertEqual(job.logs.get().status, SmsLog.FAILED)
+
+    def test_requeue_interrupted(self):
+        outbox.enqueue_sms([self.apprenants["ok"]])
+        claimed = outbox.claim_batch(10)
+        self.assertEqual([log.status for log in claimed], [SmsLog.SENDING])
+        # Dispatcher arrete en plein lot : le message reserve est remis en file au redemarrage.
+        self.assertEqual(outbox.requeue_interrupted(), 1)
+        self.assertEqual(outbox.dispatch_pending()[SmsLog.SENT], 1)
@@ -3,9 +3,14 @@ from django.views.generic import TemplateView
 
 from App_PADESCE.apprenants.views import (
     api_codes,
+    api_codes_filter,
     delete_apprenants,
     import_csv,
+    import_session_commit,
+    import_session_create,
+    import_session_detail,
     send_sms,
+    sms_job_status,
     update_appartenance,
     update_appartenance_bulk,
 )
@@ -13,9 +18,18 @@ from App_PADESCE.apprenants.views import (
 urlpatterns = [
     path("", TemplateView.as_view(template_name="apprenants/index.html"), name="apprenants_index"),
     path("import/<int:classe_id>/", import_csv, name="apprenants_import"),
+    path("import/<int:classe_id>/session/", import_session_create, name="apprenants_import_session"),
+    path("import/session/<int:session_id>/", import_session_detail, name="apprenants_import_session_detail"),
+    path(
+        "import/session/<int:session_id>/commit/",
+        import_session_commit,
+        name="apprenants_import_session_commit",
+    ),
     path("api/codes/", api_codes, name="apprenants_api_codes"),
+    path("api/codes/filter/", api_codes_filter, name="apprenants_api_codes_filter"),
     path("api/appartenance/<int:apprenant_id>/", update_appartenance, name="apprenant_appartenance"),
     path("api/appartenance/bulk/", update_appartenance_bulk, name="apprenant_appartenance_bulk"),
     path("api/delete/", delete_apprenants, name="apprenants_delete"),
     path("api/sms/", send_sms, name="apprenants_sms"),
+    path("api/sms/<int:job_id>/", sms_job_status, name="apprenants_sms_status"),
 ]
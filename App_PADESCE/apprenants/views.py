@@ -1,30 +1,43 @@
 import csv
+import hashlib
 import io
 import json
 import logging
 import os
-import re
-import random
-import string
-import unicodedata
-import urllib.parse
-import urllib.request
-from typing import List, Tuple
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
 
 from django.contrib import messages
 from django.db import IntegrityError, transaction
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
-from django.views.decorators.http import require_POST
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET, require_http_methods, require_POST
 from django.conf import settings
 from openpyxl import load_workbook
+import pandas as pd
 
 from App_PADESCE.apprenants.forms import ImportApprenantsForm
-from App_PADESCE.apprenants.models import Apprenant, SmsLog
+from App_PADESCE.apprenants.models import Apprenant, ImportRow, ImportSession, SmsJob, SmsLog
+from App_PADESCE.apprenants.outbox import enqueue_sms
+from App_PADESCE.core import sequences
+from App_PADESCE.core.bloom import BloomFilter
+from App_PADESCE.core.importing import HeaderIndex, normalize_header
+from App_PADESCE.core.normalization import clean_cell, clean_text, split_phones, to_int
 from App_PADESCE.formations.models import Classe
+from App_PADESCE.reporting.cache import cached_payload, invalidate_reporting, request_versions
 
 logger = logging.getLogger(__name__)
 
+# Verification par lot des codes / telephones (api_codes) et instantane en filtre de Bloom.
+CHECK_CHUNK_SIZE = 500
+CHECK_MAX_VALUES = 5000
+FILTER_ERROR_RATE = 0.01
+# Conflits avec la base detailles (ligne, valeur) dans un message d'erreur.
+CONFLICTS_SHOWN = 20
+
 COLUMN_DEFS: List[Tuple[str, str]] = [
     ("numero", "N° / No"),
     ("nom_complet", "Nom complet"),
@@ -59,46 +72,13 @@ HEADER_ALIASES = {
     # normalized dynamically later to stay in sync with COLUMN_DEFS
 }
 
-def generate_code(existing: set[str]) -> str:
-    """Generate a 4-char alphanumeric uppercase code, unique against existing."""
-    charset = string.ascii_uppercase + string.digits
-    for _ in range(1000):
-        code = "".join(random.choices(charset, k=4))
-        if code not in existing:
-            return code
-    raise ValueError("Impossible de generer un code unique")
-
-
-def _normalize_cell(value) -> str:
-    if value is None:
-        return ""
-    if isinstance(value, (int, float)):
-        if isinstance(value, float) and value.is_integer():
-            return str(int(value))
-        if isinstance(value, int):
-            return str(value)
-    return str(value).strip()
-
-
-def _to_int(value, default=0):
-    try:
-        return int(value)
-    except (TypeError, ValueError):
-        return default
-
-
-def _normalize_header_name(value: str) -> str:
-    if not value:
-        return ""
-    normalized = unicodedata.normalize("NFKD", str(value))
-    ascii_only = "".join(ch for ch in normalized if not unicodedata.combining(ch))
-    ascii_only = ascii_only.lower().replace("&", "and")
-    ascii_only = re.sub(r"[^a-z0-9]+", " ", ascii_only)
-    return " ".join(ascii_only.split())
+def allocate_codes(count: int, exclude=()) -> List[str]:
+    """`count` codes apprenants neufs (4 caracteres) depuis le compteur partage (core/sequences.py)."""
+    return sequences.allocate(Apprenant, sequences.APPRENANT_SEQUENCE, count, sequences.apprenant_code, exclude=exclude)
 
 
 def _build_header_aliases() -> dict:
-    aliases = {_normalize_header_name(label): key for key, label in COLUMN_DEFS}
+    aliases = {normalize_header(label): key for key, label in COLUMN_DEFS}
     aliases.update(
         {
             "nom": "nom_complet",
@@ -143,6 +123,7 @@ def _build_header_aliases() -> dict:
 
 
 HEADER_ALIASES.update(_build_header_aliases())
+APPRENANT_INDEX = HeaderIndex.from_mapping(HEADER_ALIASES)
 IMPORT_FIELDS = [field for field, _ in COLUMN_DEFS]
 
 
@@ -162,7 +143,7 @@ def _read_xlsx_rows(file_obj) -> List[List[str]]:
     ws = wb.active
     rows: List[List[str]] = []
     for row in ws.iter_rows(values_only=True):
-        rows.append([_normalize_cell(cell) for cell in row])
+        rows.append([clean_cell(cell) for cell in row])
     return rows
 
 
@@ -174,69 +155,48 @@ def _is_header_row(row: List[str]) -> bool:
 
 
 def _build_header_mapping(header_row: List[str]) -> List[Tuple[int, str, str]]:
-    mapping: List[Tuple[int, str, str]] = []
-    seen = set()
-    for idx, raw in enumerate(header_row):
-        normalized = _normalize_header_name(raw)
-        key = HEADER_ALIASES.get(normalized)
-        if not key or key in seen:
-            continue
-        label = raw.strip() or dict(COLUMN_DEFS).get(key, key)
-        mapping.append((idx, key, label))
-        seen.add(key)
-    return mapping
-
-
-def _clean_phones(tel1: str, tel2: str) -> tuple[str, str]:
-    tel1_clean = (tel1 or "").strip()
-    tel2_clean = (tel2 or "").strip()
-    if "/" in tel1_clean:
-        parts = [p.strip() for p in tel1_clean.split("/") if p.strip()]
-        if parts:
-            tel1_clean = parts[0]
-            if len(parts) > 1 and not tel2_clean:
-                tel2_clean = parts[1]
-    return tel1_clean, tel2_clean
+    columns = APPRENANT_INDEX.resolve(header_row)
+    labels = dict(COLUMN_DEFS)
+    return [(idx, key, (header_row[idx] or "").strip() or labels.get(key, key)) for idx, key in columns.ordered()]
+
+
+def _normalize_rows(rows: List[dict]) -> List[dict]:
+    """Nettoyage colonne par colonne (core/normalization.py) des lignes extraites."""
+    if not rows:
+        return []
+    frame = pd.DataFrame(rows, columns=IMPORT_FIELDS, dtype=object)
+    for field in IMPORT_FIELDS:
+        frame[field] = clean_text(frame[field])
+    tel1, tel2 = split_phones(frame["telephone1"], frame["telephone2"])
+    frame["telephone1"] = tel1.where(tel1 != "", None)
+    frame["telephone2"] = tel2.where(tel2 != "", None)
+    frame["age"] = to_int(frame["age"], strict=True)
+    experience = to_int(frame["nb_annees_experience"], strict=True)
+    frame["nb_annees_experience"] = experience.where(experience.notna(), 0)
+    return frame.to_dict("records")
 
 
 def _rows_from_payload(payload: list) -> List[dict]:
-    rows: List[dict] = []
-    for item in payload:
-        if not isinstance(item, dict):
-            continue
-        base = {field: _normalize_cell(item.get(field)) for field in IMPORT_FIELDS}
-        tel1, tel2 = _clean_phones(base.get("telephone1"), base.get("telephone2"))
-        base["telephone1"] = tel1 or None
-        base["telephone2"] = tel2 or None
-        base["age"] = _to_int(base.get("age"), None) if base.get("age") else None
-        base["nb_annees_experience"] = _to_int(base.get("nb_annees_experience") or 0, 0)
-        rows.append(base)
-    return rows
+    return _normalize_rows([item for item in payload if isinstance(item, dict)])
 
 
 def _rows_from_table(rows: List[List[str]], header_map: List[Tuple[int, str, str]]) -> List[dict]:
-    preview_rows: List[dict] = []
+    extracted: List[dict] = []
     if not header_map:
         header_map = [
             (idx, key, label) for idx, (key, label) in enumerate(COLUMN_DEFS) if idx < len(rows[0] if rows else [])
         ]
     for row in rows:
-        normalized_cells = [_normalize_cell(cell) for cell in row]
-        if not normalized_cells or all(not cell for cell in normalized_cells):
+        if not row or all(not cell for cell in row):
             continue
-        if _is_header_row(normalized_cells):
+        if _is_header_row(row):
             continue
         base = {field: "" for field in IMPORT_FIELDS}
         for idx, key, _label in header_map:
-            if idx < len(normalized_cells):
-                base[key] = normalized_cells[idx]
-        tel1, tel2 = _clean_phones(base.get("telephone1"), base.get("telephone2"))
-        base["telephone1"] = tel1 or None
-        base["telephone2"] = tel2 or None
-        base["age"] = _to_int(base.get("age"), None) if base.get("age") else None
-        base["nb_annees_experience"] = _to_int(base.get("nb_annees_experience") or 0, 0)
-        preview_rows.append(base)
-    return preview_rows
+            if idx < len(row):
+                base[key] = row[idx]
+        extracted.append(base)
+    return _normalize_rows(extracted)
 
 
 def _header_map_to_defs(header_map: List[Tuple[int, str, str]]) -> List[dict]:
@@ -245,7 +205,26 @@ def _header_map_to_defs(header_map: List[Tuple[int, str, str]]) -> List[dict]:
     return [{"field": key, "label": label} for _, key, label in header_map]
 
 
-def _validate_preview(preview_rows: List[dict], formation, generate_codes: bool, errors: List[str]) -> None:
+def _conflict_lines(preview_rows: List[dict], field: str, taken: set) -> List[Tuple[int, str]]:
+    """(ligne de l'apercu, valeur) des lignes dont `field` est deja en base."""
+    return [(idx, row[field]) for idx, row in enumerate(preview_rows, start=1) if row.get(field) in taken]
+
+
+def _conflict_message(label: str, conflicts: List[Tuple[int, str]]) -> str:
+    shown = ", ".join(f"ligne {line} ({value})" for line, value in conflicts[:CONFLICTS_SHOWN])
+    if len(conflicts) > CONFLICTS_SHOWN:
+        shown += f", ... ({len(conflicts)} lignes au total)"
+    return f"{label}: {shown}"
+
+
+def _validate_preview(
+    preview_rows: List[dict], formation, generate_codes: bool, errors: List[str]
+) -> List[Tuple[int, str, str]]:
+    """
+    Controle l'apercu (doublons internes, formats) et ses conflits avec la base. Seules les
+    valeurs du fichier sont cherchees (`__in` par paquets) : le cout suit la taille du
+    fichier, pas celle de la base. Renvoie les conflits (ligne, champ, valeur).
+    """
     noms = [r["nom_complet"] for r in preview_rows if r.get("nom_complet")]
     tels = [r["telephone1"] for r in preview_rows if r.get("telephone1")]
     numeros = [r["numero"] for r in preview_rows if r.get("numero")]
@@ -280,32 +259,77 @@ def _validate_preview(preview_rows: List[dict], formation, generate_codes: bool,
             msg += f", {missing_tel_count} valeurs manquantes"
         errors.append(msg)
 
-    existing_tels = set(
-        Apprenant.objects.filter(formation=formation).values_list("telephone1", flat=True)
-    )
-    duplicate_existing = existing_tels.intersection(set(tels))
-    if duplicate_existing:
-        errors.append(
-            "Telephones deja utilises pour cette formation: "
-            + ", ".join(sorted(duplicate_existing))
-        )
+    conflicts: List[Tuple[int, str, str]] = []
+    taken_tels = _existing_values(Apprenant.objects.filter(formation=formation), "telephone1", tels)
+    if taken_tels:
+        lines = _conflict_lines(preview_rows, "telephone1", taken_tels)
+        conflicts.extend((line, "telephone1", value) for line, value in lines)
+        errors.append(_conflict_message("Telephones deja utilises pour cette formation", lines))
 
     if not generate_codes:
         codes = [r["_code"] for r in preview_rows if r["_code"]]
         if len(codes) != len(set(codes)):
             errors.append("Codes en double detectes dans le fichier.")
-        existing_codes = set(Apprenant.objects.values_list("code", flat=True))
-        duplicate_codes = existing_codes.intersection(set(codes))
-        if duplicate_codes:
-            errors.append("Codes deja utilises: " + ", ".join(sorted(duplicate_codes)))
+        taken_codes = _existing_values(Apprenant.objects.all(), "code", codes)
+        if taken_codes:
+            lines = _conflict_lines(preview_rows, "_code", taken_codes)
+            conflicts.extend((line, "_code", value) for line, value in lines)
+            errors.append(_conflict_message("Codes deja utilises", lines))
+    return conflicts
+
+
+def _parse_import_file(fichier) -> Tuple[List[dict], List[dict], List[str]]:
+    """Lignes normalisees, colonnes reconnues et erreurs de lecture d'un fichier CSV/XLSX."""
+    errors: List[str] = []
+    ext = os.path.splitext(getattr(fichier, "name", ""))[1].lower()
+    try:
+        if ext in {".xlsx", ".xlsm"}:
+            rows = _read_xlsx_rows(fichier)
+        else:
+            data = fichier.read().decode("utf-8-sig")
+            rows = _read_csv_rows(data)
+    except UnicodeDecodeError:
+        errors.append("Le fichier doit etre encode en UTF-8.")
+        rows = []
+    if not rows:
+        return [], _default_column_defs(), errors
+    header_row = rows[0]
+    header_map = _build_header_mapping(header_row)
+    if not header_map:
+        header_map = [
+            (idx, key, label)
+            for idx, (key, label) in enumerate(COLUMN_DEFS)
+            if idx < len(header_row)
+        ]
+    return _rows_from_table(rows[1:], header_map), _header_map_to_defs(header_map), errors
+
+
+def _create_apprenants(classe, preview_rows: List[dict], generate_codes: bool) -> int:
+    """Cree les apprenants du lot (codes manquants reserves en un bloc) ; a appeler dans une transaction."""
+    file_codes = set() if generate_codes else {row["_code"] for row in preview_rows if row.get("_code")}
+    missing = sum(1 for row in preview_rows if generate_codes or not row.get("_code"))
+    fresh_codes = iter(allocate_codes(missing, exclude=file_codes))
+    new_objects = []
+    for row in preview_rows:
+        if generate_codes or not row.get("_code"):
+            code = next(fresh_codes)
+        else:
+            code = row["_code"]
+        new_objects.append(
+            Apprenant(
+                code=code,
+                classe=classe,
+                formation=classe.formation,
+                **{k: v for k, v in row.items() if k != "_code"},
+            )
+        )
+    Apprenant.objects.bulk_create(new_objects, batch_size=CHECK_CHUNK_SIZE)
+    return len(new_objects)
 
 
 def import_csv(request, classe_id: int):
     classe = get_object_or_404(Classe.objects.select_related("formation"), pk=classe_id)
     formation = classe.formation
-    existing_tels = list(
-        Apprenant.objects.filter(formation=formation).values_list("telephone1", flat=True)
-    )
     form = ImportApprenantsForm(request.POST or None, request.FILES or None)
     preview_rows: List[dict] = []
     errors: List[str] = []
@@ -315,9 +339,6 @@ def import_csv(request, classe_id: int):
         fichier = form.cleaned_data["fichier"]
         generate_codes = form.cleaned_data.get("generate_codes", False)
         edited_rows = form.cleaned_data.get("edited_rows") or ""
-        ext = os.path.splitext(getattr(fichier, "name", ""))[1].lower()
-        rows: List[List[str]] = []
-        header_map: List[Tuple[int, str, str]] = []
         if edited_rows:
             try:
                 payload = json.loads(edited_rows)
@@ -325,28 +346,7 @@ def import_csv(request, classe_id: int):
             except json.JSONDecodeError:
                 errors.append("Impossible de lire les lignes modifiees.")
         if not preview_rows and not errors:
-            try:
-                if ext in {".xlsx", ".xlsm"}:
-                    rows = _read_xlsx_rows(fichier)
-                else:
-                    data = fichier.read().decode("utf-8-sig")
-                    rows = _read_csv_rows(data)
-            except UnicodeDecodeError:
-                errors.append("Le fichier doit etre encode en UTF-8.")
-                rows = []
-
-        if rows:
-            header_row = rows[0] if rows else []
-            data_rows = rows[1:] if rows else []
-            header_map = _build_header_mapping(header_row)
-            if not header_map:
-                header_map = [
-                    (idx, key, label)
-                    for idx, (key, label) in enumerate(COLUMN_DEFS)
-                    if idx < len(header_row)
-                ]
-            column_defs = _header_map_to_defs(header_map)
-            preview_rows = _rows_from_table(data_rows, header_map)
+            preview_rows, column_defs, errors = _parse_import_file(fichier)
 
         if preview_rows and not errors:
             _validate_preview(preview_rows, formation, generate_codes, errors)
@@ -354,24 +354,8 @@ def import_csv(request, classe_id: int):
         if not errors and preview_rows:
             try:
                 with transaction.atomic():
-                    existing_codes = set(Apprenant.objects.values_list("code", flat=True))
-                    new_objects = []
-                    for row in preview_rows:
-                        if generate_codes or not row.get("_code"):
-                            code = generate_code(existing_codes)
-                            existing_codes.add(code)
-                        else:
-                            code = row["_code"]
-                            existing_codes.add(code)
-                        new_objects.append(
-                            Apprenant(
-                                code=code,
-                                classe=classe,
-                                formation=formation,
-                                **{k: v for k, v in row.items() if k != "_code"},
-                            )
-                        )
-                    Apprenant.objects.bulk_create(new_objects, ignore_conflicts=False)
+                    _create_apprenants(classe, preview_rows, generate_codes)
+                invalidate_reporting(Apprenant)
                 messages.success(request, f"{len(preview_rows)} apprenants importes pour {classe.code}.")
             except IntegrityError:
                 errors.append(
@@ -387,18 +371,376 @@ def import_csv(request, classe_id: int):
             "classe": classe,
             "preview_rows": preview_rows,
             "errors": errors,
-            "existing_tels": existing_tels,
             "column_defs": column_defs,
-            "header_aliases": HEADER_ALIASES,
         },
     )
 
 
+# Import en session : lignes lues, corrigees et validees cote serveur, puis enregistrees en
+# une fois. Une correction n'envoie que les cellules modifiees ; seules ces lignes et celles
+# qui partagent avec elles une valeur controlee (avant ou apres correction) sont revalidees.
+# Champ de ligne -> colonne indexee d'ImportRow pour les controles de doublons.
+SESSION_KEYS = {"nom_complet": "nom_complet", "telephone1": "telephone1", "numero": "numero", "_code": "code"}
+DUPLICATE_LABELS = {"nom_complet": "Nom", "telephone1": "Telephone", "numero": "Numero", "_code": "Code"}
+SESSION_MAX_CELLS = 2000
+
+
+def _row_keys(data: dict) -> dict:
+    return {column: str(data.get(field) or "") for field, column in SESSION_KEYS.items()}
+
+
+def _duplicate_fields(session: ImportSession) -> List[str]:
+    return [field for field in SESSION_KEYS if not (field == "_code" and session.generate_codes)]
+
+
+def _format_errors(data: dict) -> List[dict]:
+    """
+    Memes regles que `_validate_preview`, ligne par ligne, plus le nom obligatoire : deux
+    noms vides heurteraient l'unicite par classe a l'enregistrement.
+    """
+    errors = []
+    if not data.get("nom_complet"):
+        errors.append({"field": "nom_complet", "kind": "format", "message": "Nom manquant"})
+    if data.get("age") is None:
+        errors.append({"field": "age", "kind": "format", "message": "Age manquant"})
+    tel = data.get("telephone1")
+    if not tel:
+        errors.append({"field": "telephone1", "kind": "format", "message": "Telephone apprenant 1 manquant"})
+    elif not (tel.isdigit() and len(tel) == 9):
+        errors.append(
+            {"field": "telephone1", "kind": "format", "message": "Telephone apprenant 1 invalide (9 chiffres attendus)"}
+        )
+    return errors
+
+
+def _line_groups(session: ImportSession, column: str, values) -> Dict[str, List[int]]:
+    """Valeur -> lignes de la session qui la portent, pour les seules `values`."""
+    values = sorted({value for value in values if value})
+    groups: Dict[str, List[int]] = {}
+    for offset in range(0, len(values), CHECK_CHUNK_SIZE):
+        chunk = values[offset : offset + CHECK_CHUNK_SIZE]
+        for value, line in session.rows.filter(**{f"{column}__in": chunk}).values_list(column, "line"):
+            groups.setdefault(value, []).append(line)
+    return groups
+
+
+def _revalidate(session: ImportSession, rows: List[ImportRow], touched, groups=None) -> None:
+    """
+    Recalcule les erreurs de `rows`. Les lignes `touched` (numeros) sont entierement
+    revalidees, base comprise ; pour les autres, seuls les doublons internes changent.
+    `groups` (champ -> valeur -> lignes) evite la requete quand le lot est deja en memoire.
+    """
+    fields = _duplicate_fields(session)
+    if groups is None:
+        groups = {
+            field: _line_groups(session, SESSION_KEYS[field], {row.data.get(field) for row in rows})
+            for field in fields
+        }
+    fresh = [row for row in rows if row.line in touched]
+    taken = {
+        "telephone1": _existing_values(
+            Apprenant.objects.filter(formation_id=session.classe.formation_id),
+            "telephone1",
+            [row.data["telephone1"] for row in fresh if row.data.get("telephone1")],
+        ),
+        "_code": set(),
+    }
+    if not session.generate_codes:
+        taken["_code"] = _existing_values(
+            Apprenant.objects.all(), "code", [row.data["_code"] for row in fresh if row.data.get("_code")]
+        )
+    for row in rows:
+        if row.line in touched:
+            errors = _format_errors(row.data)
+            if row.data.get("telephone1") in taken["telephone1"]:
+                errors.append({"field": "telephone1", "kind": "base", "message": "Telephone deja utilise pour cette formation"})
+            if row.data.get("_code") in taken["_code"]:
+                errors.append({"field": "_code", "kind": "base", "message": "Code deja utilise"})
+        else:
+            errors = [error for error in row.errors if error["kind"] != "doublon"]
+        for field in fields:
+            lines = groups[field].get(row.data.get(field) or "", [])
+            if len(lines) > 1:
+                listed = ", ".join(str(line) for line in sorted(lines)[:CONFLICTS_SHOWN])
+                errors.append(
+                    {"field": field, "kind": "doublon", "message": f"{DUPLICATE_LABELS[field]} en double (lignes {listed})"}
+                )
+        row.errors = errors
+        row.valid = not errors
+
+
+def _memory_groups(session: ImportSession, rows: List[ImportRow]) -> dict:
+    groups = {}
+    for field in _duplicate_fields(session):
+        lines: Dict[str, List[int]] = {}
+        for row in rows:
+            value = row.data.get(field)
+            if value:
+                lines.setdefault(str(value), []).append(row.line)
+        groups[field] = lines
+    return groups
+
+
+def _session_row(row: ImportRow) -> dict:
+    return {"line": row.line, "data": row.data, "errors": row.errors}
+
+
+def _session_payload(session: ImportSession, rows=None) -> dict:
+    payload = {
+        "ok": True,
+        "session": session.pk,
+        "status": session.status,
+        "generate_codes": session.generate_codes,
+        "invalid": session.rows.filter(valid=False).count(),
+        "total": session.rows.count(),
+    }
+    if rows is not None:
+        payload["rows"] = [_session_row(row) for row in rows]
+    return payload
+
+
+def _purge_import_sessions() -> None:
+    limit = timezone.now() - timedelta(seconds=settings.APPRENANT_IMPORT_SESSION_TTL)
+    ImportSession.objects.filter(updated_at__lt=limit).delete()
+
+
+@require_POST
+def import_session_create(request, classe_id: int):
+    """Lit le fichier, conserve ses lignes en session et renvoie leur etat de validation."""
+    classe = get_object_or_404(Classe.objects.select_related("formation"), pk=classe_id)
+    form = ImportApprenantsForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({"ok": False, "error": "Fichier manquant ou invalide."}, status=400)
+    fichier = form.cleaned_data["fichier"]
+    preview_rows, column_defs, errors = _parse_import_file(fichier)
+    if errors or not preview_rows:
+        return JsonResponse({"ok": False, "error": errors[0] if errors else "Aucune ligne lue dans le fichier."}, status=400)
+
+    _purge_import_sessions()
+    with transaction.atomic():
+        session = ImportSession.objects.create(
+            classe=classe,
+            file_name=getattr(fichier, "name", "")[:255],
+            generate_codes=form.cleaned_data.get("generate_codes", False),
+            column_defs=column_defs,
+            created_by=request.user if request.user.is_authenticated else None,
+        )
+        rows = [
+            ImportRow(session=session, line=line, data=data, **_row_keys(data))
+            for line, data in enumerate(preview_rows, start=1)
+        ]
+        _revalidate(session, rows, {row.line for row in rows}, groups=_memory_groups(session, rows))
+        ImportRow.objects.bulk_create(rows, batch_size=CHECK_CHUNK_SIZE)
+    payload = _session_payload(session, rows)
+    payload["column_defs"] = column_defs
+    return JsonResponse(payload)
+
+
+def _apply_cells(session: ImportSession, cells) -> Tuple[List[ImportRow], List[ImportRow]]:
+    """Applique les cellules corrigees ; renvoie les lignes touchees et les lignes revalidees."""
+    edits: Dict[int, Dict[str, Any]] = {}
+    for cell in cells:
+        if not isinstance(cell, dict) or cell.get("field") not in IMPORT_FIELDS:
+            raise ValueError("Cellule invalide.")
+        try:
+            line = int(cell.get("line"))
+        except (TypeError, ValueError):
+            raise ValueError("Numero de ligne invalide.")
+        edits.setdefault(line, {})[cell["field"]] = cell.get("value")
+    touched = list(session.rows.filter(line__in=list(edits)))
+    if len(touched) != len(edits):
+        raise ValueError("Ligne inconnue dans cet import.")
+
+    involved: Dict[str, set] = {field: set() for field in SESSION_KEYS}
+    for row in touched:
+        for field in SESSION_KEYS:
+            involved[field].add(str(row.data.get(field) or ""))
+        row.data.update(edits[row.line])
+    for row, data in zip(touched, _normalize_rows([row.data for row in touched])):
+        row.data = data
+        for column, value in _row_keys(data).items():
+            setattr(row, column, value)
+        for field in SESSION_KEYS:
+            involved[field].add(str(data.get(field) or ""))
+
+    # Lignes qui partageaient ou partagent desormais une valeur controlee avec une ligne corrigee.
+    affected = {row.line: row for row in touched}
+    for field in _duplicate_fields(session):
+        for lines in _line_groups(session, SESSION_KEYS[field], involved[field]).values():
+            affected.update({line: None for line in lines if line not in affected})
+    others = [line for line, row in affected.items() if row is None]
+    neighbours = list(session.rows.filter(line__in=others)) if others else []
+    return touched, neighbours
+
+
+@require_http_methods(["GET", "PATCH"])
+def import_session_detail(request, session_id: int):
+    """
+    GET : etat complet de la session. PATCH : {"cells": [{"line", "field", "value"}],
+    "generate_codes": bool, "revalidate": bool} ; renvoie les seules lignes revalidees.
+    """
+    session = get_object_or_404(ImportSession.objects.select_related("classe"), pk=session_id)
+    if request.method == "GET":
+        payload = _session_payload(session, session.rows.all())
+        payload["column_defs"] = session.column_defs
+        return JsonResponse(payload)
+    if session.status != ImportSession.OPEN:
+        return JsonResponse({"ok": False, "error": "Import deja enregistre."}, status=409)
+
+    payload = _parse_json_payload(request)
+    cells = payload.get("cells") or []
+    if not isinstance(cells, list) or len(cells) > SESSION_MAX_CELLS:
+        return JsonResponse({"ok": False, "error": f"{SESSION_MAX_CELLS} cellules au plus par correction."}, status=400)
+    with transaction.atomic():
+        generate_codes = payload.get("generate_codes")
+        full = bool(payload.get("revalidate"))
+        if isinstance(generate_codes, bool) and generate_codes != session.generate_codes:
+            session.generate_codes = generate_codes
+            full = True
+        try:
+            touched, neighbours = _apply_cells(session, cells)
+        except ValueError as exc:
+            return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+        if touched:
+            ImportRow.objects.bulk_update(touched, ["data", *SESSION_KEYS.values()], batch_size=CHECK_CHUNK_SIZE)
+        if full:
+            # Changement de regle (codes generes) ou controle complet demande : tout le lot.
+            edited = {row.line: row for row in touched}
+            rows = [edited.get(row.line, row) for row in session.rows.all()]
+            _revalidate(session, rows, {row.line for row in rows}, groups=_memory_groups(session, rows))
+        else:
+            rows = touched + neighbours
+            _revalidate(session, rows, {row.line for row in touched})
+        ImportRow.objects.bulk_update(rows, ["errors", "valid"], batch_size=CHECK_CHUNK_SIZE)
+        session.save(update_fields=["generate_codes", "updated_at"])
+    return JsonResponse(_session_payload(session, sorted(rows, key=lambda row: row.line)))
+
+
+@require_POST
+def import_session_commit(request, session_id: int):
+    """Enregistre en une fois les lignes d'une session sans erreur."""
+    try:
+        with transaction.atomic():
+            session = get_object_or_404(
+                ImportSession.objects.select_for_update().select_related("classe__formation"), pk=session_id
+            )
+            if session.status != ImportSession.OPEN:
+                return JsonResponse({"ok": False, "error": "Import deja enregistre."}, status=409)
+            invalid = session.rows.filter(valid=False).count()
+            if invalid:
+                return JsonResponse(
+                    {"ok": False, "error": f"{invalid} ligne(s) a corriger avant l'import.", "invalid": invalid},
+                    status=400,
+                )
+            created = _create_apprenants(
+                session.classe, list(session.rows.values_list("data", flat=True)), session.generate_codes
+            )
+            session.status = ImportSession.COMMITTED
+            session.save(update_fields=["status", "updated_at"])
+            session.rows.all().delete()
+    except IntegrityError:
+        return JsonResponse(
+            {"ok": False, "error": "Telephones ou codes enregistres entre-temps : relancez la verification."},
+            status=409,
+        )
+    invalidate_reporting(Apprenant)
+    messages.success(request, f"{created} apprenants importes pour {session.classe.code}.")
+    return JsonResponse({"ok": True, "created": created, "redirect": reverse("class_detail", args=[session.classe_id])})
+
 
+def _existing_values(queryset, field: str, values) -> set:
+    """Valeurs de `values` deja presentes dans `queryset` (recherches `__in` indexees par paquets)."""
+    values = sorted(set(values))
+    found = set()
+    for offset in range(0, len(values), CHECK_CHUNK_SIZE):
+        chunk = values[offset : offset + CHECK_CHUNK_SIZE]
+        found.update(queryset.filter(**{f"{field}__in": chunk}).values_list(field, flat=True))
+    return found
+
+
+def _check_values(value) -> List[str]:
+    if not isinstance(value, (list, tuple)):
+        return []
+    return [text for text in (clean_cell(item) for item in value) if text]
+
+
+@require_POST
 def api_codes(request):
-    """Expose the list of existing apprenant codes for front-end checks."""
-    codes = list(Apprenant.objects.values_list("code", flat=True))
-    return JsonResponse({"codes": codes})
+    """
+    Verification par lot : {"codes": [...], "telephones": [...], "formation_id": id}
+    -> codes et telephones deja en base. Les telephones sont uniques par formation :
+    sans `formation_id`, ils sont cherches dans toutes les formations.
+    """
+    payload = _parse_json_payload(request)
+    codes = _check_values(payload.get("codes"))
+    telephones = _check_values(payload.get("telephones"))
+    if len(codes) + len(telephones) > CHECK_MAX_VALUES:
+        return JsonResponse(
+            {"ok": False, "error": f"Lot trop grand (maximum {CHECK_MAX_VALUES} valeurs)."}, status=400
+        )
+    phones = Apprenant.objects.all()
+    formation_id = str(payload.get("formation_id") or "")
+    if formation_id.isdigit():
+        phones = phones.filter(formation_id=int(formation_id))
+    return JsonResponse(
+        {
+            "ok": True,
+            "codes": sorted(_existing_values(Apprenant.objects.all(), "code", codes)),
+            "telephones": sorted(_existing_values(phones, "telephone1", telephones)),
+        }
+    )
+
+
+def _filter_formation(request):
+    value = request.GET.get("formation", "")
+    return int(value) if value.isdigit() else None
+
+
+def _filter_etag(request):
+    token = request_versions(request).token([Apprenant])
+    return hashlib.sha1(f"apprenants:filter:{token}:{request.GET.urlencode()}".encode()).hexdigest()
+
+
+def _filter_last_modified(request):
+    return request_versions(request).last_modified([Apprenant])
+
+
+def _bloom(values: List[str]) -> dict:
+    bloom = BloomFilter.for_capacity(len(values), FILTER_ERROR_RATE)
+    bloom.update(values)
+    return {**bloom.as_dict(), "count": len(values)}
+
+
+@require_GET
+@condition(etag_func=_filter_etag, last_modified_func=_filter_last_modified)
+def api_codes_filter(request):
+    """
+    Instantane compact (filtre de Bloom, core/bloom.py) des codes apprenants et, avec
+    `?formation=<id>`, des telephones de la formation. Versionne sur la version des
+    donnees Apprenant : ETag, 304 tant que rien n'a change, payload en cache.
+    """
+    formation_id = _filter_formation(request)
+    versions = request_versions(request)
+
+    def compute():
+        payload = {
+            "version": versions.token([Apprenant]),
+            "codes": _bloom(list(Apprenant.objects.values_list("code", flat=True))),
+        }
+        if formation_id is not None:
+            telephones = (
+                Apprenant.objects.filter(formation_id=formation_id)
+                .exclude(telephone1__isnull=True)
+                .exclude(telephone1="")
+                .values_list("telephone1", flat=True)
+            )
+            payload["telephones"] = _bloom(list(telephones))
+        return payload
+
+    payload = cached_payload("filter", f"apprenants:{formation_id or ''}", [Apprenant], compute, versions)
+    response = JsonResponse(payload)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 def _parse_json_payload(request):
@@ -426,54 +768,6 @@ def _parse_ids(value) -> List[int]:
     return ids
 
 
-def _normalize_phone(value: str) -> str:
-    if not value:
-        return ""
-    digits = "".join(ch for ch in str(value) if ch.isdigit())
-    if len(digits) > 9:
-        if digits.startswith(settings.OBIT_COUNTRY) and len(digits) == len(settings.OBIT_COUNTRY) + 9:
-            digits = digits[len(settings.OBIT_COUNTRY):]
-        else:
-            digits = digits[-9:]
-    return digits if len(digits) == 9 else ""
-
-
-def _build_sms_message(apprenant: Apprenant) -> str:
-    return f"Bonjour Mr/Mlle, votre code PADESCE est: {apprenant.code}. "
-
-
-def _send_obit_sms(local_number: str, message: str) -> tuple[bool, str]:
-    if not settings.OBIT_API_KEY:
-        return False, "API key manquante"
-    params = {
-        "key_api": settings.OBIT_API_KEY,
-        "sender": settings.OBIT_SENDER,
-        "destination": f"{settings.OBIT_COUNTRY}{local_number}",
-        "message": message,
-    }
-    url = f"{settings.OBIT_API_URL}?{urllib.parse.urlencode(params)}"
-    try:
-        with urllib.request.urlopen(url, timeout=15) as resp:
-            body = resp.read().decode("utf-8", "ignore")
-            if getattr(resp, "status", 200) != 200:
-                return False, f"HTTP {resp.status}"
-    except Exception as exc:  # pragma: no cover - network errors
-        logger.exception("SMS request failed")
-        return False, f"Exception: {exc}"
-
-    try:
-        data = json.loads(body)
-        if isinstance(data, dict) and data.get("success") is True:
-            return True, "OK"
-    except json.JSONDecodeError:
-        pass
-    if '"success":true' in body.replace(" ", "").lower():
-        return True, "OK"
-    if "error" in body.lower():
-        return False, "Erreur API"
-    return False, "Reponse inconnue"
-
-
 @require_POST
 def update_appartenance(request, apprenant_id: int):
     apprenant = get_object_or_404(Apprenant, pk=apprenant_id)
@@ -505,6 +799,7 @@ def update_appartenance_bulk(request):
     if classe_id:
         qs = qs.filter(classe_id=classe_id)
     updated = qs.update(appartenance_beneficiaire=value_bool)
+    invalidate_reporting(Apprenant)
     return JsonResponse({"ok": True, "updated": updated, "value": value_bool})
 
 
@@ -524,53 +819,34 @@ def delete_apprenants(request):
 
 @require_POST
 def send_sms(request):
+    """Met les SMS en file (commande run_sms_outbox) et renvoie aussitot le numero d'envoi."""
     payload = _parse_json_payload(request)
     ids = _parse_ids(payload.get("ids")) if payload else _parse_ids(request.POST.getlist("ids"))
     if not ids:
         ids = _parse_ids(request.POST.get("ids"))
     classe_id = payload.get("classe_id") if payload else request.POST.get("classe_id")
     qs = Apprenant.objects.filter(id__in=ids)
+    classe = None
     if classe_id:
         qs = qs.filter(classe_id=classe_id)
+        classe = Classe.objects.filter(pk=classe_id).first()
+
+    job = enqueue_sms(qs, classe=classe, user=request.user)
+    progress = job.progress()
+    return JsonResponse(
+        {
+            "ok": True,
+            "job": job.pk,
+            "queued": progress[SmsLog.QUEUED],
+            "failed": progress[SmsLog.FAILED],
+            "results": progress["results"],
+            "status_url": reverse("apprenants_sms_status", args=[job.pk]),
+        },
+        status=202,
+    )
 
-    results = []
-    logs = []
-    sent = 0
-    failed = 0
-    for apprenant in qs:
-        phone = _normalize_phone(apprenant.telephone1 or "")
-        message = _build_sms_message(apprenant)
-        if not phone:
-            logs.append(
-                SmsLog(
-                    apprenant=apprenant,
-                    classe=apprenant.classe,
-                    telephone=apprenant.telephone1 or "",
-                    message=message,
-                    status="failed",
-                    detail="Numero invalide",
-                )
-            )
-            results.append({"id": apprenant.id, "ok": False, "detail": "Numero invalide"})
-            failed += 1
-            continue
-        ok, detail = _send_obit_sms(phone, message)
-        logs.append(
-            SmsLog(
-                apprenant=apprenant,
-                classe=apprenant.classe,
-                telephone=phone,
-                message=message,
-                status="sent" if ok else "failed",
-                detail=detail,
-            )
-        )
-        results.append({"id": apprenant.id, "ok": ok, "detail": detail})
-        if ok:
-            sent += 1
-        else:
-            failed += 1
-    if logs:
-        SmsLog.objects.bulk_create(logs)
 
-    return JsonResponse({"ok": True, "sent": sent, "failed": failed, "results": results})
+@require_GET
+def sms_job_status(request, job_id: int):
+    job = get_object_or_404(SmsJob, pk=job_id)
+    return JsonResponse(job.progress())
@@ -2,7 +2,6 @@ import csv
 import io
 import os
 import re
-import unicodedata
 import uuid
 from datetime import datetime
 
@@ -14,6 +13,8 @@ from django.http import JsonResponse
 from django.shortcuts import render
 
 from App_PADESCE.beneficiaires.models import BeneficiaireUpload
+from App_PADESCE.core.importing import HeaderIndex, normalize_header
+from App_PADESCE.core.normalization import digits_only, normalize_gender, to_float
 
 NUMERO_HEADERS = ["no", "numero", "num", "n", "numero ordre", "numero d ordre"]
 NOM_HEADERS = [
@@ -111,33 +112,36 @@ TEL_FORMATEUR_HEADERS = [
     "point focal",
     "contact formateur",
 ]
-APPRENANT_COLUMN_GROUPS = [
-    NUMERO_HEADERS,
-    NOM_HEADERS,
-    BENEFICIAIRE_HEADERS,
-    GENRE_HEADERS,
-    AGE_HEADERS,
-    FONCTION_HEADERS,
-    DIPLOME_HEADERS,
-    EXPERIENCE_HEADERS,
-    VILLE_RESIDENCE_HEADERS,
-    PRESTATAIRE_HEADERS,
-    FORMATION_SOL_HEADERS,
-    FORMATION_DISP_HEADERS,
-    FENETRE_HEADERS,
-    VILLE_FORMATION_HEADERS,
-    ARRONDISSEMENT_HEADERS,
-    DEPARTEMENT_HEADERS,
-    REGION_HEADERS,
-    LIEU_FORMATION_HEADERS,
-    PRECISION_LIEU_HEADERS,
-    GPS_LONG_HEADERS,
-    GPS_LAT_HEADERS,
-    TELEPHONE1_HEADERS,
-    TELEPHONE2_HEADERS,
-    COHORTE_HEADERS,
-    TEL_FORMATEUR_HEADERS,
-]
+# Champ -> en-tetes acceptes, par ordre de preference (voir core/importing.py).
+APPRENANT_COLUMNS = {
+    "numero": NUMERO_HEADERS,
+    "nom_complet": NOM_HEADERS,
+    "beneficiaire": BENEFICIAIRE_HEADERS,
+    "genre": GENRE_HEADERS,
+    "age": AGE_HEADERS,
+    "fonction": FONCTION_HEADERS,
+    "diplome": DIPLOME_HEADERS,
+    "experience": EXPERIENCE_HEADERS,
+    "ville_residence": VILLE_RESIDENCE_HEADERS,
+    "prestataire": PRESTATAIRE_HEADERS,
+    "formation_solicitee": FORMATION_SOL_HEADERS,
+    "formation_dispensee": FORMATION_DISP_HEADERS,
+    "fenetre": FENETRE_HEADERS,
+    "ville_formation": VILLE_FORMATION_HEADERS,
+    "arrondissement": ARRONDISSEMENT_HEADERS,
+    "departement": DEPARTEMENT_HEADERS,
+    "region": REGION_HEADERS,
+    "lieu_formation": LIEU_FORMATION_HEADERS,
+    "precision_lieu": PRECISION_LIEU_HEADERS,
+    "gps_longitude": GPS_LONG_HEADERS,
+    "gps_latitude": GPS_LAT_HEADERS,
+    "telephone1": TELEPHONE1_HEADERS,
+    "telephone2": TELEPHONE2_HEADERS,
+    "cohorte": COHORTE_HEADERS,
+    "telephone_formateur": TEL_FORMATEUR_HEADERS,
+}
+# Fichiers heterogenes : inclusion toleree ("Telephone apprenant 1 (obligatoire)").
+APPRENANT_INDEX = HeaderIndex(APPRENANT_COLUMNS, partial=True)
 EXPECTED_COLUMNS = {
     "numero": "No / Numero",
     "nom_complet": "Nom et prenom",
@@ -169,30 +173,6 @@ RECAP_GLOBAL_PATH = "beneficiaires/recaps/recap_beneficiaires.xlsx"
 HISTORY_PAGE_SIZE = 10
 
 
-def _normalize_header(value: str) -> str:
-    if value is None:
-        return ""
-    text = str(value).strip().lower()
-    text = unicodedata.normalize("NFKD", text)
-    text = "".join(ch for ch in text if not unicodedata.combining(ch))
-    text = re.sub(r"[^a-z0-9]+", " ", text).strip()
-    return text
-
-
-def _find_column(columns, candidates):
-    normalized = {_normalize_header(col): col for col in columns}
-    for candidate in candidates:
-        cand_norm = _normalize_header(candidate)
-        for col_norm, original in normalized.items():
-            if col_norm == cand_norm:
-                return original
-            if col_norm.replace(" ", "") == cand_norm.replace(" ", ""):
-                return original
-            if cand_norm and cand_norm in col_norm:
-                return original
-    return None
-
-
 def _normalize_value(value) -> str:
     if value is None:
         return ""
@@ -220,17 +200,17 @@ def _is_missing(series: pd.Series) -> pd.Series:
 
 
 def _score_columns(columns) -> int:
-    return sum(1 for candidates in APPRENANT_COLUMN_GROUPS if _find_column(columns, candidates))
+    return len(APPRENANT_INDEX.resolve(columns).positions)
 
 
 def _load_dataframe(uploaded_file):
     filename = (uploaded_file.name or "").lower()
     if filename.endswith((".xlsx", ".xls", ".xlsm")):
         excel = pd.ExcelFile(uploaded_file)
-        target_norm = _normalize_header("Liste des apprenants")
+        target_norm = normalize_header("Liste des apprenants")
         target_sheet = None
         for sheet in excel.sheet_names:
-            if target_norm in _normalize_header(sheet):
+            if target_norm in normalize_header(sheet):
                 target_sheet = sheet
                 break
         if target_sheet:
@@ -270,31 +250,12 @@ def _safe_str(value) -> str:
     return str(value).strip()
 
 
-def _normalize_gender(value) -> str:
-    text = _normalize_value(value).upper()
-    text = re.sub(r"\s+", "", text)
-    if text in ("H", "HOMME"):
-        return "H"
-    if text in ("M", "MASCULIN"):
-        return "M"
-    if text in ("F", "FEMME", "FEMININ"):
-        return "F"
-    return text
-
-
 def _slugify(value: str) -> str:
-    text = _normalize_header(value)
+    text = normalize_header(value)
     text = re.sub(r"\s+", "_", text).strip("_")
     return text or "beneficiaire"
 
 
-def _to_float_series(series: pd.Series) -> pd.Series:
-    cleaned = series.where(~series.isna(), "").astype(str).str.strip()
-    cleaned = cleaned.str.replace(",", ".", regex=False)
-    cleaned = cleaned.replace("", pd.NA)
-    return pd.to_numeric(cleaned, errors="coerce")
-
-
 def _build_error_exports(error_rows, beneficiaire_nom: str) -> dict:
     if not error_rows:
         return {"csv": "", "txt": "", "xlsx": ""}
@@ -494,37 +455,12 @@ def _validate_dataframe(df):
     preview_rows = []
     error_rows = []
 
-    col_map = {
-        "numero": _find_column(df.columns, NUMERO_HEADERS),
-        "nom_complet": _find_column(df.columns, NOM_HEADERS),
-        "beneficiaire": _find_column(df.columns, BENEFICIAIRE_HEADERS),
-        "genre": _find_column(df.columns, GENRE_HEADERS),
-        "age": _find_column(df.columns, AGE_HEADERS),
-        "fonction": _find_column(df.columns, FONCTION_HEADERS),
-        "diplome": _find_column(df.columns, DIPLOME_HEADERS),
-        "experience": _find_column(df.columns, EXPERIENCE_HEADERS),
-        "ville_residence": _find_column(df.columns, VILLE_RESIDENCE_HEADERS),
-        "prestataire": _find_column(df.columns, PRESTATAIRE_HEADERS),
-        "formation_solicitee": _find_column(df.columns, FORMATION_SOL_HEADERS),
-        "formation_dispensee": _find_column(df.columns, FORMATION_DISP_HEADERS),
-        "fenetre": _find_column(df.columns, FENETRE_HEADERS),
-        "ville_formation": _find_column(df.columns, VILLE_FORMATION_HEADERS),
-        "arrondissement": _find_column(df.columns, ARRONDISSEMENT_HEADERS),
-        "departement": _find_column(df.columns, DEPARTEMENT_HEADERS),
-        "region": _find_column(df.columns, REGION_HEADERS),
-        "lieu_formation": _find_column(df.columns, LIEU_FORMATION_HEADERS),
-        "precision_lieu": _find_column(df.columns, PRECISION_LIEU_HEADERS),
-        "gps_longitude": _find_column(df.columns, GPS_LONG_HEADERS),
-        "gps_latitude": _find_column(df.columns, GPS_LAT_HEADERS),
-        "telephone1": _find_column(df.columns, TELEPHONE1_HEADERS),
-        "telephone2": _find_column(df.columns, TELEPHONE2_HEADERS),
-        "cohorte": _find_column(df.columns, COHORTE_HEADERS),
-        "telephone_formateur": _find_column(df.columns, TEL_FORMATEUR_HEADERS),
-    }
+    columns = APPRENANT_INDEX.resolve(df.columns)
+    col_map = {key: df.columns[idx] for key, idx in columns.positions.items()}
 
     missing = []
     for key, label in EXPECTED_COLUMNS.items():
-        if not col_map.get(key):
+        if key not in col_map:
             missing.append(label)
 
     if missing:
@@ -618,26 +554,26 @@ def _validate_dataframe(df):
     cohorte_missing = _is_missing(cohorte_series)
     telephone_formateur_missing = _is_missing(telephone_formateur_series)
 
-    numero_num = pd.to_numeric(numero_series, errors="coerce")
+    numero_num = to_float(numero_series)
     numero_invalid = ~numero_missing & (
         numero_num.isna() | (numero_num <= 0) | ((numero_num % 1) != 0)
     )
 
-    age_num = pd.to_numeric(age_series, errors="coerce")
+    age_num = to_float(age_series)
     age_invalid = ~age_missing & (age_num.isna() | (age_num <= 0) | ((age_num % 1) != 0))
 
-    experience_num = pd.to_numeric(experience_series, errors="coerce")
+    experience_num = to_float(experience_series)
     experience_invalid = ~experience_missing & (
         experience_num.isna() | (experience_num < 0) | ((experience_num % 1) != 0)
     )
 
-    diplome_num = pd.to_numeric(diplome_series, errors="coerce")
+    diplome_num = to_float(diplome_series)
     diplome_allowed = {-1, 0, 1, 2, 3, 4, 5}
     diplome_invalid = ~diplome_missing & (
         diplome_num.isna() | ~diplome_num.isin(diplome_allowed)
     )
 
-    genre_norm = genre_series.apply(_normalize_gender)
+    genre_norm = normalize_gender(genre_series)
     genre_invalid = ~genre_missing & ~genre_norm.isin({"H", "M", "F"})
     male_codes = set(genre_norm[genre_norm.isin({"H", "M"})].unique())
     genre_mixed = len(male_codes) > 1
@@ -647,29 +583,23 @@ def _validate_dataframe(df):
     fonction_allowed = {"D", "C", "E", "M", "B"}
     fonction_invalid = ~fonction_missing & ~fonction_norm.isin(fonction_allowed)
 
-    gps_longitude_num = _to_float_series(gps_longitude_series)
+    gps_longitude_num = to_float(gps_longitude_series)
     gps_longitude_invalid = ~gps_longitude_missing & (
         gps_longitude_num.isna() | (gps_longitude_num < -180) | (gps_longitude_num > 180)
     )
 
-    gps_latitude_num = _to_float_series(gps_latitude_series)
+    gps_latitude_num = to_float(gps_latitude_series)
     gps_latitude_invalid = ~gps_latitude_missing & (
         gps_latitude_num.isna() | (gps_latitude_num < -90) | (gps_latitude_num > 90)
     )
 
-    telephone1_digits = (
-        telephone1_series.fillna("").astype(str).str.replace(r"\D", "", regex=True)
-    )
+    telephone1_digits = digits_only(telephone1_series)
     telephone1_invalid = ~telephone1_missing & (telephone1_digits.str.len() != 9)
 
-    telephone2_digits = (
-        telephone2_series.fillna("").astype(str).str.replace(r"\D", "", regex=True)
-    )
+    telephone2_digits = digits_only(telephone2_series)
     telephone2_invalid = ~telephone2_missing & (telephone2_digits.str.len() != 9)
 
-    telephone_formateur_digits = (
-        telephone_formateur_series.fillna("").astype(str).str.replace(r"\D", "", regex=True)
-    )
+    telephone_formateur_digits = digits_only(telephone_formateur_series)
     telephone_formateur_invalid = ~telephone_formateur_missing & (
         telephone_formateur_digits.str.len() != 9
     )
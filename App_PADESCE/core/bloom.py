@@ -0,0 +1,70 @@
+"""
+Filtre de Bloom compact, reproductible cote navigateur.
+
+Sert aux pre-controles hors ligne des imports (codes et telephones deja en base) : le
+navigateur teste chaque valeur localement. Un "absent" est certain ; un "peut-etre
+present" est confirme par l'API de verification par lot.
+
+Schema (a reproduire a l'identique en JavaScript) :
+- octets UTF-8 de la valeur ;
+- h1 = FNV-1a 32 bits (base 0x811C9DC5), h2 = FNV-1a 32 bits (base 0x050C5D1F) | 1 ;
+- positions i = 0..k-1 : (h1 + i * h2) mod 2**32, puis mod m ;
+- bit j dans l'octet j >> 3, masque 1 << (j & 7) ; tableau transmis en base64.
+"""
+import base64
+import math
+from typing import Iterable
+
+_FNV_PRIME = 0x01000193
+_MASK = 0xFFFFFFFF
+SEED_1 = 0x811C9DC5
+SEED_2 = 0x050C5D1F
+HASH_SCHEME = "fnv1a32-double"
+
+
+def _fnv1a(data: bytes, seed: int) -> int:
+    value = seed
+    for byte in data:
+        value = ((value ^ byte) * _FNV_PRIME) & _MASK
+    return value
+
+
+class BloomFilter:
+    def __init__(self, bits: int, hashes: int):
+        self.bits = max(8, -(-bits // 8) * 8)
+        self.hashes = max(1, hashes)
+        self.array = bytearray(self.bits // 8)
+
+    @classmethod
+    def for_capacity(cls, count: int, error_rate: float = 0.01) -> "BloomFilter":
+        """Taille et nombre de hachages optimaux pour `count` valeurs au taux de faux positifs vise."""
+        count = max(count, 1)
+        bits = math.ceil(-count * math.log(error_rate) / (math.log(2) ** 2))
+        hashes = min(16, max(1, round(bits / count * math.log(2))))
+        return cls(bits, hashes)
+
+    def _positions(self, value: str) -> Iterable[int]:
+        data = value.encode("utf-8")
+        h1 = _fnv1a(data, SEED_1)
+        h2 = _fnv1a(data, SEED_2) | 1
+        for i in range(self.hashes):
+            yield ((h1 + i * h2) & _MASK) % self.bits
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.array[p >> 3] & (1 << (p & 7)) for p in self._positions(value))
+
+    def as_dict(self) -> dict:
+        return {
+            "hash": HASH_SCHEME,
+            "m": self.bits,
+            "k": self.hashes,
+            "bits": base64.b64encode(bytes(self.array)).decode("ascii"),
+        }
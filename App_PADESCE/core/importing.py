@@ -0,0 +1,187 @@
+"""
+Moteur commun des imports de tableurs.
+
+Chaque type d'import declare sa table d'alias (champ -> en-tetes acceptes, par ordre de
+preference). Elle est compilee une fois, au chargement du module, en un index d'en-tetes
+normalises (`HeaderIndex`). Les colonnes d'un fichier sont ensuite resolues en une passe :
+une normalisation par en-tete, puis une recherche en dictionnaire (forme exacte, puis
+sans espaces). Si deux colonnes visent le meme champ, l'alias prefere l'emporte. La
+recherche par inclusion, tolerante mais couteuse, n'est faite que pour les champs encore
+introuvables, et seulement si l'index l'autorise.
+
+Les lignes passent ensuite en flux (`stream_rows`) par des validateurs, un par regle, qui
+renvoient le motif de rejet ou None. Elles aboutissent dans un collecteur (`ListSink` ou
+tout objet offrant accept / reject / close).
+"""
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from App_PADESCE.core.normalization import clean_cell
+
+
+def normalize_header(value) -> str:
+    """En-tete sans accents, en minuscules, ponctuation remplacee par des espaces."""
+    if value is None:
+        return ""
+    normalized = unicodedata.normalize("NFKD", str(value))
+    ascii_only = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    ascii_only = ascii_only.lower().replace("&", "and").replace("’", "'")
+    ascii_only = "".join(ch if ch.isalnum() or ch.isspace() else " " for ch in ascii_only)
+    return " ".join(ascii_only.split())
+
+
+@dataclass
+class Columns:
+    """Colonnes resolues d'un fichier : champ -> indice de colonne."""
+
+    header: List[str]
+    positions: Dict[str, int]
+    _order: List[Tuple[int, str]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._order = sorted((idx, name) for name, idx in self.positions.items())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.positions
+
+    def label(self, name: str) -> str:
+        idx = self.positions.get(name)
+        return "" if idx is None else str(self.header[idx])
+
+    def missing(self, names: Iterable[str]) -> List[str]:
+        return [name for name in names if name not in self.positions]
+
+    def ordered(self) -> List[Tuple[int, str]]:
+        """(indice, champ) dans l'ordre des colonnes du fichier."""
+        return list(self._order)
+
+    def extract(self, cells: Sequence) -> Dict[str, Any]:
+        """Valeurs de la ligne par champ (champs hors de la ligne omis)."""
+        width = len(cells)
+        return {name: cells[idx] for idx, name in self._order if idx < width}
+
+
+class HeaderIndex:
+    """Table d'alias compilee : en-tete normalise -> (champ, rang de preference)."""
+
+    def __init__(self, aliases: Mapping[str, Iterable[str]], partial: bool = False):
+        self.fields = tuple(aliases)
+        self._exact: Dict[str, Tuple[str, int]] = {}
+        self._compact: Dict[str, Tuple[str, int]] = {}
+        self._partial: Dict[str, List[str]] = {}
+        for name, labels in aliases.items():
+            for rank, label in enumerate(labels):
+                key = normalize_header(label)
+                if not key:
+                    continue
+                self._exact.setdefault(key, (name, rank))
+                self._compact.setdefault(key.replace(" ", ""), (name, rank))
+                if partial:
+                    self._partial.setdefault(name, []).append(key)
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping[str, str], partial: bool = False) -> "HeaderIndex":
+        """Index depuis une table alias -> champ (ordre de la table = ordre de preference)."""
+        grouped: Dict[str, List[str]] = {}
+        for alias, name in mapping.items():
+            grouped.setdefault(name, []).append(alias)
+        return cls(grouped, partial=partial)
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, int]]:
+        if not key:
+            return None
+        return self._exact.get(key) or self._compact.get(key.replace(" ", ""))
+
+    def field_for(self, header) -> Optional[str]:
+        match = self._lookup(normalize_header(header))
+        return match[0] if match else None
+
+    def resolve(self, header: Sequence) -> Columns:
+        header = list(header)
+        normalized = [normalize_header(h) for h in header]
+        best: Dict[str, Tuple[int, int]] = {}
+        for idx, key in enumerate(normalized):
+            match = self._lookup(key)
+            if match is None:
+                continue
+            name, rank = match
+            if name not in best or rank < best[name][0]:
+                best[name] = (rank, idx)
+        positions = {name: idx for name, (_, idx) in best.items()}
+        taken = set(positions.values())
+        for name, keys in self._partial.items():
+            if name in positions:
+                continue
+            # Inclusion : premier alias contenu dans un en-tete encore libre, dans l'ordre des alias.
+            for key in keys:
+                idx = next((i for i, col in enumerate(normalized) if i not in taken and key in col), None)
+                if idx is not None:
+                    positions[name] = idx
+                    taken.add(idx)
+                    break
+        return Columns(header=header, positions=positions)
+
+
+Validator = Callable[[Dict[str, Any]], Optional[str]]
+
+
+def required(*names: str, motif: str = "") -> Validator:
+    """Validateur : rejette la ligne si l'un des champs est vide (0, blancs et NaN compris)."""
+
+    def check(row: Dict[str, Any]) -> Optional[str]:
+        empty = [name for name in names if not row.get(name) or not clean_cell(row[name])]
+        if empty:
+            return motif or f"champ(s) vide(s) : {', '.join(empty)}"
+        return None
+
+    return check
+
+
+@dataclass
+class ListSink:
+    """Collecteur en memoire : lignes acceptees (et numeros de ligne), lignes rejetees."""
+
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    lines: List[int] = field(default_factory=list)
+    rejected: List[Tuple[int, str]] = field(default_factory=list)
+
+    def accept(self, line: int, row: Dict[str, Any]) -> None:
+        self.rows.append(row)
+        self.lines.append(line)
+
+    def reject(self, line: int, row: Dict[str, Any], motif: str) -> None:
+        self.rejected.append((line, motif))
+
+    def close(self) -> None:
+        pass
+
+
+def stream_rows(
+    columns: Columns,
+    rows: Iterable[Tuple[int, Sequence]],
+    validators: Sequence[Validator] = (),
+    sink=None,
+    skip_empty: bool = False,
+):
+    """
+    Fait passer les lignes (numero, cellules) par les validateurs jusqu'au collecteur,
+    sans les materialiser ; renvoie le collecteur. Avec `skip_empty`, les lignes sans
+    valeur dans aucune colonne reconnue (contenu hors des colonnes attendues) sont ignorees.
+    """
+    sink = sink if sink is not None else ListSink()
+    try:
+        for line, cells in rows:
+            row = columns.extract(cells)
+            if skip_empty and not any(clean_cell(value) for value in row.values()):
+                continue
+            for validator in validators:
+                motif = validator(row)
+                if motif:
+                    sink.reject(line, row, motif)
+                    break
+            else:
+                sink.accept(line, row)
+    finally:
+        sink.close()
+    return sink
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_useractivity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CodeSequence",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("prefix", models.CharField(max_length=10, unique=True)),
+                ("last_value", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -52,3 +52,13 @@ class UserActivity(models.Model):
 
     def __str__(self) -> str:
         return f"{self.user} - {self.last_seen}"
+
+
+class CodeSequence(models.Model):
+    """Compteur par prefixe des codes lisibles attribues (voir core/sequences.py)."""
+
+    prefix = models.CharField(max_length=10, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.prefix} {self.last_value}"
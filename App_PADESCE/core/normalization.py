@@ -0,0 +1,166 @@
+"""
+Normalisation vectorisee des cellules de tableurs importes.
+
+Les importeurs (fichier consolide, apprenants d'une classe, fichiers des beneficiaires,
+appels) partagent ces regles, appliquees a des colonnes entieres (pandas) plutot que
+cellule par cellule :
+
+- texte : vide pour None/NaN, flottant entier rendu sans ".0" (3.0 -> "3", un telephone
+  lu comme 677123456.0 -> "677123456"), sinon str() sans espaces de bord ;
+- entiers et decimaux : espaces retires, virgule decimale acceptee ("12,5"), valeur
+  manquante si la cellule ne se lit pas comme un nombre ;
+- telephones : "tel1 / tel2" dans la premiere colonne reparti sur les deux colonnes ;
+- genre : H/HOMME, M/MASCULIN, F/FEMME/FEMININ ramenes a une lettre.
+"""
+from decimal import Decimal
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+# Entiers exactement representables en flottant double : au-dela, conversion en Python.
+_EXACT_FLOAT_LIMIT = 2**53
+
+GENDER_CODES = {
+    "H": "H",
+    "HOMME": "H",
+    "M": "M",
+    "MASCULIN": "M",
+    "F": "F",
+    "FEMME": "F",
+    "FEMININ": "F",
+}
+
+
+def _as_object(values) -> pd.Series:
+    if isinstance(values, pd.Series):
+        return values.astype(object)
+    return pd.Series(list(values), dtype=object)
+
+
+def clean_cell(value) -> str:
+    """Regle scalaire de `clean_text`, pour les colonnes de types melanges."""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:
+            return ""
+        if value.is_integer():
+            return str(int(value))
+        return str(value)
+    if isinstance(value, int):
+        return str(value)
+    return str(value).strip()
+
+
+def _clean_floats(numbers: np.ndarray) -> np.ndarray:
+    rendered = numbers.astype(str).astype(object)
+    finite = np.isfinite(numbers)
+    integral = np.zeros(len(numbers), dtype=bool)
+    integral[finite] = np.mod(numbers[finite], 1) == 0
+    exact = integral & (np.abs(numbers) < _EXACT_FLOAT_LIMIT)
+    rendered[exact] = numbers[exact].astype(np.int64).astype(str)
+    big = integral & ~exact
+    if big.any():
+        rendered[big] = [str(int(v)) for v in numbers[big]]
+    return rendered
+
+
+def clean_text(values) -> pd.Series:
+    """
+    Colonne de chaines nettoyees (meme regle que `clean_cell`). Les colonnes
+    homogenes (texte seul, nombres seuls) sont traitees d'un bloc ; une colonne melangeant
+    texte et nombres retombe sur la regle scalaire.
+    """
+    series = _as_object(values)
+    if series.empty:
+        return series
+    missing = series.isna().to_numpy()
+    kind = infer_dtype(series, skipna=True)
+    out = series.to_numpy(dtype=object, copy=True)
+    present = ~missing
+    if kind == "string":
+        out[present] = series[present].str.strip().to_numpy(dtype=object)
+    elif kind == "integer":
+        out[present] = series[present].map(str).to_numpy(dtype=object)
+    elif kind in ("floating", "mixed-integer-float"):
+        out[present] = _clean_floats(series[present].to_numpy(dtype=float))
+    elif kind != "empty":
+        out[present] = [clean_cell(v) for v in out[present]]
+    out[missing] = ""
+    return pd.Series(out, index=series.index, dtype=object)
+
+
+def _numeric(values) -> Tuple[pd.Series, pd.Series]:
+    text = clean_text(values).str.replace(r"\s+", "", regex=True).str.replace(",", ".", regex=False)
+    return text, pd.to_numeric(text.where(text != "", None), errors="coerce")
+
+
+def to_float(values) -> pd.Series:
+    """Colonne de flottants (NaN si vide ou illisible), virgule decimale acceptee."""
+    _, numbers = _numeric(values)
+    return numbers.astype(float)
+
+
+def to_int(values, strict: bool = False) -> pd.Series:
+    """
+    Colonne d'entiers Python ou None. Par defaut la partie decimale est tronquee
+    ("12.7" -> 12) ; `strict` rejette les valeurs non entieres.
+    """
+    numbers = to_float(values)
+    valid = np.isfinite(numbers.to_numpy())
+    if strict:
+        valid &= np.mod(np.nan_to_num(numbers.to_numpy()), 1) == 0
+    out = np.full(len(numbers), None, dtype=object)
+    if valid.any():
+        out[valid] = [int(v) for v in np.trunc(numbers.to_numpy()[valid])]
+    return pd.Series(out, index=numbers.index, dtype=object)
+
+
+def to_decimal(values) -> pd.Series:
+    """Colonne de Decimal (depuis le texte, sans arrondi flottant) ou None."""
+    text, numbers = _numeric(values)
+    valid = np.isfinite(numbers.to_numpy())
+    out = np.full(len(text), None, dtype=object)
+    if valid.any():
+        out[valid] = [Decimal(v) for v in text.to_numpy(dtype=object)[valid]]
+    return pd.Series(out, index=text.index, dtype=object)
+
+
+def split_phones(tel1, tel2) -> Tuple[pd.Series, pd.Series]:
+    """
+    "677000001 / 699000002" en premiere colonne : le premier numero reste, le second
+    complete la deuxieme colonne si elle est vide.
+    """
+    first = clean_text(tel1)
+    second = clean_text(tel2)
+    second.index = first.index
+    multiple = first.str.contains("/", regex=False)
+    if not multiple.any():
+        return first, second
+    parts = (
+        first[multiple]
+        .str.replace(r"\s*(?:/\s*)+", "/", regex=True)
+        .str.strip("/")
+        .str.split("/", n=2, expand=True)
+        .reindex(columns=range(2))
+        .fillna("")
+    )
+    has_parts = parts[0] != ""
+    first.loc[has_parts[has_parts].index] = parts.loc[has_parts, 0]
+    fill = has_parts & (second[multiple] == "") & (parts[1] != "")
+    second.loc[fill[fill].index] = parts.loc[fill, 1]
+    return first, second
+
+
+def normalize_gender(values) -> pd.Series:
+    """Genre en une lettre (H, M, F) ; une valeur non reconnue est rendue en majuscules sans espaces."""
+    text = clean_text(values).str.upper().str.replace(r"\s+", "", regex=True)
+    codes = text.map(GENDER_CODES)
+    return codes.where(codes.notna(), text)
+
+
+def digits_only(values) -> pd.Series:
+    """Chiffres seuls (controle des telephones)."""
+    return clean_text(values).str.replace(r"\D", "", regex=True)
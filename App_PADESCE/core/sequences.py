@@ -0,0 +1,110 @@
+"""
+Attribution des codes lisibles : apprenants (4 caracteres), classes (CLA001), lieux (LIE001).
+
+Un compteur par prefixe (CodeSequence). Reserver N codes revient a un UPDATE
+`last_value = last_value + N`, suivi de la lecture de la nouvelle valeur, dans la meme
+transaction. Le verrou d'ecriture pris par l'UPDATE serialise les reservations
+concurrentes : deux appels ne recoivent jamais le meme intervalle. Le compteur ne
+redescend jamais, donc un code libere par une suppression n'est pas reattribue.
+
+Les codes deja presents en base (saisis dans un fichier, ou attribues avant les compteurs)
+sont ecartes par une recherche `__in` sur les seuls codes reserves, jamais par un parcours
+de la table.
+"""
+import re
+from typing import Callable, Iterable, List, Optional, Union
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from App_PADESCE.core.models import CodeSequence
+
+_CHUNK_SIZE = 500
+
+APPRENANT_SEQUENCE = "APP"
+# Codes apprenants : 4 caracteres majuscules/chiffres. Le rang n est permute dans l'espace
+# des 36**4 codes (n * pas + decalage, pas premier avec 36) : bijection, donc pas de
+# repetition, et deux apprenants voisins n'ont pas des codes consecutifs.
+_CODE_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_CODE_LENGTH = 4
+_CODE_SPACE = len(_CODE_CHARSET) ** _CODE_LENGTH
+_CODE_STRIDE = 795_643
+_CODE_OFFSET = 421_337
+
+
+def reserve(prefix: str, count: int = 1, start: Union[int, Callable[[], int], None] = None) -> range:
+    """
+    Reserve `count` valeurs consecutives du compteur `prefix` et les renvoie.
+    `start` (valeur ou fonction) fixe le point de depart a la creation du compteur.
+    """
+    if count <= 0:
+        return range(0)
+    sequences = CodeSequence.objects.filter(prefix=prefix)
+    with transaction.atomic():
+        if not sequences.update(last_value=F("last_value") + count):
+            initial = start() if callable(start) else (start or 0)
+            try:
+                with transaction.atomic():
+                    CodeSequence.objects.create(prefix=prefix, last_value=initial + count)
+            except IntegrityError:
+                # Compteur cree entre-temps par une reservation concurrente.
+                sequences.update(last_value=F("last_value") + count)
+        last = sequences.values_list("last_value", flat=True).get()
+    return range(last - count + 1, last + 1)
+
+
+def peek(prefix: str, start: Union[int, Callable[[], int], None] = None) -> int:
+    """Prochaine valeur du compteur, sans la reserver (affichage d'un formulaire)."""
+    last = CodeSequence.objects.filter(prefix=prefix).values_list("last_value", flat=True).first()
+    if last is None:
+        last = start() if callable(start) else (start or 0)
+    return last + 1
+
+
+def numbered(prefix: str, padding: int = 3) -> Callable[[int], str]:
+    """Rendu "CLA001" : prefixe suivi du rang complete par des zeros."""
+    return lambda value: f"{prefix}{value:0{padding}d}"
+
+
+def apprenant_code(value: int) -> str:
+    """Rendu d'un rang du compteur apprenants en code de 4 caracteres."""
+    if not 0 < value <= _CODE_SPACE:
+        raise ValueError("Impossible de generer un code unique")
+    index = (value * _CODE_STRIDE + _CODE_OFFSET) % _CODE_SPACE
+    chars = []
+    for _ in range(_CODE_LENGTH):
+        index, digit = divmod(index, len(_CODE_CHARSET))
+        chars.append(_CODE_CHARSET[digit])
+    return "".join(reversed(chars))
+
+
+def max_numbered(model, prefix: str, field: str = "code") -> int:
+    """Plus grand rang deja attribue sous la forme prefixe + chiffres (amorce d'un compteur)."""
+    pattern = re.compile(rf"^{re.escape(prefix)}(\d+)$")
+    values = model.objects.filter(**{f"{field}__regex": rf"^{re.escape(prefix)}[0-9]+$"}).values_list(field, flat=True)
+    return max((int(pattern.match(value).group(1)) for value in values), default=0)
+
+
+def allocate(
+    model,
+    prefix: str,
+    count: int,
+    render: Callable[[int], str],
+    start: Union[int, Callable[[], int], None] = None,
+    exclude: Optional[Iterable[str]] = None,
+    field: str = "code",
+) -> List[str]:
+    """
+    `count` codes neufs pour `model` : reservation d'un bloc, puis retrait des codes deja
+    en base (ou dans `exclude`) et nouvelle reservation pour les remplacer.
+    """
+    excluded = set(exclude or ())
+    codes: List[str] = []
+    while len(codes) < count:
+        block = [render(value) for value in reserve(prefix, count - len(codes), start)]
+        taken = set(excluded.intersection(block))
+        for offset in range(0, len(block), _CHUNK_SIZE):
+            chunk = block[offset : offset + _CHUNK_SIZE]
+            taken.update(model.objects.filter(**{f"{field}__in": chunk}).values_list(field, flat=True))
+        codes.extend(code for code in block if code not in taken)
+    return codes
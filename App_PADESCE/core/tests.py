@@ -1,3 +1,156 @@
-from django.test import TestCase
+from decimal import Decimal
+from functools import partial
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.core import sequences
+from App_PADESCE.core.bloom import BloomFilter
+from App_PADESCE.core.exports import Label, iter_csv
+from App_PADESCE.core.importing import HeaderIndex, normalize_header, required, stream_rows
+from App_PADESCE.core.models import CodeSequence
+from App_PADESCE.core.normalization import (
+    clean_text,
+    digits_only,
+    normalize_gender,
+    split_phones,
+    to_decimal,
+    to_int,
+)
+from App_PADESCE.formations.models import Classe, Formation, Lieu, Prestataire, Prestation
+
+
+class IterCsvTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        for name, first in (("alice", "Alice"), ("bob", ""), ("carla", "Carla")):
+            User.objects.create_user(name, first_name=first)
+
+    def test_chunks_and_labels(self):
+        columns = [("utilisateur", "username"), ("libelle", Label("username", "first_name"))]
+        chunks = list(iter_csv(get_user_model().objects.order_by("username"), columns, chunk_size=2))
+        # En-tete seul d'abord, puis des paquets de `chunk_size` lignes.
+        self.assertEqual(
+            chunks,
+            ["utilisateur,libelle\r\n", "alice,alice - Alice\r\nbob,bob - \r\n", "carla,carla - Carla\r\n"],
+        )
+
+    def test_null_relation_is_empty(self):
+        self.assertEqual(Label("a", "b").render((None, None)), "")
+        self.assertEqual(Label("a", "b").render(("X", None)), "X - ")
+
+
+class NormalizationTests(SimpleTestCase):
+    def test_clean_text(self):
+        self.assertEqual(clean_text([None, float("nan"), " a ", "b"]).tolist(), ["", "", "a", "b"])
+        # Telephone lu comme flottant par pandas : rendu sans ".0".
+        self.assertEqual(clean_text([677123456.0, 3.5]).tolist(), ["677123456", "3.5"])
+        self.assertEqual(clean_text(["x", 2.0, 7]).tolist(), ["x", "2", "7"])
+
+    def test_numbers(self):
+        self.assertEqual(to_int(["12", "12.7", " 1 200 ", "abc", None]).tolist(), [12, 12, 1200, None, None])
+        self.assertEqual(to_int(["12.7", "3"], strict=True).tolist(), [None, 3])
+        self.assertEqual(to_decimal(["0,85", "", "x"]).tolist(), [Decimal("0.85"), None, None])
+
+    def test_phones_and_gender(self):
+        first, second = split_phones(["677000001 / 699000002", "677000003/ 699000004", "677000005"], ["", "650", ""])
+        self.assertEqual(first.tolist(), ["677000001", "677000003", "677000005"])
+        self.assertEqual(second.tolist(), ["699000002", "650", ""])
+        self.assertEqual(normalize_gender(["homme", " Feminin", "m", "x"]).tolist(), ["H", "F", "M", "X"])
+        self.assertEqual(digits_only(["+237 677-00"]).tolist(), ["23767700"])
+
+
+class HeaderIndexTests(SimpleTestCase):
+    def test_resolve_exact_compact_and_preference(self):
+        index = HeaderIndex({"nom": ["Nom et prenom", "Nom"], "telephone": ["Telephone 1"]})
+        self.assertEqual(normalize_header(" Téléphone-1 "), "telephone 1")
+        columns = index.resolve(["Nom", "TELEPHONE1", "Nom et prénom", "Autre"])
+        # L'alias prefere l'emporte ; "TELEPHONE1" trouve par la forme sans espaces.
+        self.assertEqual(columns.positions, {"nom": 2, "telephone": 1})
+        self.assertEqual(columns.missing(["nom", "age"]), ["age"])
+
+    def test_partial_only_for_unresolved_fields(self):
+        index = HeaderIndex({"numero": ["N"], "nom": ["Nom"]}, partial=True)
+        # "N" ne doit pas prendre la colonne du nom par inclusion.
+        self.assertEqual(index.resolve(["Nom complet", "N"]).positions, {"nom": 0, "numero": 1})
+
+    def test_stream_rows_validators(self):
+        columns = HeaderIndex({"nom": ["Nom"], "code": ["Code"]}).resolve(["Nom", "Code"])
+        sink = stream_rows(columns, [(2, ["A", "C1"]), (3, ["B", " "]), (4, ["C", "C3"])], [required("nom", "code")])
+        self.assertEqual(sink.lines, [2, 4])
+        self.assertEqual(sink.rejected, [(3, "champ(s) vide(s) : code")])
+
+    def test_stream_rows_skip_empty(self):
+        columns = HeaderIndex({"nom": ["Nom"]}).resolve(["Nom", ""])
+        rows = [(2, ["A", ""]), (3, [None, "hors colonne"]), (4, [" ", None])]
+        self.assertEqual(stream_rows(columns, rows).lines, [2, 3, 4])
+        self.assertEqual(stream_rows(columns, rows, skip_empty=True).lines, [2])
+
+
+class SequenceTests(TestCase):
+    def test_reserve_returns_disjoint_blocks(self):
+        first = sequences.reserve("TST", 3, start=10)
+        second = sequences.reserve("TST", 2)
+        self.assertEqual(list(first), [11, 12, 13])
+        self.assertEqual(list(second), [14, 15])
+        self.assertEqual(CodeSequence.objects.get(prefix="TST").last_value, 15)
+        self.assertEqual(sequences.peek("TST"), 16)
+
+    def test_numbered_codes_start_after_existing_and_skip_taken(self):
+        for code in ("LIE001", "LIE002", "LIE004"):
+            Lieu.objects.create(code=code, nom_lieu=code)
+        render = sequences.numbered("LIE")
+        start = partial(sequences.max_numbered, Lieu, "LIE")
+        self.assertEqual(sequences.max_numbered(Lieu, "LIE"), 4)
+        self.assertEqual(sequences.allocate(Lieu, "LIE", 2, render, start=start), ["LIE005", "LIE006"])
+
+        # Code saisi a la main au-dela du compteur : ecarte, remplace par le suivant.
+        Lieu.objects.create(code="LIE007", nom_lieu="manuel")
+        self.assertEqual(
+            sequences.allocate(Lieu, "LIE", 3, render, start=start, exclude={"LIE009"}),
+            ["LIE008", "LIE010", "LIE011"],
+        )
+
+    def test_apprenant_codes_are_unique(self):
+        formation = Formation.objects.create(code="F1", nom="Formation")
+        prestataire = Prestataire.objects.create(code="P1", raison_sociale="Prestataire")
+        prestation = Prestation.objects.create(code="PS1", prestataire=prestataire, formation=formation)
+        classe = Classe.objects.create(code="C1", prestation=prestation, formation=formation, intitule_formation="F")
+        # Codes deja en base ou reserves par le fichier en cours d'import : jamais reattribues.
+        taken = sequences.apprenant_code(2)
+        Apprenant.objects.create(code=taken, classe=classe, formation=formation, nom_complet="Existant")
+        excluded = sequences.apprenant_code(5)
+
+        codes = []
+        for count in (3, 4, 250):
+            codes += sequences.allocate(
+                Apprenant, sequences.APPRENANT_SEQUENCE, count, sequences.apprenant_code, exclude={excluded}
+            )
+        self.assertEqual(len(codes), 257)
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertNotIn(taken, codes)
+        self.assertNotIn(excluded, codes)
+        for code in codes:
+            self.assertRegex(code, r"^[0-9A-Z]{4}$")
+
+    def test_apprenant_code_is_a_bijection(self):
+        sample = 200_000
+        codes = {sequences.apprenant_code(value) for value in range(1, sample + 1)}
+        self.assertEqual(len(codes), sample)
+        # Deux rangs voisins ne donnent pas des codes voisins.
+        self.assertNotEqual(sequences.apprenant_code(2)[:3], sequences.apprenant_code(1)[:3])
+        with self.assertRaises(ValueError):
+            sequences.apprenant_code(36**4 + 1)
+        with self.assertRaises(ValueError):
+            sequences.apprenant_code(0)
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_false_positive_rate(self):
+        bloom = BloomFilter.for_capacity(2000, 0.01)
+        bloom.update(f"IN{n}" for n in range(2000))
+        self.assertTrue(all(f"IN{n}" in bloom for n in range(2000)))
+        false_positives = sum(f"OUT{n}" in bloom for n in range(10000))
+        self.assertLess(false_positives, 200)
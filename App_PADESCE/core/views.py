@@ -24,7 +24,7 @@ def home(request):
 
     context = {
         "nb_classes": Classe.objects.count(),
-        "nb_apprenants": Apprenant.objects.count(),
+        "nb_apprenants": Apprenant.objects.filter(actif=True).count(),
         "nb_presence": Presence.objects.count(),
         "nb_sat_apprenants": SatisfactionApprenant.objects.count(),
         "nb_sat_formateurs": SatisfactionFormateur.objects.count(),
@@ -34,7 +34,7 @@ def home(request):
         "deadline_iso": end_date.isoformat(),
         "stat_cards": [
             {"label": "Classes", "value": Classe.objects.count(), "color": "primary"},
-            {"label": "Apprenants", "value": Apprenant.objects.count(), "color": "success"},
+            {"label": "Apprenants", "value": Apprenant.objects.filter(actif=True).count(), "color": "success"},
             {"label": "Enquêtes présence", "value": Presence.objects.count(), "color": "info"},
             {"label": "Sat. apprenants", "value": SatisfactionApprenant.objects.count(), "color": "warning"},
             {"label": "Sat. formateurs", "value": SatisfactionFormateur.objects.count(), "color": "danger"},
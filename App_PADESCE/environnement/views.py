@@ -1,11 +1,10 @@
-import csv
 from datetime import date as date_cls
 
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import HttpResponse
 from django.shortcuts import redirect, render
 
+from App_PADESCE.core.exports import Label, csv_response, user_label
 from App_PADESCE.environnement.forms import EnqueteEnvironnementForm
 from App_PADESCE.environnement.models import EnqueteEnvironnement
 from App_PADESCE.formations.models import Classe
@@ -61,66 +60,33 @@ def environnement(request):
 
 def environnement_export_csv(request):
     filter_classe = request.GET.get("classe")
-    qs = EnqueteEnvironnement.objects.select_related("classe", "inspecteur", "enqueteur").order_by("-date")
+    qs = EnqueteEnvironnement.objects.order_by("-date")
     if filter_classe:
         qs = qs.filter(classe_id=filter_classe)
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = "attachment; filename=environnement.csv"
-    writer = csv.writer(response)
-    writer.writerow(
-        [
-            "classe",
-            "inspecteur",
-            "enqueteur",
-            "date",
-            "heure_enregistrement",
-            "tables",
-            "chaises",
-            "ecran",
-            "videoprojecteur",
-            "ventilation",
-            "eclairage",
-            "aeration",
-            "prises_electriques",
-            "salle_propre",
-            "salle_accessible",
-            "salle_securisee",
-            "signaletique",
-            "commodite",
-            "accessibilite",
-            "securite",
-            "acces_eau",
-            "commentaire_salle",
-            "commentaire_global",
-        ]
-    )
-    for e in qs:
-        writer.writerow(
-            [
-                e.classe,
-                e.inspecteur,
-                e.enqueteur,
-                e.date,
-                e.heure_enregistrement,
-                e.tables,
-                e.chaises,
-                e.ecran,
-                e.videoprojecteur,
-                e.ventilation,
-                e.eclairage,
-                e.aeration,
-                e.prises_electriques,
-                e.salle_propre,
-                e.salle_accessible,
-                e.salle_securisee,
-                e.signaletique,
-                e.commodite,
-                e.accessibilite,
-                e.securite,
-                e.acces_eau,
-                e.commentaire_salle,
-                e.commentaire_global,
-            ]
-        )
-    return response
+    columns = [
+        ("classe", Label("classe__code", "classe__intitule_formation")),
+        ("inspecteur", Label("inspecteur__code", "inspecteur__nom_complet")),
+        ("enqueteur", user_label("enqueteur")),
+        ("date", "date"),
+        ("heure_enregistrement", "heure_enregistrement"),
+        ("tables", "tables"),
+        ("chaises", "chaises"),
+        ("ecran", "ecran"),
+        ("videoprojecteur", "videoprojecteur"),
+        ("ventilation", "ventilation"),
+        ("eclairage", "eclairage"),
+        ("aeration", "aeration"),
+        ("prises_electriques", "prises_electriques"),
+        ("salle_propre", "salle_propre"),
+        ("salle_accessible", "salle_accessible"),
+        ("salle_securisee", "salle_securisee"),
+        ("signaletique", "signaletique"),
+        ("commodite", "commodite"),
+        ("accessibilite", "accessibilite"),
+        ("securite", "securite"),
+        ("acces_eau", "acces_eau"),
+        ("commentaire_salle", "commentaire_salle"),
+        ("commentaire_global", "commentaire_global"),
+    ]
+    return csv_response(qs, columns, "environnement.csv")
@@ -1,3 +1,5 @@
+from functools import partial
+
 from django.contrib import messages
 from django.db import transaction
 from django.db.models import Count, Prefetch, Q
@@ -7,6 +9,7 @@ from django.urls import reverse
 from django.views.decorators.http import require_POST
 
 from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.core import sequences
 from App_PADESCE.formations.forms import ClasseCreateForm
 from App_PADESCE.formations.models import Classe, Formation, Lieu, Prestation
 from App_PADESCE.presences.models import Presence
@@ -16,8 +19,15 @@ from App_PADESCE.environnement.models import EnqueteEnvironnement
 
 
 def generate_code(model_cls, prefix: str, padding: int = 3) -> str:
-    total = model_cls.objects.count()
-    return f"{prefix}{total + 1:0{padding}d}"
+    """Reserve le prochain code "CLA001" du compteur `prefix` (core/sequences.py)."""
+    start = partial(sequences.max_numbered, model_cls, prefix)
+    return sequences.allocate(model_cls, prefix, 1, sequences.numbered(prefix, padding), start=start)[0]
+
+
+def next_code(model_cls, prefix: str, padding: int = 3) -> str:
+    """Code que recevrait le prochain objet, sans le reserver (affichage du formulaire)."""
+    value = sequences.peek(prefix, start=partial(sequences.max_numbered, model_cls, prefix))
+    return sequences.numbered(prefix, padding)(value)
 
 
 def class_list(request):
@@ -49,7 +59,7 @@ def class_detail(request, pk: int):
 
 @transaction.atomic
 def class_create(request):
-    initial_code = generate_code(Classe, "CLA")
+    initial_code = next_code(Classe, "CLA")
     prestation_id = request.GET.get("prestation")
     initial_data = {"code": initial_code, "cohorte": 1}
 
@@ -87,7 +97,7 @@ def class_create(request):
                 lieu_payload["nom_lieu"] = f"Lieu {lieu_code}"
             classe.lieu = Lieu.objects.create(code=lieu_code, **lieu_payload)
 
-        classe.code = initial_code
+        classe.code = generate_code(Classe, "CLA")
         classe.save()
         messages.success(request, f"Classe {classe.code} creee. Importez les apprenants CSV.")
         return redirect(reverse("apprenants_import", args=[classe.id]))
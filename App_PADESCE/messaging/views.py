@@ -1,11 +1,9 @@
-import csv
-
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import HttpResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
 
+from App_PADESCE.core.exports import Label, csv_response
 from App_PADESCE.messaging.forms import CampagneMessageForm, ContactForm
 from App_PADESCE.messaging.models import CampagneMessage, Contact
 from App_PADESCE.formations.models import Prestataire
@@ -48,34 +46,16 @@ def contacts_view(request):
 
 
 def contacts_export_csv(request):
-    qs = Contact.objects.select_related("prestataire", "formation").all()
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = "attachment; filename=contacts.csv"
-    writer = csv.writer(response)
-    writer.writerow(
-        [
-            "nom_complet",
-            "telephone",
-            "prestataire",
-            "formation",
-            "fenetre",
-            "ville_residence",
-            "fonction",
-        ]
-    )
-    for c in qs:
-        writer.writerow(
-            [
-                c.nom_complet,
-                c.telephone,
-                c.prestataire,
-                c.formation,
-                c.fenetre,
-                c.ville_residence,
-                c.fonction,
-            ]
-        )
-    return response
+    columns = [
+        ("nom_complet", "nom_complet"),
+        ("telephone", "telephone"),
+        ("prestataire", Label("prestataire__code", "prestataire__raison_sociale")),
+        ("formation", Label("formation__code", "formation__nom")),
+        ("fenetre", "fenetre"),
+        ("ville_residence", "ville_residence"),
+        ("fonction", "fonction"),
+    ]
+    return csv_response(Contact.objects.all(), columns, "contacts.csv")
 
 
 def campagnes_view(request):
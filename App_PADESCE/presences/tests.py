@@ -1,3 +1,69 @@
+import csv
+import io
+from datetime import date
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+
+from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.core.middleware import set_current_user
+from App_PADESCE.formations.models import Classe, Formation, Inspecteur, Prestataire, Prestation
+from App_PADESCE.presences.models import Presence
+
+
+class PresenceExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        formation = Formation.objects.create(code="F1", nom="Couture")
+        prestation = Prestation.objects.create(
+            code="PS1", prestataire=Prestataire.objects.create(code="PR1", raison_sociale="Atelier"), formation=formation
+        )
+        cls.classes = [
+            Classe.objects.create(code=f"C{i}", prestation=prestation, formation=formation, intitule_formation="Couture")
+            for i in (1, 2)
+        ]
+        inspecteur = Inspecteur.objects.create(code="I1", nom_complet="Inspecteur Un")
+        cls.user = get_user_model().objects.create_user("enqueteur", password="x")
+        cls.presences = []
+        for n, classe in enumerate(cls.classes):
+            apprenant = Apprenant.objects.create(
+                code=f"A{n}", classe=classe, formation=formation, nom_complet=f"Apprenant, {n}"
+            )
+            cls.presences.append(
+                Presence.objects.create(
+                    classe=classe,
+                    apprenant=apprenant,
+                    inspecteur=inspecteur if n else None,
+                    enqueteur=cls.user if n else None,
+                    date=date(2026, 3, 2 + n),
+                    presence="AB" if n else "PR",
+                    remarques='Retard "15 min"' if n else "",
+                )
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.addCleanup(set_current_user, None)
+
+    def expected_row(self, p):
+        # Rendu de l'ancien export : str() des instances, None ecrit vide par csv.writer.
+        values = [p.classe, p.apprenant, p.inspecteur, p.enqueteur, p.date, p.heure_debut, p.heure_fin]
+        values += [p.presence, p.statut, p.moyen_enregistrement, p.remarques, p.heure_enregistrement]
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return next(csv.reader(io.StringIO(buffer.getvalue())))
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+    def test_export_streams_model_labels(self):
+        rows = self.read(self.client.get(reverse("presences_export_csv")))
+        self.assertEqual(rows[0][:4], ["classe", "apprenant", "inspecteur", "enqueteur"])
+        # Plus recente d'abord ; relations nulles rendues vides, comme avant le passage en flux.
+        self.assertEqual(rows[1:], [self.expected_row(p) for p in reversed(self.presences)])
 
-# Create your tests here.
+    def test_export_filtered_by_classe(self):
+        response = self.client.get(reverse("presences_export_csv"), {"classe": self.classes[0].pk})
+        self.assertEqual(self.read(response)[1:], [self.expected_row(self.presences[0])])
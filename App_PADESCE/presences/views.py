@@ -1,13 +1,12 @@
-import csv
 from datetime import date as date_cls
 
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Q, Value, When
-from django.http import HttpResponse
 from django.shortcuts import redirect, render
 
 from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.core.exports import Label, csv_response, user_label
 from App_PADESCE.presences.forms import PresenceForm
 from App_PADESCE.presences.models import Presence
 from App_PADESCE.formations.models import Classe
@@ -92,44 +91,22 @@ def appels(request):
 
 def presence_export_csv(request):
     filter_classe = request.GET.get("classe")
-    presences_qs = Presence.objects.select_related("classe", "apprenant", "inspecteur", "enqueteur").order_by("-date")
+    presences_qs = Presence.objects.order_by("-date")
     if filter_classe:
         presences_qs = presences_qs.filter(classe_id=filter_classe)
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = "attachment; filename=presences.csv"
-    writer = csv.writer(response)
-    writer.writerow(
-        [
-            "classe",
-            "apprenant",
-            "inspecteur",
-            "enqueteur",
-            "date",
-            "heure_debut",
-            "heure_fin",
-            "presence",
-            "statut",
-            "moyen_enregistrement",
-            "remarques",
-            "heure_enregistrement",
-        ]
-    )
-    for p in presences_qs:
-        writer.writerow(
-            [
-                p.classe,
-                p.apprenant,
-                p.inspecteur,
-                p.enqueteur,
-                p.date,
-                p.heure_debut,
-                p.heure_fin,
-                p.presence,
-                p.statut,
-                p.moyen_enregistrement,
-                p.remarques,
-                p.heure_enregistrement,
-            ]
-        )
-    return response
+    columns = [
+        ("classe", Label("classe__code", "classe__intitule_formation")),
+        ("apprenant", Label("apprenant__code", "apprenant__nom_complet")),
+        ("inspecteur", Label("inspecteur__code", "inspecteur__nom_complet")),
+        ("enqueteur", user_label("enqueteur")),
+        ("date", "date"),
+        ("heure_debut", "heure_debut"),
+        ("heure_fin", "heure_fin"),
+        ("presence", "presence"),
+        ("statut", "statut"),
+        ("moyen_enregistrement", "moyen_enregistrement"),
+        ("remarques", "remarques"),
+        ("heure_enregistrement", "heure_enregistrement"),
+    ]
+    return csv_response(presences_qs, columns, "presences.csv")
@@ -0,0 +1,364 @@
+"""
+Moteur d'agregation reporting.
+
+Les faits (presences, satisfactions, apprenants, enquetes environnement) sont lus une
+seule fois, pre-agreges cote base (GROUP BY sur une seule table, sans jointure), puis
+rattaches aux libelles des dimensions dans pandas. Les presences sont lues dans le cumul
+journalier `PresenceDaily` (classe x date, avec les identifiants entiers des dimensions),
+filtre cote base par periode, fenetre, region ou prestataire ; les autres faits sont
+groupes par classe. Tous les axes (prestataire, prestation, beneficiaire,
+formation, ...) sont ensuite calcules en une passe vectorisee (melt + groupby). Le
+tableau de bord, les tables embarquees et l'API graphique lisent tous ce moteur.
+"""
+from dataclasses import astuple, dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from django.db.models import Count, Sum
+
+from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.environnement.models import EnqueteEnvironnement
+from App_PADESCE.formations.models import Beneficiaire, Classe, Formation, Lieu, Prestataire, Prestation
+from App_PADESCE.reporting.models import PresenceDaily
+from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
+from App_PADESCE.satisfaction_formateurs.models import SatisfactionFormateur
+
+# Axe -> chemin depuis Classe.
+CLASSE_DIMENSIONS = {
+    "classe": "code",
+    "prestation": "prestation__code",
+    "prestataire": "prestation__prestataire__raison_sociale",
+    "beneficiaire": "prestation__beneficiaire__nom_structure",
+    "formation": "formation__nom",
+    "nom_harmonise": "formation__nom_harmonise",
+    "lieu": "lieu__nom_lieu",
+    "region": "lieu__region",
+    "fenetre": "fenetre",
+}
+CLASSE_AXES = tuple(CLASSE_DIMENSIONS)
+# Colonne entiere de PresenceDaily -> (modele, axe -> champ libelle) ; la fenetre est deja un libelle.
+FACT_LABELS = {
+    "classe_id": (Classe, {"classe": "code"}),
+    "prestation_id": (Prestation, {"prestation": "code"}),
+    "prestataire_id": (Prestataire, {"prestataire": "raison_sociale"}),
+    "beneficiaire_id": (Beneficiaire, {"beneficiaire": "nom_structure"}),
+    "formation_id": (Formation, {"formation": "nom", "nom_harmonise": "nom_harmonise"}),
+    "lieu_id": (Lieu, {"lieu": "nom_lieu", "region": "region"}),
+}
+FACT_KEYS = (*FACT_LABELS, "fenetre")
+# Modeles traverses par les regroupements classe__prestation__... / classe__formation__...
+DIMENSION_MODELS = (Classe, Prestation, Prestataire, Beneficiaire, Formation)
+
+# Axes de repartition des apprenants : region/formation sont ceux de l'apprenant.
+REPART_AXES = ("ville", "region", "formation", "nom_harmonise", "beneficiaire", "prestataire")
+
+SATISFACTION_SOURCES = {
+    "apprenants": (SatisfactionApprenant, "q9_satisfaction_globale"),
+    "formateurs": (SatisfactionFormateur, "q9_satisfaction_globale_prestataire"),
+}
+
+# Granularites des series temporelles de presence -> frequence pandas.
+TIMELINE_FREQUENCIES = {"jour": "D", "semaine": "W", "mois": "M"}
+
+ENV_FIELDS = [
+    "tables",
+    "chaises",
+    "ecran",
+    "videoprojecteur",
+    "ventilation",
+    "eclairage",
+    "salle_propre",
+    "salle_securisee",
+]
+
+
+def safe_rate(num: float, den: float) -> float:
+    return round((num / den) * 100, 2) if den else 0.0
+
+
+def _label(value) -> Optional[Any]:
+    return None if value is None or (isinstance(value, float) and np.isnan(value)) else value
+
+
+def _frame(rows, columns) -> pd.DataFrame:
+    return pd.DataFrame.from_records(list(rows), columns=columns)
+
+
+def _rollup(frame: pd.DataFrame, axes, measures) -> Dict[str, pd.DataFrame]:
+    """Somme des mesures pour chaque axe, en un seul groupby sur la table depliee."""
+    measures = list(measures)
+    if frame.empty:
+        empty = pd.DataFrame(columns=measures, index=pd.Index([], name="label"))
+        return {axis: empty for axis in axes}
+    long = frame.melt(id_vars=measures, value_vars=list(axes), var_name="axis", value_name="label")
+    long["label"] = long["label"].astype(object).where(long["label"].notna(), None)
+    grouped = long.groupby(["axis", "label"], dropna=False, sort=False)[measures].sum()
+    result = {}
+    for axis in axes:
+        try:
+            result[axis] = grouped.xs(axis, level="axis")
+        except KeyError:
+            result[axis] = pd.DataFrame(columns=measures, index=pd.Index([], name="label"))
+    return result
+
+
+def _sorted(rows: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    return sorted(rows, key=lambda r: (r[key] is None, -(r[key] or 0), str(r["label"] or "")))
+
+
+@dataclass(frozen=True)
+class PresenceFilters:
+    """Filtres des indicateurs de presence : periode, fenetre, region du lieu, prestataire."""
+
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    fenetre: str = ""
+    region: str = ""
+    prestataire: Optional[int] = None
+
+    def __bool__(self) -> bool:
+        return any(astuple(self))
+
+    def key(self) -> str:
+        return "|".join("" if value is None else str(value) for value in astuple(self))
+
+
+class AggregationEngine:
+    """
+    Charge chaque famille de faits une seule fois (a la premiere demande) et memorise
+    les agregats de tous les axes. Une instance par requete ou par rafraichissement.
+    Les filtres ne s'appliquent qu'aux indicateurs de presence (cumul journalier).
+    """
+
+    def __init__(self, filters: Optional[PresenceFilters] = None):
+        self.filters = filters or PresenceFilters()
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._rollups: Dict[str, Dict[str, pd.DataFrame]] = {}
+
+    def _memo(self, key: str, build) -> pd.DataFrame:
+        if key not in self._frames:
+            self._frames[key] = build()
+        return self._frames[key]
+
+    # Dimensions -------------------------------------------------------------------
+    def classes(self) -> pd.DataFrame:
+        def build():
+            columns = ["classe_id", *CLASSE_AXES, "prestation_id"]
+            rows = Classe.objects.values_list("id", *CLASSE_DIMENSIONS.values(), "prestation_id").order_by()
+            return _frame(rows, columns).set_index("classe_id")
+
+        return self._memo("classes", build)
+
+    def _with_classes(self, facts: pd.DataFrame, axes=CLASSE_AXES) -> pd.DataFrame:
+        dims = self.classes()[list(axes)]
+        return facts.merge(dims, how="left", left_on="classe_id", right_index=True)
+
+    def labels(self, column: str) -> pd.DataFrame:
+        """Libelles d'une dimension indexes par identifiant (lecture d'une seule table)."""
+        model, fields = FACT_LABELS[column]
+
+        def build():
+            rows = model.objects.values_list("id", *fields.values()).order_by()
+            return _frame(rows, [column, *fields]).set_index(column)
+
+        return self._memo(f"labels_{column}", build)
+
+    def _with_labels(self, facts: pd.DataFrame) -> pd.DataFrame:
+        for column in FACT_LABELS:
+            facts = facts.merge(self.labels(column), how="left", left_on=column, right_index=True)
+        return facts
+
+    # Faits ------------------------------------------------------------------------
+    def presence_daily(self):
+        """Cellules du cumul journalier retenues par les filtres (cout en jours x classes)."""
+        filters = self.filters
+        qs = PresenceDaily.objects.all()
+        if filters.date_from:
+            qs = qs.filter(date__gte=filters.date_from)
+        if filters.date_to:
+            qs = qs.filter(date__lte=filters.date_to)
+        if filters.fenetre:
+            qs = qs.filter(fenetre=filters.fenetre)
+        if filters.prestataire:
+            qs = qs.filter(prestataire_id=filters.prestataire)
+        if filters.region:
+            qs = qs.filter(lieu_id__in=Lieu.objects.filter(region=filters.region).values("id"))
+        return qs.order_by()
+
+    def presence_frame(self) -> pd.DataFrame:
+        def build():
+            rows = self.presence_daily().values_list(*FACT_KEYS).annotate(total=Sum("total"), pr=Sum("present"))
+            return self._with_labels(_frame(rows, [*FACT_KEYS, "total", "pr"]))
+
+        return self._memo("presence", build)
+
+    def presence_dates(self) -> pd.DataFrame:
+        def build():
+            rows = self.presence_daily().values_list("date").annotate(total=Sum("total"), pr=Sum("present"))
+            return _frame(rows, ["date", "total", "pr"])
+
+        return self._memo("presence_dates", build)
+
+    def satisfaction_frame(self, kind: str) -> pd.DataFrame:
+        model, field = SATISFACTION_SOURCES[kind]
+
+        def build():
+            rows = model.objects.values_list("classe_id").annotate(n=Count(field), somme=Sum(field)).order_by()
+            frame = _frame(rows, ["classe_id", "n", "somme"])
+            frame["somme"] = frame["somme"].fillna(0)
+            return self._with_classes(frame)
+
+        return self._memo(f"satisfaction_{kind}", build)
+
+    def apprenant_frame(self) -> pd.DataFrame:
+        def build():
+            rows = (
+                Apprenant.objects.filter(actif=True)
+                .values_list(
+                    "classe_id", "formation_id", "region", "ville_residence", "genre", "appartenance_beneficiaire"
+                )
+                .annotate(total=Count("id"))
+                .order_by()
+            )
+            frame = _frame(rows, ["classe_id", "formation_id", "region", "ville", "genre", "appart", "total"])
+            frame = self._with_classes(frame, axes=("prestation_id", "prestation", "beneficiaire", "prestataire"))
+            formations = _frame(
+                Formation.objects.values_list("id", "nom", "nom_harmonise").order_by(),
+                ["formation_id", "formation", "nom_harmonise"],
+            )
+            frame = frame.merge(formations, how="left", on="formation_id")
+            frame["femmes"] = np.where(frame["genre"].fillna("").str.lower() == "f", frame["total"], 0)
+            frame["appartenance"] = np.where(frame["appart"].fillna(False).astype(bool), frame["total"], 0)
+            return frame
+
+        return self._memo("apprenants", build)
+
+    def environnement_frame(self) -> pd.DataFrame:
+        def build():
+            rows = (
+                EnqueteEnvironnement.objects.values_list("classe_id")
+                .annotate(total=Count("id"), **{f: Sum(f) for f in ENV_FIELDS})
+                .order_by()
+            )
+            frame = _frame(rows, ["classe_id", "total", *ENV_FIELDS]).fillna(0)
+            frame[ENV_FIELDS] = frame[ENV_FIELDS].astype(int)
+            return self._with_classes(frame, axes=("lieu", "region"))
+
+        return self._memo("environnement", build)
+
+    # Agregats ---------------------------------------------------------------------
+    def _axes(self, key: str, frame: pd.DataFrame, axes, measures) -> Dict[str, pd.DataFrame]:
+        if key not in self._rollups:
+            self._rollups[key] = _rollup(frame, axes, measures)
+        return self._rollups[key]
+
+    def presence_totals(self) -> Dict[str, Any]:
+        frame = self.presence_frame()
+        total = int(frame["total"].sum())
+        pr = int(frame["pr"].sum())
+        return {"pr": pr, "total": total, "taux": safe_rate(pr, total)}
+
+    def presence_rates(self, axis: str) -> List[Dict[str, Any]]:
+        grouped = self._axes("presence", self.presence_frame(), CLASSE_AXES, ("total", "pr"))[axis]
+        rows = [
+            {"label": _label(label), "pr": int(r.pr), "total": int(r.total), "taux": safe_rate(int(r.pr), int(r.total))}
+            for label, r in grouped.iterrows()
+        ]
+        return _sorted(rows, "total")
+
+    def presence_timeline(self, granularite: str) -> List[Dict[str, Any]]:
+        """Presence par jour, semaine (debut de semaine) ou mois, en ordre chronologique."""
+        daily = self.presence_dates()
+        if daily.empty:
+            return []
+        periods = pd.to_datetime(daily["date"]).dt.to_period(TIMELINE_FREQUENCIES[granularite])
+        grouped = daily.groupby(periods.rename("periode"))[["total", "pr"]].sum().sort_index()
+        rows = []
+        for periode, r in grouped.iterrows():
+            label = periode.strftime("%Y-%m") if granularite == "mois" else periode.start_time.date().isoformat()
+            pr, total = int(r.pr), int(r.total)
+            rows.append({"label": label, "pr": pr, "total": total, "taux": safe_rate(pr, total)})
+        return rows
+
+    def satisfaction_totals(self, kind: str) -> Dict[str, Any]:
+        frame = self.satisfaction_frame(kind)
+        n = int(frame["n"].sum())
+        somme = float(frame["somme"].sum())
+        return {"n": n, "somme": somme, "moy": somme / n if n else None}
+
+    def satisfaction_means(self, kind: str, axis: str) -> List[Dict[str, Any]]:
+        grouped = self._axes(f"satisfaction_{kind}", self.satisfaction_frame(kind), CLASSE_AXES, ("n", "somme"))[axis]
+        rows = [
+            {"label": _label(label), "moy": float(r.somme) / int(r.n) if int(r.n) else None}
+            for label, r in grouped.iterrows()
+        ]
+        return _sorted(rows, "moy")
+
+    def repartition(self, axis: str) -> List[Dict[str, Any]]:
+        grouped = self._axes("apprenants", self.apprenant_frame(), REPART_AXES, ("total",))[axis]
+        rows = [{"label": _label(label), "total": int(r.total)} for label, r in grouped.iterrows()]
+        return _sorted(rows, "total")
+
+    def prestation_effectifs(self) -> List[Dict[str, Any]]:
+        frame = self.apprenant_frame()
+        per_prestation = (
+            frame.groupby("prestation_id")[["total", "femmes", "appartenance"]].sum()
+            if not frame.empty
+            else pd.DataFrame(columns=["total", "femmes", "appartenance"])
+        )
+        rows = []
+        prestations = Prestation.objects.values(
+            "id",
+            "code",
+            "effectif_a_former",
+            "femmes",
+            "prestataire__raison_sociale",
+            "beneficiaire__nom_structure",
+        ).order_by("code")
+        for p in prestations:
+            counts = per_prestation.loc[p["id"]] if p["id"] in per_prestation.index else None
+            appr_total = int(counts["total"]) if counts is not None else 0
+            appr_femmes = int(counts["femmes"]) if counts is not None else 0
+            appr_appart = int(counts["appartenance"]) if counts is not None else 0
+            rows.append(
+                {
+                    "code": p["code"],
+                    "effectif_a_former": p["effectif_a_former"],
+                    "femmes": p["femmes"],
+                    "appr_total": appr_total,
+                    "appr_femmes": appr_femmes,
+                    "appr_appart": appr_appart,
+                    "prestataire__raison_sociale": p["prestataire__raison_sociale"],
+                    "beneficiaire__nom_structure": p["beneficiaire__nom_structure"],
+                    "respect_effectif": appr_total >= (p["effectif_a_former"] or 0),
+                    "respect_femmes": appr_femmes >= (p["femmes"] or 0),
+                    "taux_appartenance": safe_rate(appr_appart, appr_total),
+                }
+            )
+        return rows
+
+    def environnement_score(self) -> float:
+        frame = self.environnement_frame()
+        return safe_rate(int(frame[ENV_FIELDS].to_numpy().sum()), int(frame["total"].sum()) * len(ENV_FIELDS))
+
+    def environnement_par_lieu(self) -> List[Dict[str, Any]]:
+        frame = self.environnement_frame()
+        if frame.empty:
+            return []
+        grouped = frame.groupby(["lieu", "region"], dropna=False, sort=False)[["total", *ENV_FIELDS]].sum()
+        rows = []
+        for (lieu, region), r in grouped.iterrows():
+            total = int(r["total"])
+            somme = int(sum(int(r[f]) for f in ENV_FIELDS))
+            rows.append(
+                {
+                    "lieu": _label(lieu),
+                    "region": _label(region),
+                    "total": total,
+                    "score": safe_rate(somme, total * len(ENV_FIELDS)),
+                    **{f: int(r[f]) for f in ENV_FIELDS},
+                }
+            )
+        return sorted(rows, key=lambda r: (-r["total"], str(r["lieu"] or "")))
@@ -1,139 +1,259 @@
-from typing import Any, Dict, List
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple
 
-from django.db.models import Avg, Count, Q, Sum
 from django.http import JsonResponse, Http404
 
 from App_PADESCE.apprenants.models import Apprenant
 from App_PADESCE.environnement.models import EnqueteEnvironnement
-from App_PADESCE.formations.models import Formation, Prestation
+from App_PADESCE.formations.models import Classe, Lieu
 from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting.aggregation import DIMENSION_MODELS, AggregationEngine, PresenceFilters
+from App_PADESCE.reporting.cache import DataVersions, cache_stats, cached_payload, data_condition, request_versions
+from App_PADESCE.reporting.forms import PresenceFilterForm
 from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
 from App_PADESCE.satisfaction_formateurs.models import SatisfactionFormateur
 
 
-def safe_rate(num: float, den: float) -> float:
-    return round((num / den) * 100, 2) if den else 0.0
+@dataclass(frozen=True)
+class ChartProvider:
+    """Calcul d'un graphique reporting et modeles dont son resultat depend."""
 
+    code: str
+    compute: Callable[[AggregationEngine], Dict[str, Any]]
+    depends_on: Tuple[type, ...] = ()
+    # Indicateur de presence : accepte les filtres periode/fenetre/region/prestataire.
+    filterable: bool = False
 
-def _presence_rates(field: str) -> List[Dict[str, Any]]:
-    qs = (
-        Presence.objects.values(field)
-        .annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR")))
-        .order_by("-total")
+
+CHART_PROVIDERS: Dict[str, ChartProvider] = {}
+
+
+def register_chart(code: str, depends_on: Tuple[type, ...] = (), filterable: bool = False):
+    """Enregistre un fournisseur de graphique pour `code` (decorateur)."""
+
+    def decorator(func: Callable[[AggregationEngine], Dict[str, Any]]):
+        CHART_PROVIDERS[code] = ChartProvider(
+            code=code, compute=func, depends_on=tuple(depends_on), filterable=filterable
+        )
+        return func
+
+    return decorator
+
+
+# Indicateurs de presence : cumul journalier + dimensions utilisees par les filtres.
+PRESENCE_SOURCES = (Presence, *DIMENSION_MODELS, Lieu)
+
+
+# Gauges RES00-01..05
+@register_chart("RES00-01", depends_on=PRESENCE_SOURCES, filterable=True)
+def _gauge_presence(engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "gauge", "value": engine.presence_totals()["taux"], "max": 100}
+
+
+@register_chart("RES00-02")
+def _gauge_contractuel(engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "gauge", "value": 0, "max": 100, "note": "Synthèse contractuelle à renseigner"}
+
+
+@register_chart("RES00-03", depends_on=(EnqueteEnvironnement,))
+def _gauge_environnement(engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "gauge", "value": engine.environnement_score(), "max": 100}
+
+
+@register_chart("RES00-04", depends_on=(SatisfactionApprenant,))
+def _gauge_sat_apprenants(engine: AggregationEngine) -> Dict[str, Any]:
+    moy = engine.satisfaction_totals("apprenants")["moy"] or 0
+    return {"type": "gauge", "value": moy, "max": 5}
+
+
+@register_chart("RES00-05", depends_on=(SatisfactionFormateur,))
+def _gauge_sat_formateurs(engine: AggregationEngine) -> Dict[str, Any]:
+    moy = engine.satisfaction_totals("formateurs")["moy"] or 0
+    return {"type": "gauge", "value": moy, "max": 5}
+
+
+# Présence par axes
+PRESENCE_AXES = {
+    "RES01-01": "prestataire",
+    "RES01-02": "prestation",
+    "RES01-03": "beneficiaire",
+    "RES01-04": "formation",
+    "RES01-05": "nom_harmonise",
+}
+
+# Présence par période (semaine, mois)
+PRESENCE_TIMELINES = {
+    "RES01-06": "semaine",
+    "RES01-07": "mois",
+}
+
+# Satisfaction apprenants
+SAT_APPR_AXES = {
+    "RES04-02": "prestataire",
+    "RES04-03": "prestation",
+    "RES04-04": "beneficiaire",
+    "RES04-05": "formation",
+    "RES04-06": "nom_harmonise",
+}
+
+# Satisfaction formateurs
+SAT_FORM_AXES = {
+    "RES05-01": "classe",
+}
+
+# Répartition apprenants
+REPART_AXES = {
+    "PER01-01": "region",
+    "PER01-02": "formation",
+    "PER01-03": "beneficiaire",
+    "PER01-04": "prestataire",
+}
+
+def _presence_chart(axis: str, engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "bar", "series": engine.presence_rates(axis)}
+
+
+def _presence_timeline_chart(granularite: str, engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "bar", "series": engine.presence_timeline(granularite)}
+
+
+def _sat_appr_chart(axis: str, engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "bar", "series": engine.satisfaction_means("apprenants", axis)}
+
+
+def _sat_form_chart(axis: str, engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "bar", "series": engine.satisfaction_means("formateurs", axis)}
+
+
+def _repartition_chart(axis: str, engine: AggregationEngine) -> Dict[str, Any]:
+    return {"type": "bar", "series": engine.repartition(axis)}
+
+
+for _code, _axis in PRESENCE_AXES.items():
+    register_chart(_code, depends_on=PRESENCE_SOURCES, filterable=True)(partial(_presence_chart, _axis))
+for _code, _granularite in PRESENCE_TIMELINES.items():
+    register_chart(_code, depends_on=PRESENCE_SOURCES, filterable=True)(
+        partial(_presence_timeline_chart, _granularite)
     )
-    return [
-        {"label": r[field], "pr": r["pr"], "total": r["total"], "taux": safe_rate(r["pr"], r["total"])}
-        for r in qs
-    ]
+for _code, _axis in SAT_APPR_AXES.items():
+    register_chart(_code, depends_on=(SatisfactionApprenant, *DIMENSION_MODELS))(partial(_sat_appr_chart, _axis))
+for _code, _axis in SAT_FORM_AXES.items():
+    register_chart(_code, depends_on=(SatisfactionFormateur, Classe))(partial(_sat_form_chart, _axis))
+for _code, _axis in REPART_AXES.items():
+    register_chart(_code, depends_on=(Apprenant, *DIMENSION_MODELS))(partial(_repartition_chart, _axis))
+
 
+# Carte des lieux
+@register_chart("RES03-01", depends_on=(Lieu,))
+def _carte_lieux(engine: AggregationEngine) -> Dict[str, Any]:
+    data = []
+    for nom_lieu, latitude, longitude in Lieu.objects.values_list("nom_lieu", "latitude", "longitude"):
+        try:
+            lat = float(latitude)
+            lon = float(longitude)
+        except (TypeError, ValueError):
+            continue
+        data.append({"label": nom_lieu, "lat": lat, "lon": lon})
+    return {"type": "map", "points": data}
 
-def _sat_avg(model, field: str, display: str) -> List[Dict[str, Any]]:
-    qs = model.objects.values(display).annotate(moy=Avg(field)).order_by("-moy")
-    return [{"label": r[display], "moy": r["moy"]} for r in qs]
-
-
-def get_chart_data(code: str) -> Dict[str, Any]:
-    code = code.upper()
-    # Gauges RES00-01..05
-    total_pres = Presence.objects.count()
-    total_pr = Presence.objects.filter(presence="PR").count()
-    taux_presence_global = safe_rate(total_pr, total_pres)
-    sat_appr_moy = SatisfactionApprenant.objects.aggregate(m=Avg("q9_satisfaction_globale")).get("m") or 0
-    sat_form_moy = SatisfactionFormateur.objects.aggregate(m=Avg("q9_satisfaction_globale_prestataire")).get("m") or 0
-    env_fields = [
-        "tables",
-        "chaises",
-        "ecran",
-        "videoprojecteur",
-        "ventilation",
-        "eclairage",
-        "salle_propre",
-        "salle_securisee",
+
+# Env table
+@register_chart("RES03-02", depends_on=(EnqueteEnvironnement, Classe, Lieu))
+def _environnement_lieux(engine: AggregationEngine) -> Dict[str, Any]:
+    rows = [
+        {
+            "classe__lieu__nom_lieu": r["lieu"],
+            "classe__lieu__region": r["region"],
+            "total": r["total"],
+            "tables": r["tables"],
+            "chaises": r["chaises"],
+            "ecran": r["ecran"],
+        }
+        for r in engine.environnement_par_lieu()
     ]
-    env_counts = EnqueteEnvironnement.objects.aggregate(
-        total=Count("id"), **{f: Sum(f) for f in env_fields}
-    )
-    env_score = safe_rate(
-        sum((env_counts.get(f) or 0) for f in env_fields),
-        (env_counts.get("total") or 0) * len(env_fields),
+    return {"type": "table", "rows": rows}
+
+
+def chart_sources(code: str) -> Tuple[type, ...] | None:
+    provider = CHART_PROVIDERS.get(code.upper())
+    return None if provider is None else provider.depends_on
+
+
+def get_chart_provider(code: str) -> ChartProvider:
+    provider = CHART_PROVIDERS.get(code.upper())
+    if provider is None:
+        raise Http404(f"Code {code.upper()} non pris en charge")
+    return provider
+
+
+def get_chart_data(
+    code: str,
+    engine: AggregationEngine | None = None,
+    versions: DataVersions | None = None,
+    filters: PresenceFilters | None = None,
+) -> Dict[str, Any]:
+    """Execute uniquement le fournisseur du code demande (servi depuis le cache si les donnees n'ont pas change)."""
+    provider = get_chart_provider(code)
+    filters = filters or (engine.filters if engine else PresenceFilters())
+    key = provider.code
+    if provider.filterable and filters:
+        key = f"{key}:{filters.key()}"
+    return cached_payload(
+        "chart",
+        key,
+        provider.depends_on,
+        lambda: provider.compute(engine or AggregationEngine(filters)),
+        versions=versions,
     )
 
-    gauges = {
-        "RES00-01": {"value": taux_presence_global, "max": 100},
-        "RES00-02": {"value": 0, "max": 100, "note": "Synthèse contractuelle à renseigner"},
-        "RES00-03": {"value": env_score, "max": 100},
-        "RES00-04": {"value": sat_appr_moy, "max": 5},
-        "RES00-05": {"value": sat_form_moy, "max": 5},
-    }
-    if code in gauges:
-        return {"type": "gauge", **gauges[code]}
-
-    # Présence par axes
-    presence_map = {
-        "RES01-01": _presence_rates("classe__prestation__prestataire__raison_sociale"),
-        "RES01-02": _presence_rates("classe__prestation__code"),
-        "RES01-03": _presence_rates("classe__prestation__beneficiaire__nom_structure"),
-        "RES01-04": _presence_rates("classe__formation__nom"),
-        "RES01-05": _presence_rates("classe__formation__nom_harmonise"),
-    }
-    if code in presence_map:
-        return {"type": "bar", "series": presence_map[code]}
-
-    # Satisfaction apprenants
-    sat_appr_map = {
-        "RES04-02": _sat_avg(SatisfactionApprenant, "q9_satisfaction_globale", "classe__prestation__prestataire__raison_sociale"),
-        "RES04-03": _sat_avg(SatisfactionApprenant, "q9_satisfaction_globale", "classe__prestation__code"),
-        "RES04-04": _sat_avg(SatisfactionApprenant, "q9_satisfaction_globale", "classe__prestation__beneficiaire__nom_structure"),
-        "RES04-05": _sat_avg(SatisfactionApprenant, "q9_satisfaction_globale", "classe__formation__nom"),
-        "RES04-06": _sat_avg(SatisfactionApprenant, "q9_satisfaction_globale", "classe__formation__nom_harmonise"),
-    }
-    if code in sat_appr_map:
-        return {"type": "bar", "series": sat_appr_map[code]}
-
-    # Satisfaction formateurs
-    sat_form_map = {
-        "RES05-01": _sat_avg(SatisfactionFormateur, "q9_satisfaction_globale_prestataire", "classe__code"),
-    }
-    if code in sat_form_map:
-        return {"type": "bar", "series": sat_form_map[code]}
-
-    # Répartition apprenants
-    repart_map = {
-        "PER01-01": Apprenant.objects.values("region").annotate(total=Count("id")).order_by("-total"),
-        "PER01-02": Apprenant.objects.values("formation__nom").annotate(total=Count("id")).order_by("-total"),
-        "PER01-03": Apprenant.objects.values("classe__prestation__beneficiaire__nom_structure").annotate(total=Count("id")).order_by("-total"),
-        "PER01-04": Apprenant.objects.values("classe__prestation__prestataire__raison_sociale").annotate(total=Count("id")).order_by("-total"),
-    }
-    if code in repart_map:
-        return {
-            "type": "bar",
-            "series": [{"label": r[next(iter(r.keys()))], "total": r["total"]} for r in repart_map[code]],
-        }
 
-    # Carte des lieux
-    if code == "RES03-01":
-        data = []
-        for lieu in Formation._meta.apps.get_model("formations", "Lieu").objects.all():
-            try:
-                lat = float(lieu.latitude)
-                lon = float(lieu.longitude)
-            except (TypeError, ValueError):
-                continue
-            data.append({"label": lieu.nom_lieu, "lat": lat, "lon": lon})
-        return {"type": "map", "points": data}
-
-    # Env table
-    if code == "RES03-02":
-        qs = (
-            EnqueteEnvironnement.objects.values("classe__lieu__nom_lieu", "classe__lieu__region")
-            .annotate(total=Count("id"), tables=Sum("tables"), chaises=Sum("chaises"), ecran=Sum("ecran"))
-            .order_by("-total")
-        )
-        return {"type": "table", "rows": list(qs)}
+def get_chart_batch(codes: List[str], filters: PresenceFilters | None = None) -> Dict[str, Any]:
+    """Calcule plusieurs codes en partageant les faits charges par le moteur d'agregation."""
+    engine = AggregationEngine(filters)
+    versions = DataVersions()
+    charts: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for code in codes:
+        code = code.strip().upper()
+        if not code or code in charts or code in errors:
+            continue
+        provider = CHART_PROVIDERS.get(code)
+        if provider is None:
+            errors[code] = f"Code {code} non pris en charge"
+            continue
+        charts[code] = get_chart_data(code, engine=engine, versions=versions)
+    return {"charts": charts, "errors": errors}
+
 
-    raise Http404(f"Code {code} non pris en charge")
+def _filter_errors(form: PresenceFilterForm) -> JsonResponse | None:
+    if form.is_valid():
+        return None
+    return JsonResponse({"error": "Filtres invalides.", "details": form.errors}, status=400)
 
 
+@data_condition("chart", chart_sources)
 def api_chart(request, code: str):
-    data = get_chart_data(code)
+    form = PresenceFilterForm(request.GET)
+    errors = _filter_errors(form)
+    if errors:
+        return errors
+    data = get_chart_data(code, versions=request_versions(request), filters=form.to_filters())
     return JsonResponse(data, safe=False)
+
+
+def api_chart_batch(request):
+    codes = [c for c in request.GET.get("codes", "").split(",") if c.strip()]
+    if not codes:
+        return JsonResponse({"error": "Parametre 'codes' manquant."}, status=400)
+    if len(codes) > len(CHART_PROVIDERS):
+        return JsonResponse({"error": "Trop de codes demandes."}, status=400)
+    form = PresenceFilterForm(request.GET)
+    errors = _filter_errors(form)
+    if errors:
+        return errors
+    return JsonResponse(get_chart_batch(codes, filters=form.to_filters()))
+
+
+def api_cache_stats(request):
+    return JsonResponse(cache_stats())
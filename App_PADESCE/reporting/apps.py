@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ReportingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'App_PADESCE.reporting'
+
+    def ready(self) -> None:
+        # Invalidation du snapshot reporting sur les ecritures.
+        import App_PADESCE.reporting.signals  # noqa: F401
+        return super().ready()
@@ -0,0 +1,170 @@
+"""
+Cache des payloads reporting indexe sur les versions de donnees.
+
+Chaque modele source porte un numero de version (`DataVersion`) incremente a chaque
+ecriture : signaux post_save/post_delete, et `invalidate_reporting()` apres les
+operations en masse qui ne declenchent pas les signaux. La cle d'une entree contient
+les versions des modeles dont elle depend : une ecriture change la cle, l'ancienne
+entree n'est plus jamais lue et expire d'elle-meme. Les versions etant lues en base,
+l'invalidation est correcte quel que soit le nombre de processus.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from App_PADESCE.reporting.aggregation import safe_rate
+from App_PADESCE.reporting.models import DataVersion
+from App_PADESCE.reporting.snapshot import mark_snapshots_stale
+
+CACHE_PREFIX = "reporting:v1"
+STATS_NAMESPACES = ("home", "chart", "table")
+
+_MISSING = object()
+
+
+def _label(model) -> str:
+    return model._meta.label_lower
+
+
+def get_reporting_cache():
+    return caches[getattr(settings, "REPORTING_CACHE_ALIAS", "default")]
+
+
+def bump_data_versions(*models) -> None:
+    """Incremente la version des modeles donnes (une requete UPDATE)."""
+    labels = sorted({_label(m) for m in models})
+    if not labels:
+        return
+    now = timezone.now()
+    updated = DataVersion.objects.filter(model__in=labels).update(version=F("version") + 1, updated_at=now)
+    if updated < len(labels):
+        # Premiere ecriture d'un modele : creation de la ligne puis increment, sans perdre
+        # d'increment si deux processus la creent en meme temps.
+        existing = set(DataVersion.objects.filter(model__in=labels).values_list("model", flat=True))
+        missing = [label for label in labels if label not in existing]
+        DataVersion.objects.bulk_create([DataVersion(model=label) for label in missing], ignore_conflicts=True)
+        DataVersion.objects.filter(model__in=missing).update(version=F("version") + 1, updated_at=now)
+
+
+def invalidate_reporting(*models) -> None:
+    """A appeler apres une ecriture sur `models` (signaux, imports et mises a jour en masse)."""
+    bump_data_versions(*models)
+    mark_snapshots_stale()
+
+
+class DataVersions:
+    """
+    Versions courantes lues en une seule requete ; une instance par requete HTTP.
+    Elles sont lues avant tout calcul : une ecriture concurrente ne peut donc qu'associer
+    des donnees plus recentes a une cle deja perimee, jamais l'inverse.
+    """
+
+    def __init__(self):
+        self._rows = {
+            model: (version, updated_at)
+            for model, version, updated_at in DataVersion.objects.values_list("model", "version", "updated_at")
+        }
+
+    def token(self, models: Iterable[type]) -> str:
+        labels = sorted({_label(m) for m in models})
+        return ".".join(str(self._rows.get(label, (0, None))[0]) for label in labels)
+
+    def last_modified(self, models: Iterable[type]) -> Optional[datetime]:
+        dates = [self._rows[_label(m)][1] for m in models if _label(m) in self._rows]
+        dates = [d for d in dates if d is not None]
+        return max(dates) if dates else None
+
+
+def _count(namespace: str, outcome: str) -> None:
+    cache = get_reporting_cache()
+    key = f"{CACHE_PREFIX}:stats:{namespace}:{outcome}"
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def cached_payload(
+    namespace: str,
+    code: str,
+    models: Iterable[type],
+    compute: Callable[[], Any],
+    versions: Optional[DataVersions] = None,
+) -> Any:
+    """Retourne le payload en cache pour les versions courantes de `models`, ou le calcule."""
+    versions = versions or DataVersions()
+    key = f"{CACHE_PREFIX}:{namespace}:{code}:{versions.token(models)}"
+    cache = get_reporting_cache()
+    payload = cache.get(key, _MISSING)
+    if payload is not _MISSING:
+        _count(namespace, "hits")
+        return payload
+    _count(namespace, "misses")
+    payload = compute()
+    cache.set(key, payload, timeout=getattr(settings, "REPORTING_CACHE_TIMEOUT", DEFAULT_TIMEOUT))
+    return payload
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Compteurs hit/miss par famille de payload (depuis le demarrage du cache)."""
+    cache = get_reporting_cache()
+    stats = {}
+    for namespace in STATS_NAMESPACES:
+        hits = cache.get(f"{CACHE_PREFIX}:stats:{namespace}:hits", 0)
+        misses = cache.get(f"{CACHE_PREFIX}:stats:{namespace}:misses", 0)
+        stats[namespace] = {"hits": hits, "misses": misses, "hit_rate": safe_rate(hits, hits + misses)}
+    return stats
+
+
+def request_versions(request) -> DataVersions:
+    """Versions lues une seule fois par requete (validateurs HTTP puis calcul)."""
+    versions = getattr(request, "_reporting_versions", None)
+    if versions is None:
+        versions = request._reporting_versions = DataVersions()
+    return versions
+
+
+def data_condition(namespace: str, sources: Callable[[str], Optional[Iterable[type]]]):
+    """
+    Decorateur de vue `(request, code)` : ETag fort et Last-Modified derives des versions
+    des modeles dont depend `code`. Une requete conditionnelle dont les donnees n'ont pas
+    change recoit un 304 apres la seule lecture des versions, sans agregat.
+    `sources(code)` renvoie None pour un code inconnu (pas de validateur).
+    """
+
+    def etag(request, code: str) -> Optional[str]:
+        models = sources(code)
+        if models is None:
+            return None
+        token = request_versions(request).token(models)
+        # Les parametres (filtres) font partie de la ressource.
+        query = request.GET.urlencode()
+        return hashlib.sha1(f"{CACHE_PREFIX}:{namespace}:{code.lower()}:{token}:{query}".encode()).hexdigest()
+
+    def last_modified(request, code: str) -> Optional[datetime]:
+        models = sources(code)
+        return None if models is None else request_versions(request).last_modified(models)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, code: str):
+            response = conditional_view(request, code)
+            # Les navigateurs (iframes partenaires) revalident a chaque affichage.
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,956 @@
+"""
+Lecture et enregistrement ensembliste d'un fichier consolide.
+
+La feuille "Consolidation" est lue en flux depuis le fichier en attente (ou depuis le
+cache de ses lignes, voir reporting/staging.py) et convertie en ConsolidationRecord.
+
+Chaque referentiel (beneficiaires, prestataires, formations, lieux, prestations, classes)
+est traite en une fois : cles naturelles distinctes du fichier, une lecture de l'existant
+par modele (`__in` par paquets), `bulk_create` des manquants puis resolution des cles
+etrangeres depuis des dictionnaires en memoire. Les apprenants sont ensuite rapproches
+ligne a ligne en memoire (meme regle qu'avant : telephone1 dans la formation, sinon code)
+et ecrits par `bulk_create` / `bulk_update` en paquets.
+
+Une ligne qui ne peut pas etre enregistree (contrainte d'unicite, valeur hors limites,
+formation ou prestataire absent) est rapportee avec son numero de ligne au lieu d'etre
+ignoree en silence.
+"""
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.text import slugify
+from openpyxl import load_workbook
+
+from App_PADESCE.apprenants.models import Apprenant, ImportRow, ImportSession, SmsJob, SmsLog
+from App_PADESCE.core import normalization
+from App_PADESCE.core.importing import HeaderIndex, stream_rows
+from App_PADESCE.core.normalization import clean_cell
+from App_PADESCE.formations.models import Beneficiaire, Classe, Formation, Lieu, Prestataire, Prestation
+from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting.cache import invalidate_reporting
+from App_PADESCE.reporting.models import ConsolidationRecord, PresenceDaily, PresenceFact
+from App_PADESCE.reporting.shadow import (
+    SHADOW_ALIAS,
+    discard_shadow,
+    prepare_shadow,
+    shadow_available,
+    swap_shadow,
+    validate_shadow,
+)
+from App_PADESCE.reporting.snapshot import SNAPSHOT_SOURCES
+from App_PADESCE.reporting.staging import cache_rows, load_rows, upload_path
+from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
+from App_PADESCE.satisfaction_formateurs.models import SatisfactionFormateur
+
+# Taille des listes `__in` et des lots d'ecriture (limite de variables SQLite comprise).
+CHUNK_SIZE = 500
+
+APPRENANT_FIELDS = (
+    "nom_complet",
+    "genre",
+    "age",
+    "fonction",
+    "qualification",
+    "nb_annees_experience",
+    "fenetre",
+    "telephone1",
+    "telephone2",
+    "ville_residence",
+    "region",
+    "departement",
+    "arrondissement",
+    "code_ville",
+    "appartenance_beneficiaire",
+    "actif",
+)
+
+
+MAX_CONSO_COLS = 40  # Augmenté pour être sûr de ne pas couper la colonne Classe ID
+
+# Mapping plus tolérant pour "Classe ID"
+CONSOLIDATION_HEADER_MAP = {
+    "n": "numero",
+    "nom et prenom 0 name first name": "nom_complet",
+    "nom et prenom 0 name and first name": "nom_complet",
+    "beneficiaires": "beneficiaire",
+    "genre h0f 0 gender m0f": "genre",
+    "age": "age",
+    "fonction d c e m b": "fonction",
+    "qualification chiffre 0 1 2 etc": "qualification",
+    "nb d annees d experience chiffre 0 1 2 etc": "nb_annees_experience",
+    "ville de residence de l appprenant": "ville_residence",
+    "prestataire": "prestataire",
+    "type de formation declaree": "intitule_formation_solicitee",
+    "formation padesce": "intitule_formation_dispensee",
+    "fenetre": "fenetre",
+    "ville de la formation": "ville_formation",
+    "arrondissement": "arrondissement",
+    "departement": "departement",
+    "region": "region",
+    "lieux": "lieu_formation",
+    "precision sur le lieu 0 quartier de formation": "precision_lieu",
+    "coordonnees gps du lieu de formation longitude": "longitude",
+    "coordonnees gps du lieu de formation latitude": "latitude",
+    "1er no tel 0 tel no apprenant": "telephone1",
+    "2e no tel 0 tel no apprenant si disponible": "telephone2",
+    "cohorte": "cohorte",
+    "tel formateur 0 point focal sur place": "tel_formateur",
+    "code": "code",
+    "cout unitaire subvention mcdc ttc": "cout_unitaire_subvention",
+    "montant total subvention mcdc ttc": "montant_total_subvention",
+    "statut de la prestation": "statut_prestation",
+
+    # Variantes pour Classe ID – très tolérant
+    "classe id": "classe_id",
+    "class id": "classe_id",
+    "classeid": "classe_id",
+    "classid": "classe_id",
+    "id classe": "classe_id",
+    "classe": "classe_id",               # fallback si "ID" est absent
+    "classe_id": "classe_id",
+    "id de classe": "classe_id",
+    "numero classe": "classe_id",
+    "code classe": "classe_id",
+}
+# Compile une fois : en-tete normalise -> champ ; l'alias le plus haut dans la table l'emporte.
+CONSOLIDATION_INDEX = HeaderIndex.from_mapping(CONSOLIDATION_HEADER_MAP)
+
+
+CONSOLIDATION_TABLES = (
+    PresenceFact,
+    PresenceDaily,
+    SatisfactionApprenant,
+    SatisfactionFormateur,
+    Presence,
+    SmsLog,
+    SmsJob,
+    ImportRow,
+    ImportSession,
+    Apprenant,
+    Classe,
+    Prestation,
+    Formation,
+    Prestataire,
+    Beneficiaire,
+    Lieu,
+)
+
+
+def reset_consolidation_tables(using: str = DEFAULT_DB_ALIAS):
+    """
+    Empty the tables that are rebuilt from consolidation imports using raw SQL to avoid
+    instantiating large querysets and keep the request from timing out.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        needs_toggle = connection.vendor in {"sqlite", "mysql"}
+        if needs_toggle:
+            if connection.vendor == "sqlite":
+                cursor.execute("PRAGMA foreign_keys = OFF")
+            else:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for model in CONSOLIDATION_TABLES:
+            table_name = connection.ops.quote_name(model._meta.db_table)
+            cursor.execute(f"DELETE FROM {table_name}")
+        if needs_toggle:
+            if connection.vendor == "sqlite":
+                cursor.execute("PRAGMA foreign_keys = ON")
+            else:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def iter_consolidation_sheet(file_obj):
+    """
+    Lecture en flux (read_only) de la feuille "Consolidation".
+    Renvoie l'en-tete et un iterateur paresseux de (numero de ligne Excel, cellules
+    normalisees) pour les lignes non vides ; le classeur est ferme en fin de parcours
+    ou a la fermeture de l'iterateur (apercu seul).
+    """
+    wb = load_workbook(file_obj, read_only=True, data_only=True)
+    if "Consolidation" not in wb.sheetnames:
+        wb.close()
+        raise ValueError("Feuille 'Consolidation' introuvable dans le fichier.")
+    ws = wb["Consolidation"]
+    # Stop after the expected columns, including "Classe ID".
+    width = min(ws.max_column or MAX_CONSO_COLS, MAX_CONSO_COLS)
+    rows = ws.iter_rows(values_only=True, max_col=width)
+
+    def normalize(row):
+        cells = [clean_cell(c) for c in row[:width]]
+        return cells + [""] * (width - len(cells))
+
+    first = next(rows, None)
+    header = normalize(first) if first is not None else []
+    if not ws.max_column:
+        # Pas de dimension declaree dans le fichier : largeur donnee par l'en-tete.
+        while header and not header[-1]:
+            header.pop()
+        width = len(header)
+
+    def body():
+        try:
+            for line, row in enumerate(rows, start=2):
+                cells = normalize(row)
+                if any(cells):
+                    yield line, cells
+        finally:
+            wb.close()
+
+    return header, body()
+
+
+def staged_sheet(token: str):
+    """
+    En-tete et lignes du fichier en attente : relues depuis le cache binaire s'il existe,
+    sinon depuis le classeur (le cache est alors ecrit au passage). Le booleen indique si
+    le cache a servi.
+    """
+    cached = load_rows(token)
+    if cached is not None:
+        header, rows = cached
+        return header, rows, True
+    path = upload_path(token)
+    if path is None:
+        raise ValueError("Fichier consolide expire ou introuvable : veuillez le recharger.")
+    header, rows = iter_consolidation_sheet(str(path))
+    return header, cache_rows(token, header, rows), False
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def row_key(data: Dict[str, str]) -> str:
+    """
+    Cle stable d'une ligne : l'identite de l'apprenant, comme pour le rapprochement en base
+    (telephone1 dans la formation, sinon nom dans la classe). Une ligne dont ces champs
+    changent est vue comme une suppression suivie d'un ajout.
+    """
+    formation = (data.get("intitule_formation_dispensee") or data.get("intitule_formation_solicitee") or "").strip()
+    tel = (data.get("telephone1") or "").strip()
+    if tel:
+        identity = ("tel", formation.lower(), tel)
+    else:
+        classe = (data.get("classe_id") or "").strip() or "|".join(
+            (data.get(name) or "").strip() for name in ("prestataire", "fenetre", "cohorte")
+        )
+        identity = ("nom", formation.lower(), classe.lower(), (data.get("nom_complet") or "").strip().lower())
+    return _digest("\x1f".join(identity))
+
+
+def row_hash(data: Dict[str, str]) -> str:
+    """Empreinte du contenu de la ligne (toutes les colonnes reconnues)."""
+    return _digest("\x1f".join(f"{name}={data[name]}" for name in sorted(data)))
+
+
+# Colonnes numeriques des lignes brutes, converties colonne par colonne.
+_RECORD_INTEGERS = ("age", "nb_annees_experience")
+_RECORD_DECIMALS = ("cout_unitaire_subvention", "montant_total_subvention")
+
+
+def rows_to_records(header, rows):
+    """`rows` : iterable de (ligne, cellules). Renvoie les enregistrements, le payload et les lignes."""
+    columns = CONSOLIDATION_INDEX.resolve(header[:MAX_CONSO_COLS])
+    # Lignes sans valeur dans les colonnes reconnues (contenu dans des colonnes sans
+    # en-tete seulement) : ni enregistrement brut ni conflit.
+    sink = stream_rows(columns, rows, skip_empty=True)
+    related_payload, lines = sink.rows, sink.lines
+
+    numbers = {name: normalization.to_int([d.get(name) for d in related_payload]) for name in _RECORD_INTEGERS}
+    numbers.update(
+        {name: normalization.to_decimal([d.get(name) for d in related_payload]) for name in _RECORD_DECIMALS}
+    )
+    records = []
+    occurrences: Dict[str, int] = {}
+    for index, data in enumerate(related_payload):
+        key = row_key(data)
+        occurrences[key] = occurrences.get(key, 0) + 1
+        if occurrences[key] > 1:
+            # Doublon dans le fichier : cle distinguee par son rang d'apparition.
+            key = f"{key}-{occurrences[key]}"
+        records.append(
+            ConsolidationRecord(
+                numero=data.get("numero", ""),
+                nom_complet=data.get("nom_complet", ""),
+                beneficiaire=data.get("beneficiaire", ""),
+                genre=data.get("genre", ""),
+                age=numbers["age"].iat[index],
+                fonction=data.get("fonction", ""),
+                qualification=data.get("qualification", ""),
+                nb_annees_experience=numbers["nb_annees_experience"].iat[index],
+                ville_residence=data.get("ville_residence", ""),
+                prestataire=data.get("prestataire", ""),
+                intitule_formation_solicitee=data.get("intitule_formation_solicitee", ""),
+                intitule_formation_dispensee=data.get("intitule_formation_dispensee", ""),
+                fenetre=data.get("fenetre", ""),
+                ville_formation=data.get("ville_formation", ""),
+                arrondissement=data.get("arrondissement", ""),
+                departement=data.get("departement", ""),
+                region=data.get("region", ""),
+                lieu_formation=data.get("lieu_formation", ""),
+                precision_lieu=data.get("precision_lieu", ""),
+                longitude=data.get("longitude", ""),
+                latitude=data.get("latitude", ""),
+                telephone1=data.get("telephone1", ""),
+                telephone2=data.get("telephone2", ""),
+                cohorte=data.get("cohorte", ""),
+                tel_formateur=data.get("tel_formateur", ""),
+                code=data.get("code", ""),
+                cout_unitaire_subvention=numbers["cout_unitaire_subvention"].iat[index],
+                montant_total_subvention=numbers["montant_total_subvention"].iat[index],
+                statut_prestation=data.get("statut_prestation", ""),
+                row_key=key,
+                row_hash=row_hash(data),
+            )
+        )
+    return records, related_payload, lines
+
+
+def _chunks(values: Sequence, size: int = CHUNK_SIZE) -> Iterator[Sequence]:
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _existing(
+    model, key: str, values: Iterable[str], fields: Sequence[str] = (), using: str = DEFAULT_DB_ALIAS
+) -> Dict[str, Any]:
+    """Instances existantes indexees par `key` (une requete par paquet de valeurs)."""
+    values = sorted(set(values))
+    found = {}
+    for chunk in _chunks(values):
+        qs = model.objects.using(using).filter(**{f"{key}__in": chunk})
+        if fields:
+            qs = qs.only("pk", key, *fields)
+        for obj in qs:
+            found[getattr(obj, key)] = obj
+    return found
+
+
+def _ensure(
+    model,
+    key: str,
+    wanted: Dict[str, Dict[str, Any]],
+    update_fields: Sequence[str] = (),
+    result: "ConsolidationResult" = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Dict[str, Any]:
+    """
+    `wanted` : cle naturelle -> valeurs. Cree les manquants, met a jour `update_fields`
+    des existants qui different, et renvoie cle -> instance (avec pk).
+    """
+    existing = _existing(model, key, wanted, update_fields, using=using)
+    missing = [model(**{key: k, **values}) for k, values in wanted.items() if k not in existing]
+    if missing:
+        model.objects.using(using).bulk_create(missing, batch_size=CHUNK_SIZE)
+        if result is not None:
+            name = model._meta.model_name
+            result.referentiels[name] = result.referentiels.get(name, 0) + len(missing)
+        # Relecture : les pk ne sont pas renvoyes par tous les moteurs.
+        existing.update(_existing(model, key, [getattr(obj, key) for obj in missing], using=using))
+    if update_fields:
+        changed = []
+        for k, obj in existing.items():
+            values = wanted.get(k)
+            if values is None:
+                continue
+            dirty = False
+            for name in update_fields:
+                if name in values and getattr(obj, name) != values[name]:
+                    setattr(obj, name, values[name])
+                    dirty = True
+            if dirty:
+                changed.append(obj)
+        if changed:
+            model.objects.using(using).bulk_update(changed, list(update_fields), batch_size=CHUNK_SIZE)
+    return existing
+
+
+@dataclass
+class ConsolidationResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    referentiels: Dict[str, int] = field(default_factory=dict)  # modele -> nombre de creations
+    conflicts: List[Dict[str, Any]] = field(default_factory=list)
+    apprenant_ids: List[Optional[int]] = field(default_factory=list)  # apprenant de chaque ligne traitee
+    committed: int = 0  # lignes du fichier enregistrees (point de reprise)
+    checkpoint_line: int = 0  # ligne Excel de la derniere ligne enregistree
+
+    def conflict(self, ligne: int, item: Dict[str, Any], motif: str) -> None:
+        self.conflicts.append(
+            {
+                "ligne": ligne,
+                "nom_complet": item.get("nom_complet", ""),
+                "code": (item.get("code") or "").strip(),
+                "telephone1": (item.get("telephone1") or "").strip(),
+                "motif": motif,
+            }
+        )
+
+
+@dataclass
+class _Row:
+    ligne: int
+    item: Dict[str, Any]
+    beneficiaire: str
+    prestataire: str
+    formation: str
+    lieu: str
+    fenetre: str
+    cohorte: str
+    classe_key: str
+    region: str
+    departement: str
+    arrondissement: str
+    ville: str
+    cohorte_num: Optional[int]
+    age: Optional[int]
+    experience: Optional[int]
+    hint: Optional[int] = None  # apprenant deja lie a la ligne (import incremental)
+    apprenant: Optional[Apprenant] = None
+
+
+def _rows(
+    payload: List[Dict[str, Any]], lines: Optional[Sequence[int]], hints: Optional[Sequence[Optional[int]]] = None
+) -> List[_Row]:
+    # Numeriques convertis colonne par colonne (normalization.to_int), pas cellule par cellule.
+    numbers = {
+        name: normalization.to_int([item.get(name) for item in payload]).tolist()
+        for name in ("cohorte", "age", "nb_annees_experience")
+    }
+    rows = []
+    for index, item in enumerate(payload):
+        intitule = item.get("intitule_formation_dispensee") or item.get("intitule_formation_solicitee") or ""
+        rows.append(
+            _Row(
+                ligne=lines[index] if lines else index + 2,
+                item=item,
+                beneficiaire=item.get("beneficiaire", "").strip(),
+                prestataire=item.get("prestataire", "").strip(),
+                formation=str(intitule).strip(),
+                lieu=item.get("lieu_formation", "").strip(),
+                fenetre=item.get("fenetre", "") or "",
+                cohorte=item.get("cohorte", ""),
+                classe_key=(item.get("classe_id") or "").strip(),
+                region=item.get("region", "").strip(),
+                departement=item.get("departement", "").strip(),
+                arrondissement=item.get("arrondissement", "").strip(),
+                ville=item.get("ville_formation", "").strip(),
+                cohorte_num=numbers["cohorte"][index],
+                age=numbers["age"][index],
+                experience=numbers["nb_annees_experience"][index],
+                hint=hints[index] if hints else None,
+            )
+        )
+    return rows
+
+
+def _first_by_lower(rows: List[_Row], attr: str) -> Dict[str, _Row]:
+    """Premiere ligne de chaque valeur distincte (insensible a la casse), dans l'ordre du fichier."""
+    first: Dict[str, _Row] = {}
+    for row in rows:
+        value = getattr(row, attr)
+        if value and value.lower() not in first:
+            first[value.lower()] = row
+    return first
+
+
+def _classe_intitule(formation: Formation) -> str:
+    formation_nom = formation.nom.strip()
+    if len(formation_nom) > 120:
+        formation_nom = formation_nom[:117] + "..."
+    return formation_nom
+
+
+def _resolve_referentiels(rows: List[_Row], result: ConsolidationResult, using: str):
+    """Beneficiaires, prestataires, formations et lieux : une passe ensembliste par modele."""
+    benef_first = _first_by_lower(rows, "beneficiaire")
+    beneficiaires = _ensure(
+        Beneficiaire,
+        "nom_structure",
+        {
+            row.beneficiaire: {
+                "region": row.region,
+                "departement": row.departement,
+                "arrondissement": row.arrondissement,
+                "ville": row.ville,
+            }
+            for row in benef_first.values()
+        },
+        result=result,
+        using=using,
+    )
+
+    prest_first = _first_by_lower(rows, "prestataire")
+    prestataires = _ensure(
+        Prestataire,
+        "code",
+        {row.prestataire[:50]: {"raison_sociale": row.prestataire} for row in prest_first.values()},
+        update_fields=("raison_sociale",),
+        result=result,
+        using=using,
+    )
+
+    form_first = _first_by_lower(rows, "formation")
+    wanted_formations: Dict[str, Dict[str, Any]] = {}
+    for row in form_first.values():
+        values = {"nom": row.formation}
+        if row.fenetre:
+            values["fenetre"] = row.fenetre
+        wanted_formations[row.formation[:50]] = values
+    formations = _ensure(
+        Formation, "code", wanted_formations, update_fields=("nom", "fenetre"), result=result, using=using
+    )
+
+    lieu_first = _first_by_lower(rows, "lieu")
+    _ensure(
+        Lieu,
+        "code",
+        {
+            row.lieu[:50]: {
+                "nom_lieu": row.lieu,
+                "region": row.region,
+                "departement": row.departement,
+                "arrondissement": row.arrondissement,
+                "ville": row.ville,
+                "longitude": row.item.get("longitude", ""),
+                "latitude": row.item.get("latitude", ""),
+                "precision": row.item.get("precision_lieu", ""),
+            }
+            for row in lieu_first.values()
+        },
+        result=result,
+        using=using,
+    )
+
+    resolved = []
+    for row in rows:
+        beneficiaire = (
+            beneficiaires.get(benef_first[row.beneficiaire.lower()].beneficiaire) if row.beneficiaire else None
+        )
+        prestataire = (
+            prestataires.get(prest_first[row.prestataire.lower()].prestataire[:50]) if row.prestataire else None
+        )
+        formation = formations.get(form_first[row.formation.lower()].formation[:50]) if row.formation else None
+        resolved.append((beneficiaire, prestataire, formation))
+    return resolved
+
+
+def _resolve_prestations(
+    rows: List[_Row], refs, result: ConsolidationResult, using: str
+) -> List[Optional[Prestation]]:
+    wanted: Dict[str, Dict[str, Any]] = {}
+    codes: List[Optional[str]] = []
+    for row, (beneficiaire, prestataire, formation) in zip(rows, refs):
+        if not prestataire or not formation:
+            codes.append(None)
+            continue
+        code = ((row.item.get("code") or "").strip() or "null")[:50]
+        codes.append(code)
+        wanted.setdefault(code, {"prestataire": prestataire, "formation": formation, "beneficiaire": beneficiaire})
+    prestations = _ensure(Prestation, "code", wanted, result=result, using=using)
+    return [prestations[code] if code else None for code in codes]
+
+
+def _resolve_classes(
+    rows: List[_Row], refs, prestations, result: ConsolidationResult, using: str
+) -> List[Optional[Classe]]:
+    # Cle de classe -> code, figee par la premiere ligne (comme le cache ligne a ligne precedent).
+    codes_by_key: Dict[str, str] = {}
+    wanted: Dict[str, Dict[str, Any]] = {}
+    codes: List[Optional[str]] = []
+    for row, (_, _, formation), prestation in zip(rows, refs, prestations):
+        if not prestation or not formation:
+            # Sans prestation, seule une classe deja vue plus haut (meme Classe ID) est reprise.
+            codes.append(codes_by_key.get(row.classe_key.lower()) if row.classe_key else None)
+            continue
+        key = row.classe_key.lower() or f"{prestation.pk}-{row.fenetre}-{row.cohorte}".lower()
+        code = codes_by_key.get(key)
+        if code is None:
+            code_raw = row.classe_key or f"CL-{formation.code[:6] or 'XX'}-{row.fenetre or 'X'}-{row.cohorte or '1'}"
+            code = codes_by_key[key] = code_raw[:20]
+            wanted.setdefault(
+                code,
+                {
+                    "prestation": prestation,
+                    "formation": formation,
+                    "intitule_formation": _classe_intitule(formation),
+                    "fenetre": row.fenetre or "",
+                    "cohorte": row.cohorte_num or 1,
+                },
+            )
+        codes.append(code)
+    classes = _ensure(Classe, "code", wanted, update_fields=("intitule_formation",), result=result, using=using)
+    return [classes[code] if code else None for code in codes]
+
+
+def _apprenant_values(row: _Row) -> Dict[str, Any]:
+    item = row.item
+    tel1 = (item.get("telephone1") or "").strip()
+    tel2 = (item.get("telephone2") or "").strip()
+    return {
+        "nom_complet": item.get("nom_complet", ""),
+        "genre": item.get("genre", ""),
+        "age": row.age,
+        "fonction": item.get("fonction", ""),
+        "qualification": item.get("qualification", ""),
+        "nb_annees_experience": row.experience or 0,
+        "fenetre": row.fenetre,
+        "telephone1": tel1 or None,
+        "telephone2": tel2 or None,
+        "ville_residence": item.get("ville_residence", ""),
+        "region": row.region,
+        "departement": row.departement,
+        "arrondissement": row.arrondissement,
+        "code_ville": item.get("ville_formation", ""),
+        "appartenance_beneficiaire": True,
+        "actif": True,
+    }
+
+
+def _invalid_value(code: str, values: Dict[str, Any]) -> Optional[str]:
+    limits = {name: Apprenant._meta.get_field(name).max_length for name in ("code", "telephone1", "telephone2")}
+    if len(code) > limits["code"]:
+        return f"code de plus de {limits['code']} caracteres"
+    for name in ("telephone1", "telephone2"):
+        if values[name] and len(values[name]) > limits[name]:
+            return f"{name} de plus de {limits[name]} caracteres"
+    if values["age"] is not None and values["age"] < 0:
+        return "age negatif"
+    if values["nb_annees_experience"] < 0:
+        return "nombre d'annees d'experience negatif"
+    return None
+
+
+def _save_apprenants(rows: List[_Row], refs, classes, result: ConsolidationResult, using: str) -> None:
+    apprenants = Apprenant.objects.using(using)
+    candidates: List[Tuple[_Row, Formation, Classe]] = []
+    for row, (_, _, formation), classe in zip(rows, refs, classes):
+        if classe and formation:
+            candidates.append((row, formation, classe))
+        elif not formation:
+            result.conflict(row.ligne, row.item, "formation absente : apprenant non cree")
+        else:
+            result.conflict(row.ligne, row.item, "prestataire absent : classe et apprenant non crees")
+    if not candidates:
+        return
+
+    tels = [v for v in {(r.item.get("telephone1") or "").strip() for r, _, _ in candidates} if v]
+    codes = set()
+    for row, _, classe in candidates:
+        code = (row.item.get("code") or "").strip()
+        codes.add(code or f"AP-{slugify(row.item.get('nom_complet', ''))[:6]}-{classe.code[:6]}")
+    classe_ids = sorted({classe.pk for _, _, classe in candidates})
+    hints = sorted({row.hint for row, _, _ in candidates if row.hint})
+
+    # Existant utile : par (formation, telephone1), par code et par (classe, nom) pour les contraintes.
+    known: Dict[int, Apprenant] = {}
+    for chunk in _chunks(sorted(tels)):
+        for obj in apprenants.filter(telephone1__in=chunk).order_by("pk"):
+            known.setdefault(obj.pk, obj)
+    for chunk in _chunks(sorted(codes)):
+        for obj in apprenants.filter(code__in=chunk):
+            known.setdefault(obj.pk, obj)
+    for chunk in _chunks(classe_ids):
+        for obj in apprenants.filter(classe_id__in=chunk).only(
+            "pk", "code", "classe_id", "formation_id", "nom_complet", "telephone1"
+        ):
+            known.setdefault(obj.pk, obj)
+    for chunk in _chunks(hints):
+        for obj in apprenants.filter(pk__in=chunk):
+            known.setdefault(obj.pk, obj)
+
+    by_tel: Dict[Tuple[int, str], Apprenant] = {}
+    by_code: Dict[str, Apprenant] = {}
+    by_nom: Dict[Tuple[int, str], Apprenant] = {}
+    for obj in sorted(known.values(), key=lambda o: o.pk):
+        if obj.telephone1 and obj.formation_id:
+            by_tel.setdefault((obj.formation_id, obj.telephone1), obj)
+        by_code[obj.code] = obj
+        by_nom[(obj.classe_id, obj.nom_complet)] = obj
+    origin: Dict[int, int] = {}  # id(objet) -> ligne qui l'a cree ou modifie
+    created: List[Apprenant] = []
+    updated: Dict[int, Apprenant] = {}
+
+    for row, formation, classe in candidates:
+        values = _apprenant_values(row)
+        code = (row.item.get("code") or "").strip()
+        if not code:
+            code = f"AP-{slugify(row.item.get('nom_complet', ''))[:6]}-{classe.code[:6]}"
+        motif = _invalid_value(code, values)
+        if motif:
+            result.conflict(row.ligne, row.item, motif)
+            continue
+
+        tel1 = values["telephone1"]
+        target = by_tel.get((formation.pk, tel1)) if tel1 else None
+        hinted = known.get(row.hint) if row.hint else None
+        if hinted is not None and target is None:
+            # Apprenant deja lie a la ligne : repris meme si son telephone a change.
+            target = hinted
+            if target.telephone1 and by_tel.get((target.formation_id, target.telephone1)) is target:
+                del by_tel[(target.formation_id, target.telephone1)]
+            if tel1:
+                by_tel[(formation.pk, tel1)] = target
+        holder = by_nom.get((classe.pk, values["nom_complet"]))
+        if holder is not None and holder is not target:
+            ligne = origin.get(id(holder))
+            source = f"ligne {ligne}" if ligne else f"apprenant {holder.code}"
+            result.conflict(row.ligne, row.item, f"nom deja present dans la classe {classe.code} ({source})")
+            continue
+
+        if target is not None:
+            # Meme telephone1 dans la formation : mise a jour de l'apprenant existant.
+            by_nom.pop((target.classe_id, target.nom_complet), None)
+            for name, value in values.items():
+                setattr(target, name, value)
+            target.classe = classe
+            target.formation = formation
+            by_nom[(classe.pk, target.nom_complet)] = target
+            origin[id(target)] = row.ligne
+            row.apprenant = target
+            if target.pk is not None:
+                updated[target.pk] = target
+            continue
+
+        if code in by_code:
+            holder = by_code[code]
+            ligne = origin.get(id(holder))
+            source = f"ligne {ligne}" if ligne else "un apprenant existant"
+            result.conflict(row.ligne, row.item, f"code {code} deja attribue ({source})")
+            continue
+
+        obj = Apprenant(code=code, classe=classe, formation=formation, **values)
+        created.append(obj)
+        by_code[code] = obj
+        by_nom[(classe.pk, obj.nom_complet)] = obj
+        if tel1:
+            by_tel[(formation.pk, tel1)] = obj
+        origin[id(obj)] = row.ligne
+        row.apprenant = obj
+
+    for chunk in _chunks(created):
+        apprenants.bulk_create(chunk)
+    missing_pk = [obj for obj in created if obj.pk is None]
+    if missing_pk:
+        # Moteurs sans RETURNING : pk relus par code.
+        pks = {}
+        for chunk in _chunks([obj.code for obj in missing_pk]):
+            pks.update(apprenants.filter(code__in=chunk).values_list("code", "pk"))
+        for obj in missing_pk:
+            obj.pk = pks.get(obj.code)
+    if updated:
+        apprenants.bulk_update(
+            list(updated.values()), [*APPRENANT_FIELDS, "classe", "formation"], batch_size=CHUNK_SIZE
+        )
+    result.created += len(created)
+    result.updated += len(updated)
+
+
+Progress = Callable[[str, ConsolidationResult], None]
+
+# Frequence des notifications d'avancement pendant la lecture des lignes.
+PROGRESS_EVERY = 2000
+
+
+def batch_size() -> int:
+    """Lignes du fichier par transaction en mise a jour incrementale (CONSOLIDATION_BATCH_SIZE)."""
+    return max(1, int(getattr(settings, "CONSOLIDATION_BATCH_SIZE", 2000)))
+
+
+def save_related_from_payload(
+    payload: List[Dict[str, Any]],
+    lines: Optional[Sequence[int]] = None,
+    progress: Optional[Progress] = None,
+    result: Optional[ConsolidationResult] = None,
+    hints: Optional[Sequence[Optional[int]]] = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> ConsolidationResult:
+    """
+    Cree ou met a jour referentiels, classes et apprenants a partir des lignes du fichier.
+    `lines` : numero de ligne (feuille Excel) de chaque element de `payload` ; `hints` :
+    apprenant deja lie a chaque ligne (import incremental).
+    Referentiels puis apprenants sont ecrits chacun dans leur transaction ; `progress`
+    est appele apres chaque etape (visible des autres connexions hors transaction englobante).
+    """
+    result = result or ConsolidationResult()
+    rows = _rows(payload, lines, hints)
+    with transaction.atomic(using=using):
+        refs = _resolve_referentiels(rows, result, using)
+        prestations = _resolve_prestations(rows, refs, result, using)
+        classes = _resolve_classes(rows, refs, prestations, result, using)
+    if progress:
+        progress("apprenants", result)
+    with transaction.atomic(using=using):
+        _save_apprenants(rows, refs, classes, result, using)
+    result.apprenant_ids = [row.apprenant.pk if row.apprenant else None for row in rows]
+    return result
+
+
+def _read_staged(token: str, result: ConsolidationResult, progress: Optional[Progress]):
+    header, rows, _ = staged_sheet(token)
+
+    def counted(source):
+        for item in source:
+            result.rows += 1
+            if progress and result.rows % PROGRESS_EVERY == 0:
+                progress("lecture", result)
+            yield item
+
+    records, payload, lines = rows_to_records(header, counted(rows))
+    result.rows = len(records)
+    if not records:
+        raise ValueError("Aucune ligne valide a enregistrer.")
+    if progress:
+        progress("referentiels", result)
+    return records, payload, lines
+
+
+def _load_replacement(records, payload, lines, result, progress, using: str) -> None:
+    with transaction.atomic(using=using):
+        ConsolidationRecord.objects.using(using).all().delete()
+    save_related_from_payload(payload, lines=lines, progress=progress, result=result, using=using)
+    for record, apprenant_id in zip(records, result.apprenant_ids):
+        record.apprenant_id = apprenant_id
+    with transaction.atomic(using=using):
+        ConsolidationRecord.objects.using(using).bulk_create(records, batch_size=CHUNK_SIZE)
+
+
+def replace_from_staged(token: str, progress: Optional[Progress] = None) -> ConsolidationResult:
+    """
+    Remplacement complet a partir d'un fichier en attente (voir reporting/staging.py) :
+    lecture des lignes, referentiels et apprenants, puis lignes brutes liees a leur
+    apprenant. Utilise par le worker des imports (reporting/jobs.py).
+
+    Sous SQLite, l'import est construit et controle dans la base fantome puis bascule en
+    une transaction (voir reporting/shadow.py) : un import en echec ne touche pas la base.
+    Sinon, les tables sont videes puis remplies en place. Tout ou rien : un remplacement
+    interrompu reprend du debut.
+    """
+    result = ConsolidationResult()
+    records, payload, lines = _read_staged(token, result, progress)
+    if shadow_available():
+        try:
+            prepare_shadow()
+            _load_replacement(records, payload, lines, result, progress, using=SHADOW_ALIAS)
+            validate_shadow({ConsolidationRecord: len(records)})
+            if progress:
+                progress("bascule", result)
+            swap_shadow(CONSOLIDATION_TABLES + (ConsolidationRecord,))
+            result.committed, result.checkpoint_line = len(records), lines[-1]
+        finally:
+            discard_shadow()
+        invalidate_reporting(*SNAPSHOT_SOURCES)
+        return result
+
+    # Vidage avant insertion, meme si l'insertion echoue ensuite (comportement "remplacement").
+    reset_consolidation_tables()
+    invalidate_reporting(*SNAPSHOT_SOURCES)
+    try:
+        _load_replacement(records, payload, lines, result, progress, using=DEFAULT_DB_ALIAS)
+    finally:
+        invalidate_reporting(*SNAPSHOT_SOURCES)
+    return result
+
+
+def _changed(record: ConsolidationRecord, existing) -> bool:
+    # Ligne deja enregistree sans apprenant (conflit) : retraitee, le conflit a pu disparaitre.
+    known = existing.get(record.row_key)
+    return not (known and known[2] and known[3] is not None and known[1] == record.row_hash)
+
+
+def _apply_batch(todo: List[int], records, payload, lines, existing, result: ConsolidationResult) -> None:
+    save_related_from_payload(
+        [payload[i] for i in todo],
+        lines=[lines[i] for i in todo],
+        result=result,
+        hints=[existing[records[i].row_key][3] if records[i].row_key in existing else None for i in todo],
+    )
+    created, changed = [], []
+    for index, apprenant_id in zip(todo, result.apprenant_ids):
+        record = records[index]
+        record.apprenant_id = apprenant_id
+        known = existing.get(record.row_key)
+        if known:
+            record.pk = known[0]
+            changed.append(record)
+        else:
+            created.append(record)
+    record_fields = [
+        f.name for f in ConsolidationRecord._meta.concrete_fields if not f.primary_key and f.name != "created_at"
+    ]
+    ConsolidationRecord.objects.bulk_create(created, batch_size=CHUNK_SIZE)
+    ConsolidationRecord.objects.bulk_update(changed, record_fields, batch_size=CHUNK_SIZE)
+
+
+def _deactivate(gone: List[Tuple[int, Optional[int]]]) -> None:
+    for chunk in _chunks([pk for pk, _ in gone]):
+        ConsolidationRecord.objects.filter(pk__in=chunk).update(actif=False)
+    # Apprenants des lignes disparues, sauf s'ils sont encore portes par une ligne active.
+    orphans = {apprenant_id for _, apprenant_id in gone if apprenant_id}
+    for chunk in _chunks(sorted(orphans)):
+        orphans -= set(
+            ConsolidationRecord.objects.filter(actif=True, apprenant_id__in=chunk).values_list(
+                "apprenant_id", flat=True
+            )
+        )
+    for chunk in _chunks(sorted(orphans)):
+        Apprenant.objects.filter(pk__in=chunk).update(actif=False)
+
+
+def apply_incremental(
+    token: str, progress: Optional[Progress] = None, checkpoint: Optional[ConsolidationResult] = None
+) -> ConsolidationResult:
+    """
+    Mise a jour incrementale : chaque ligne est comparee, par sa cle et son empreinte, aux
+    lignes deja enregistrees. Seules les lignes nouvelles ou modifiees passent par les
+    referentiels et les apprenants ; les lignes disparues du fichier sont desactivees
+    (ainsi que leur apprenant s'il n'est plus porte par aucune ligne). Presences, enquetes
+    et SMS ne sont pas touches.
+
+    Les lignes sont enregistrees par lots de CONSOLIDATION_BATCH_SIZE lignes du fichier,
+    chacun dans sa transaction : le verrou d'ecriture est rendu entre deux lots et
+    `progress("enregistrement", ...)` est appele dans la transaction du lot (point de
+    reprise : `committed` lignes du fichier). Avec `checkpoint` (etat a la fin du dernier
+    lot valide d'un import interrompu), l'import reprend apres ces lignes.
+    """
+    result = checkpoint or ConsolidationResult()
+    result.rows = 0
+    records, payload, lines = _read_staged(token, result, progress)
+    existing: Dict[str, Tuple[int, str, bool, Optional[int]]] = {}
+    for pk, key, digest, actif, apprenant_id in (
+        ConsolidationRecord.objects.exclude(row_key="")
+        .order_by("pk")
+        .values_list("pk", "row_key", "row_hash", "actif", "apprenant_id")
+        .iterator(chunk_size=CHUNK_SIZE * 4)
+    ):
+        existing.setdefault(key, (pk, digest, actif, apprenant_id))
+
+    seen = {record.row_key for record in records}
+    gone = [(pk, apprenant_id) for key, (pk, _, actif, apprenant_id) in existing.items() if actif and key not in seen]
+    size = batch_size()
+    try:
+        for begin in range(min(result.committed, len(records)), len(records), size):
+            stop = min(begin + size, len(records))
+            todo = [index for index in range(begin, stop) if _changed(records[index], existing)]
+            with transaction.atomic():
+                if todo:
+                    _apply_batch(todo, records, payload, lines, existing, result)
+                result.unchanged += stop - begin - len(todo)
+                result.committed = stop
+                result.checkpoint_line = lines[stop - 1]
+                if progress:
+                    progress("enregistrement", result)
+        if gone:
+            with transaction.atomic():
+                _deactivate(gone)
+        result.deleted = len(gone)
+    finally:
+        if result.committed or gone:
+            invalidate_reporting(*SNAPSHOT_SOURCES)
+    return result
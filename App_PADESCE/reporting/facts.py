@@ -0,0 +1,193 @@
+"""
+Table de faits des presences (`PresenceFact`) et cumul journalier (`PresenceDaily`).
+
+Chaque presence y est copiee avec les identifiants entiers des dimensions de sa classe
+(prestation, prestataire, beneficiaire, formation, lieu), la fenetre, la date et un
+drapeau present : les agregats de presence se font par GROUP BY sur cette seule table,
+sans jointure. Le cumul classe x date porte les memes dimensions ; il est tenu par
+increments (une mise a jour par cellule touchee), ce qui permet de filtrer par periode
+en O(jours x classes). Les deux tables sont tenues a jour par les signaux de
+reporting/signals.py et reconstruites avec `python manage.py rebuild_presence_facts`.
+"""
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+
+from App_PADESCE.formations.models import Classe, Prestation
+from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting.models import PresenceDaily, PresenceFact
+
+# Champ du fait -> chemin depuis Classe.
+FACT_DIMENSIONS = {
+    "classe_id": "id",
+    "prestation_id": "prestation_id",
+    "prestataire_id": "prestation__prestataire_id",
+    "beneficiaire_id": "prestation__beneficiaire_id",
+    "formation_id": "formation_id",
+    "lieu_id": "lieu_id",
+    "fenetre": "fenetre",
+}
+
+# Cellule du cumul journalier occupee par une presence : (classe, date, present).
+Cell = Tuple[int, date, bool]
+
+
+def classe_dimensions(classe_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, object]]:
+    """Dimensions a plat par classe (toutes les classes si `classe_ids` est None)."""
+    qs = Classe.objects.all()
+    if classe_ids is not None:
+        qs = qs.filter(pk__in=list(classe_ids))
+    rows = qs.values_list(*FACT_DIMENSIONS.values()).order_by()
+    return {row[0]: dict(zip(FACT_DIMENSIONS, row)) for row in rows}
+
+
+def _stale(dims: Dict[str, object]) -> Q:
+    """Faits dont au moins une dimension differe de `dims` (les NULL compris)."""
+    condition = Q()
+    for field, value in dims.items():
+        condition |= ~Q(**{field: value})
+    return condition
+
+
+def _copy_presences(where: str, params: Iterable[object] = ()) -> int:
+    """
+    Copie dans la table de faits les presences retenues par `where` (alias p), en un
+    seul INSERT ... SELECT cote base : aucune ligne ne transite par Python.
+    """
+    qn = connection.ops.quote_name
+    presence, classe, prestation = (m._meta.db_table for m in (Presence, Classe, Prestation))
+    columns = ", ".join(qn(c) for c in ("presence_id", *FACT_DIMENSIONS, "date", "present"))
+    sql = (
+        f"INSERT INTO {qn(PresenceFact._meta.db_table)} ({columns}) "
+        f"SELECT p.{qn('id')}, c.{qn('id')}, c.{qn('prestation_id')}, ps.{qn('prestataire_id')}, "
+        f"ps.{qn('beneficiaire_id')}, c.{qn('formation_id')}, c.{qn('lieu_id')}, c.{qn('fenetre')}, "
+        f"p.{qn('date')}, p.{qn('presence')} = %s "
+        f"FROM {qn(presence)} p "
+        f"INNER JOIN {qn(classe)} c ON c.{qn('id')} = p.{qn('classe_id')} "
+        f"INNER JOIN {qn(prestation)} ps ON ps.{qn('id')} = c.{qn('prestation_id')} "
+        f"WHERE {where}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, ["PR", *params])
+        return cursor.rowcount
+
+
+def presence_cell(presence: Presence) -> Cell:
+    return presence.classe_id, presence.date, presence.presence == "PR"
+
+
+def sync_presence_fact(presence: Presence, created: bool = False) -> Tuple[Optional[Cell], Cell]:
+    """
+    Cree ou met a jour le fait d'une presence enregistree. Renvoie la cellule journaliere
+    occupee avant l'ecriture (None si aucun fait) et celle occupee apres.
+    """
+    where = f"p.{connection.ops.quote_name('id')} = %s"
+    cell = presence_cell(presence)
+    if created:
+        _copy_presences(where, [presence.pk])
+        return None, cell
+    current = PresenceFact.objects.filter(presence_id=presence.pk).values_list("classe_id", "date", "present").first()
+    if current is None or current[0] != presence.classe_id:
+        # Fait absent ou presence changee de classe : dimensions a relire.
+        PresenceFact.objects.filter(presence_id=presence.pk).delete()
+        _copy_presences(where, [presence.pk])
+    elif current[1:] != cell[1:]:
+        PresenceFact.objects.filter(presence_id=presence.pk).update(date=presence.date, present=cell[2])
+    return current, cell
+
+
+def refresh_daily_cells(cells: Iterable[Tuple[int, date]]) -> None:
+    """Recompte depuis les faits les cellules (classe, date) du cumul journalier."""
+    for classe_id, day in set(cells):
+        rows = list(
+            PresenceFact.objects.filter(classe_id=classe_id, date=day)
+            .values_list(*FACT_DIMENSIONS)
+            .annotate(total=Count("pk"), nb_present=Count("pk", filter=Q(present=True)))
+            .order_by()
+        )
+        if not rows:
+            PresenceDaily.objects.filter(classe_id=classe_id, date=day).delete()
+            continue
+        *dims, total, present = rows[0]
+        PresenceDaily.objects.update_or_create(
+            classe_id=classe_id,
+            date=day,
+            defaults={**dict(zip(FACT_DIMENSIONS, dims)), "present": present, "absent": total - present, "total": total},
+        )
+
+
+def _shift_daily(cell: Cell, step: int) -> None:
+    """Ajoute (step=1) ou retire (step=-1) une presence d'une cellule ; la recompte si elle manque ou se vide."""
+    classe_id, day, present = cell
+    counter = "present" if present else "absent"
+    cells = PresenceDaily.objects.filter(classe_id=classe_id, date=day)
+    if step > 0:
+        updated = cells.update(total=F("total") + 1, **{counter: F(counter) + 1})
+    else:
+        remaining = cells.filter(**{f"{counter}__gt": 0})
+        updated = remaining.filter(total__gt=1).update(total=F("total") - 1, **{counter: F(counter) - 1})
+        if not updated:
+            # Derniere presence de la cellule : la cellule disparait.
+            updated, _ = remaining.filter(total=1).delete()
+    if not updated:
+        refresh_daily_cells([(classe_id, day)])
+
+
+def apply_daily_change(old: Optional[Cell], new: Optional[Cell]) -> None:
+    """Reporte sur le cumul journalier le passage d'une presence de la cellule `old` a `new` (None : aucune)."""
+    if old == new:
+        return
+    if old and new and old[:2] == new[:2]:
+        # Meme classe, meme jour : seul le statut change.
+        gained, lost = ("present", "absent") if new[2] else ("absent", "present")
+        cells = PresenceDaily.objects.filter(classe_id=new[0], date=new[1], **{f"{lost}__gt": 0})
+        if not cells.update(**{gained: F(gained) + 1, lost: F(lost) - 1}):
+            refresh_daily_cells([new[:2]])
+        return
+    if old:
+        _shift_daily(old, -1)
+    if new:
+        _shift_daily(new, 1)
+
+
+def refresh_classe_facts(classe_ids: Iterable[int]) -> int:
+    """Reporte sur les faits et le cumul un changement de dimensions (prestation, lieu, fenetre...) des classes."""
+    updated = 0
+    for classe_id, dims in classe_dimensions(classe_ids).items():
+        updated += PresenceFact.objects.filter(classe_id=classe_id).filter(_stale(dims)).update(**dims)
+        PresenceDaily.objects.filter(classe_id=classe_id).filter(_stale(dims)).update(**dims)
+    return updated
+
+
+def refresh_prestation_facts(prestation: Prestation) -> int:
+    """Reporte sur les faits et le cumul un changement de prestataire ou de beneficiaire d'une prestation."""
+    dims = {"prestataire_id": prestation.prestataire_id, "beneficiaire_id": prestation.beneficiaire_id}
+    PresenceDaily.objects.filter(prestation_id=prestation.pk).filter(_stale(dims)).update(**dims)
+    return PresenceFact.objects.filter(prestation_id=prestation.pk).filter(_stale(dims)).update(**dims)
+
+
+def rebuild_daily_rollup(batch_size: int = 2000) -> int:
+    """Reconstruit le cumul journalier depuis la table de faits."""
+    PresenceDaily.objects.all().delete()
+    rows = (
+        PresenceFact.objects.values_list(*FACT_DIMENSIONS, "date")
+        .annotate(total=Count("pk"), nb_present=Count("pk", filter=Q(present=True)))
+        .order_by()
+    )
+    cells = [
+        PresenceDaily(**dict(zip(FACT_DIMENSIONS, dims)), date=day, present=present, absent=total - present, total=total)
+        for *dims, day, total, present in rows
+    ]
+    PresenceDaily.objects.bulk_create(cells, batch_size=batch_size)
+    return len(cells)
+
+
+def rebuild_presence_facts() -> int:
+    """Reconstruit entierement la table de faits depuis Presence, puis le cumul journalier."""
+    with transaction.atomic():
+        PresenceFact.objects.all().delete()
+        created = _copy_presences("1 = 1")
+        rebuild_daily_rollup()
+    return created
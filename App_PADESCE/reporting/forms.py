@@ -1,5 +1,7 @@
 from django import forms
 
+from App_PADESCE.reporting.aggregation import PresenceFilters
+
 
 class ConsolidationUploadForm(forms.Form):
     fichier = forms.FileField(
@@ -8,3 +10,31 @@ class ConsolidationUploadForm(forms.Form):
         help_text="Fichier Excel consolide (feuille 'Consolidation').",
         required=False,
     )
+
+
+class PresenceFilterForm(forms.Form):
+    date_from = forms.DateField(label="Du", required=False, widget=forms.DateInput(attrs={"type": "date"}))
+    date_to = forms.DateField(label="Au", required=False, widget=forms.DateInput(attrs={"type": "date"}))
+    fenetre = forms.CharField(label="Fenetre", max_length=50, required=False)
+    region = forms.CharField(label="Region", max_length=120, required=False)
+    prestataire = forms.IntegerField(label="Prestataire", min_value=1, required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        date_from, date_to = cleaned.get("date_from"), cleaned.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("La date de debut doit preceder la date de fin.")
+        return cleaned
+
+    def to_filters(self) -> PresenceFilters:
+        """Filtres valides (aucun filtre si le formulaire est vide ou invalide)."""
+        if not self.is_bound or not self.is_valid():
+            return PresenceFilters()
+        data = self.cleaned_data
+        return PresenceFilters(
+            date_from=data.get("date_from"),
+            date_to=data.get("date_to"),
+            fenetre=(data.get("fenetre") or "").strip(),
+            region=(data.get("region") or "").strip(),
+            prestataire=data.get("prestataire"),
+        )
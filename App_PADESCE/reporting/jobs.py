@@ -0,0 +1,175 @@
+"""
+Imports consolides en arriere-plan, sans broker externe.
+
+La vue cree un ConsolidationJob (file d'attente en base) et rend la main ; la commande
+`run_consolidation_jobs`, lancee dans son propre processus, reserve les jobs un par un
+(mise a jour conditionnelle du statut) et publie l'avancement dans la ligne du job,
+lue par l'endpoint JSON de suivi. Les imports remplacent toutes les donnees : un seul
+worker doit tourner.
+
+La mise a jour incrementale valide ses lignes par lots et enregistre un point de reprise
+avec chaque lot (`rows_committed`) : un job interrompu (arret du worker) est remis en file
+au demarrage suivant, un job en echec peut etre relance, et tous deux reprennent apres le
+dernier lot valide. Le remplacement complet, tout ou rien, reprend du debut.
+"""
+import logging
+from typing import Optional
+
+from django.db.models import F
+from django.utils import timezone
+
+from App_PADESCE.reporting.consolidation import ConsolidationResult, apply_incremental, replace_from_staged
+from App_PADESCE.reporting.models import ConsolidationJob
+from App_PADESCE.reporting.staging import purge_expired
+
+logger = logging.getLogger(__name__)
+
+# Tentatives d'un job avant abandon (arrets du worker en cours d'import compris).
+MAX_ATTEMPTS = 3
+# Jobs dont le fichier en attente doit survivre a la purge : en file, en cours, ou en
+# echec (encore relancable depuis la page de consolidation).
+KEEP_UPLOAD_STATUSES = (*ConsolidationJob.ACTIVE, ConsolidationJob.FAILED)
+
+RUNNERS = {
+    ConsolidationJob.REPLACE: replace_from_staged,
+    ConsolidationJob.INCREMENTAL: apply_incremental,
+}
+
+
+def enqueue_consolidation(
+    token: str, file_name: str = "", user=None, mode: str = ConsolidationJob.REPLACE
+) -> ConsolidationJob:
+    """Met le fichier en attente dans la file ; un job deja actif pour ce fichier et ce mode est reutilise."""
+    if mode not in RUNNERS:
+        raise ValueError(f"Mode d'import inconnu : {mode}")
+    job = (
+        ConsolidationJob.objects.filter(token=token, mode=mode, status__in=ConsolidationJob.ACTIVE)
+        .order_by("pk")
+        .first()
+    )
+    if job is not None:
+        return job
+    return ConsolidationJob.objects.create(
+        token=token,
+        file_name=file_name[:255],
+        mode=mode,
+        created_by=user if getattr(user, "is_authenticated", False) else None,
+    )
+
+
+def purge_staged_uploads(ttl: Optional[int] = None) -> int:
+    """Purge des fichiers en attente expires (reporting/staging.py), hors fichiers des jobs a conserver."""
+    tokens = ConsolidationJob.objects.filter(status__in=KEEP_UPLOAD_STATUSES).values_list("token", flat=True)
+    return purge_expired(ttl, keep=tokens)
+
+
+def claim_next_job() -> Optional[ConsolidationJob]:
+    """Reserve le plus ancien job en attente (None si la file est vide)."""
+    while True:
+        job = ConsolidationJob.objects.filter(status=ConsolidationJob.QUEUED).order_by("created_at", "pk").first()
+        if job is None:
+            return None
+        claimed = ConsolidationJob.objects.filter(pk=job.pk, status=ConsolidationJob.QUEUED).update(
+            status=ConsolidationJob.RUNNING, stage="lecture", started_at=timezone.now(), attempts=F("attempts") + 1
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def requeue_interrupted_jobs() -> tuple:
+    """
+    Jobs restes "en cours" apres l'arret brutal du worker precedent : remis en file pour
+    reprise, sauf au-dela de MAX_ATTEMPTS tentatives. Renvoie (remis en file, en echec).
+    """
+    interrupted = ConsolidationJob.objects.filter(status=ConsolidationJob.RUNNING)
+    failed = interrupted.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ConsolidationJob.FAILED,
+        error="Import interrompu (arret du worker) : nombre maximal de tentatives atteint.",
+        finished_at=timezone.now(),
+    )
+    requeued = interrupted.update(status=ConsolidationJob.QUEUED, stage="reprise")
+    return requeued, failed
+
+
+def resume_job(job: ConsolidationJob) -> bool:
+    """Remet en file un job en echec ; il reprendra apres son dernier lot valide."""
+    return bool(
+        ConsolidationJob.objects.filter(pk=job.pk, status=ConsolidationJob.FAILED).update(
+            status=ConsolidationJob.QUEUED, stage="reprise", error="", finished_at=None, attempts=0
+        )
+    )
+
+
+def _checkpoint(job: ConsolidationJob) -> Optional[ConsolidationResult]:
+    """Etat du dernier lot valide d'un import incremental a reprendre."""
+    if job.mode != ConsolidationJob.INCREMENTAL or not job.rows_committed:
+        return None
+    return ConsolidationResult(
+        created=job.apprenants_created,
+        updated=job.apprenants_updated,
+        unchanged=job.rows_unchanged,
+        referentiels=dict(job.referentiels),
+        conflicts=list(job.conflicts),
+        committed=job.rows_committed,
+        checkpoint_line=job.checkpoint_line,
+    )
+
+
+def _counts(result: ConsolidationResult) -> dict:
+    return {
+        "rows_parsed": result.rows,
+        "referentiels_created": sum(result.referentiels.values()),
+        "referentiels": result.referentiels,
+        "apprenants_created": result.created,
+        "apprenants_updated": result.updated,
+        "rows_unchanged": result.unchanged,
+        "rows_deleted": result.deleted,
+        "rows_committed": result.committed,
+        "checkpoint_line": result.checkpoint_line,
+        "conflicts": result.conflicts,
+    }
+
+
+def run_job(job: ConsolidationJob) -> ConsolidationJob:
+    """Execute un job reserve et enregistre son etat final."""
+    jobs = ConsolidationJob.objects.filter(pk=job.pk)
+
+    def progress(stage: str, result: ConsolidationResult) -> None:
+        jobs.update(stage=stage, **_counts(result))
+
+    checkpoint = _checkpoint(job)
+    if checkpoint is not None:
+        logger.info("Reprise de l'import consolide. job=%s apres %s lignes", job.pk, checkpoint.committed)
+    try:
+        if checkpoint is not None:
+            result = RUNNERS[job.mode](job.token, progress=progress, checkpoint=checkpoint)
+        else:
+            result = RUNNERS[job.mode](job.token, progress=progress)
+    except Exception as exc:
+        logger.exception("Import consolide en echec. job=%s", job.pk)
+        jobs.update(
+            status=ConsolidationJob.FAILED,
+            error=str(exc) or exc.__class__.__name__,
+            finished_at=timezone.now(),
+        )
+    else:
+        jobs.update(
+            status=ConsolidationJob.DONE,
+            stage="termine",
+            finished_at=timezone.now(),
+            **_counts(result),
+        )
+        logger.info(
+            "Import consolide termine. job=%s mode=%s lignes=%s inchangees=%s desactivees=%s crees=%s maj=%s conflits=%s",
+            job.pk,
+            job.mode,
+            result.rows,
+            result.unchanged,
+            result.deleted,
+            result.created,
+            result.updated,
+            len(result.conflicts),
+        )
+    job.refresh_from_db()
+    return job
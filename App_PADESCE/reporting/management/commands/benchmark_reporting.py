@@ -0,0 +1,130 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from App_PADESCE.reporting.api import CHART_PROVIDERS
+from App_PADESCE.reporting.cache import get_reporting_cache
+from App_PADESCE.reporting.snapshot import mark_snapshots_stale
+from App_PADESCE.reporting.views import TABLE_SOURCES
+
+EXPORT_URLS = (
+    "reporting_export_csv",
+    "reporting_export_excel",
+    "presences_export_csv",
+    "satisfaction_apprenants_export_csv",
+    "satisfaction_formateurs_export_csv",
+    "environnement_export_csv",
+    "messaging_contacts_export",
+)
+BENCHMARK_USERNAME = "reporting-benchmark"
+
+
+def _endpoints():
+    endpoints = [("reporting_home", reverse("reporting_index"))]
+    endpoints += [(f"api_chart:{code}", reverse("reporting_api_chart", args=[code])) for code in sorted(CHART_PROVIDERS)]
+    endpoints.append(
+        ("api_chart_batch", f"{reverse('reporting_api_batch')}?codes={','.join(sorted(CHART_PROVIDERS))}")
+    )
+    endpoints += [(f"table:{code}", reverse("reporting_embed_table", args=[code])) for code in sorted(TABLE_SOURCES)]
+    endpoints += [(f"export:{name}", reverse(name)) for name in EXPORT_URLS]
+    return endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure les endpoints reporting via le client de test : temps, nombre de requetes SQL et pic "
+        "memoire (tracemalloc), en JSON. A lancer sur une base remplie par seed_reporting_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=3, help="Nombre de mesures par endpoint (mediane).")
+        parser.add_argument(
+            "--mode",
+            choices=["cold", "warm", "both"],
+            default="both",
+            help="cold : cache vide et snapshot obsolete avant chaque appel ; warm : apres un premier appel.",
+        )
+        parser.add_argument("--only", default="", help="Filtre sur le nom des endpoints (sous-chaine).")
+        parser.add_argument("--output", help="Fichier JSON de sortie (stdout par defaut).")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat doit etre >= 1.")
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={"is_staff": True, "is_superuser": True}
+        )
+        client = Client()
+        client.force_login(user)
+        modes = ["cold", "warm"] if options["mode"] == "both" else [options["mode"]]
+        endpoints = [(name, url) for name, url in _endpoints() if options["only"] in name]
+
+        results = []
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name, url in endpoints:
+                for mode in modes:
+                    results.append(self._measure(client, name, url, mode, options["repeat"]))
+                    self.stderr.write(f"{name} [{mode}] {results[-1]['wall_ms']} ms")
+
+        report = {
+            "database": connection.vendor,
+            "repeat": options["repeat"],
+            "results": results,
+        }
+        payload = json.dumps(report, indent=2, ensure_ascii=False)
+        if options.get("output"):
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                fh.write(payload)
+            self.stdout.write(self.style.SUCCESS(f"Rapport ecrit dans {options['output']}"))
+        else:
+            self.stdout.write(payload)
+
+    def _reset(self):
+        get_reporting_cache().clear()
+        mark_snapshots_stale()
+
+    def _call(self, client, url):
+        # secure=True : pas de redirection HTTPS quand DEBUG=False.
+        response = client.get(url, secure=True)
+        if getattr(response, "streaming", False):
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response.status_code, size
+
+    def _measure(self, client, name, url, mode, repeat):
+        if mode == "warm":
+            self._call(client, url)
+        timings, queries, peaks = [], [], []
+        status, size = None, 0
+        for _ in range(repeat):
+            if mode == "cold":
+                self._reset()
+            tracemalloc.start()
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                status, size = self._call(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            queries.append(len(captured))
+        return {
+            "endpoint": name,
+            "url": url,
+            "mode": mode,
+            "status": status,
+            "bytes": size,
+            "wall_ms": round(statistics.median(timings), 2),
+            "wall_ms_min": round(min(timings), 2),
+            "queries": max(queries),
+            "peak_memory_kib": round(max(peaks) / 1024, 1),
+        }
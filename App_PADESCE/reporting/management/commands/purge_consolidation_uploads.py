@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from App_PADESCE.reporting.jobs import purge_staged_uploads
+from App_PADESCE.reporting.staging import staging_dir, staging_ttl
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les fichiers de consolidation en attente inutilises depuis CONSOLIDATION_STAGING_TTL secondes "
+        "(sauf ceux d'un import en file, en cours ou en echec)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl", type=int, help="Duree de conservation en secondes (defaut : CONSOLIDATION_STAGING_TTL).")
+
+    def handle(self, *args, **options):
+        ttl = staging_ttl() if options["ttl"] is None else options["ttl"]
+        if ttl < 0:
+            raise CommandError("--ttl doit etre >= 0.")
+        removed = purge_staged_uploads(ttl)
+        self.stdout.write(self.style.SUCCESS(f"{removed} fichiers supprimes dans {staging_dir()}."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting.cache import invalidate_reporting
+from App_PADESCE.reporting.facts import rebuild_presence_facts
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table de faits des presences (PresenceFact) depuis Presence."
+
+    def handle(self, *args, **options):
+        created = rebuild_presence_facts()
+        invalidate_reporting(Presence)
+        self.stdout.write(self.style.SUCCESS(f"{created} faits de presence reconstruits."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from App_PADESCE.reporting.snapshot import refresh_home_snapshot
+
+
+class Command(BaseCommand):
+    help = "Recalcule le snapshot des indicateurs du tableau de bord reporting."
+
+    def handle(self, *args, **options):
+        snapshot = refresh_home_snapshot()
+        self.stdout.write(
+            self.style.SUCCESS(f"Snapshot '{snapshot.key}' recalcule en {snapshot.duration_ms} ms.")
+        )
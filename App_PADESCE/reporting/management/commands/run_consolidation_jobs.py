@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from App_PADESCE.reporting.jobs import claim_next_job, requeue_interrupted_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker des imports consolides : execute les ConsolidationJob en attente, dans l'ordre. "
+        "Un seul worker a la fois (les imports remplacent toutes les donnees)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Traite la file puis s'arrete.")
+        parser.add_argument("--poll", type=float, default=2.0, help="Attente (s) entre deux lectures de la file vide.")
+
+    def handle(self, *args, **options):
+        if options["poll"] <= 0:
+            raise CommandError("--poll doit etre > 0.")
+        requeued, failed = requeue_interrupted_jobs()
+        if requeued:
+            self.stderr.write(f"{requeued} job(s) interrompu(s) remis en file (reprise au dernier lot valide).")
+        if failed:
+            self.stderr.write(f"{failed} job(s) interrompu(s) marque(s) en echec (tentatives epuisees).")
+        try:
+            while True:
+                job = claim_next_job()
+                if job is None:
+                    if options["once"]:
+                        return
+                    time.sleep(options["poll"])
+                    continue
+                self.stdout.write(f"Job {job.pk} ({job.file_name or job.token}) demarre.")
+                job = run_job(job)
+                if job.status == job.DONE:
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"Job {job.pk} termine ({job.mode}) : {job.rows_parsed} lignes dont {job.rows_unchanged} "
+                            f"inchangees, {job.rows_deleted} desactivees, {job.apprenants_created} apprenants crees, "
+                            f"{job.apprenants_updated} mis a jour, {len(job.conflicts)} lignes rejetees."
+                        )
+                    )
+                else:
+                    self.stderr.write(f"Job {job.pk} en echec : {job.error}")
+        except KeyboardInterrupt:
+            self.stdout.write("Arret du worker.")
@@ -0,0 +1,304 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.core.sequences import max_numbered
+from App_PADESCE.environnement.models import EnqueteEnvironnement
+from App_PADESCE.formations.models import Beneficiaire, Classe, Formateur, Formation, Lieu, Prestataire, Prestation
+from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting.cache import invalidate_reporting
+from App_PADESCE.reporting.facts import rebuild_presence_facts
+from App_PADESCE.reporting.snapshot import SNAPSHOT_SOURCES
+from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
+from App_PADESCE.satisfaction_formateurs.models import SatisfactionFormateur
+
+# Regions et poids relatifs (les grandes villes concentrent les classes).
+REGIONS = {
+    "Centre": 22,
+    "Littoral": 20,
+    "Ouest": 12,
+    "Nord-Ouest": 8,
+    "Sud-Ouest": 8,
+    "Extreme-Nord": 8,
+    "Nord": 7,
+    "Adamaoua": 5,
+    "Est": 5,
+    "Sud": 5,
+}
+VILLES = {
+    "Centre": ["Yaounde", "Mbalmayo", "Obala"],
+    "Littoral": ["Douala", "Edea", "Nkongsamba"],
+    "Ouest": ["Bafoussam", "Dschang", "Foumban"],
+    "Nord-Ouest": ["Bamenda", "Kumbo"],
+    "Sud-Ouest": ["Buea", "Limbe", "Kumba"],
+    "Extreme-Nord": ["Maroua", "Kousseri"],
+    "Nord": ["Garoua", "Guider"],
+    "Adamaoua": ["Ngaoundere", "Meiganga"],
+    "Est": ["Bertoua", "Batouri"],
+    "Sud": ["Ebolowa", "Kribi"],
+}
+FENETRES = {"Fenetre 1": 50, "Fenetre 2": 35, "Fenetre 3": 15}
+NOTES = [1, 2, 3, 4, 5]
+NOTES_POIDS = [3, 7, 20, 42, 28]
+PREFIX = "SYN"
+
+
+def _weighted(rng: random.Random, weights: dict):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _zipf_weights(n: int):
+    # Quelques prestataires / formations portent l'essentiel du volume.
+    return [1 / (i + 1) for i in range(n)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Remplit une base jetable avec des donnees synthetiques (classes, apprenants, presences, "
+        "enquetes) pour mesurer le reporting. Voir aussi benchmark_reporting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--presences", type=int, default=10000, help="Nombre de presences (ex. 10000, 100000, 1000000).")
+        parser.add_argument("--apprenants", type=int, default=5000)
+        parser.add_argument("--classes", type=int, default=300)
+        parser.add_argument("--prestataires", type=int, default=25)
+        parser.add_argument("--beneficiaires", type=int, default=40)
+        parser.add_argument("--formations", type=int, default=60)
+        parser.add_argument("--lieux", type=int, default=80)
+        parser.add_argument("--taux-satisfaction", type=float, default=0.6, help="Part des apprenants ayant repondu.")
+        parser.add_argument("--seed", type=int, default=42, help="Graine aleatoire (jeux reproductibles).")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help=(
+                "Autorise l'ajout dans une base qui contient deja des donnees : les codes "
+                "synthetiques reprennent apres les derniers deja presents."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if not options["force"] and (Classe.objects.exists() or Presence.objects.exists()):
+            raise CommandError("La base contient deja des donnees : utilisez une base jetable ou --force.")
+        if options["classes"] < 1 or options["apprenants"] < options["classes"]:
+            raise CommandError("Il faut au moins une classe et au moins autant d'apprenants que de classes.")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        started = time.monotonic()
+        with transaction.atomic():
+            classes = self._seed_referentiel(options)
+            apprenants = self._seed_apprenants(classes, options["apprenants"])
+            nb_presences = self._seed_presences(classes, apprenants, options["presences"])
+            nb_sat = self._seed_enquetes(classes, apprenants, options["taux_satisfaction"])
+        rebuild_presence_facts()
+        invalidate_reporting(*SNAPSHOT_SOURCES)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(classes)} classes, {len(apprenants)} apprenants, {nb_presences} presences, "
+                f"{nb_sat} satisfactions apprenants generes en {time.monotonic() - started:.1f} s."
+            )
+        )
+
+    # Referentiel -------------------------------------------------------------------
+    def _seed_referentiel(self, options):
+        rng = self.rng
+        first = max_numbered(Prestataire, f"{PREFIX}-PR") + 1
+        prestataires = Prestataire.objects.bulk_create(
+            [
+                Prestataire(code=f"{PREFIX}-PR{i:04d}", raison_sociale=f"Prestataire {i:04d}")
+                for i in range(first, first + options["prestataires"])
+            ]
+        )
+        beneficiaires = Beneficiaire.objects.bulk_create(
+            [
+                Beneficiaire(nom_structure=f"Beneficiaire {i:04d}", region=_weighted(rng, REGIONS))
+                for i in range(options["beneficiaires"])
+            ]
+        )
+        first = max_numbered(Formation, f"{PREFIX}-F") + 1
+        formations = Formation.objects.bulk_create(
+            [
+                Formation(
+                    code=f"{PREFIX}-F{i:04d}",
+                    nom=f"Formation {i:04d}",
+                    nom_harmonise=f"Filiere {i % max(1, options['formations'] // 4):03d}",
+                    fenetre=_weighted(rng, FENETRES),
+                )
+                for i in range(first, first + options["formations"])
+            ]
+        )
+        lieux = []
+        first = max_numbered(Lieu, f"{PREFIX}-L") + 1
+        for i in range(first, first + options["lieux"]):
+            region = _weighted(rng, REGIONS)
+            lieux.append(
+                Lieu(
+                    code=f"{PREFIX}-L{i:04d}",
+                    nom_lieu=f"Centre {i:04d}",
+                    region=region,
+                    ville=rng.choice(VILLES[region]),
+                    latitude=f"{rng.uniform(2.0, 12.0):.5f}",
+                    longitude=f"{rng.uniform(9.0, 16.0):.5f}",
+                )
+            )
+        lieux = Lieu.objects.bulk_create(lieux)
+        first = max_numbered(Formateur, f"{PREFIX}-FM") + 1
+        formateurs = Formateur.objects.bulk_create(
+            [
+                Formateur(code=f"{PREFIX}-FM{i:05d}", nom_complet=f"Formateur {i:05d}")
+                for i in range(first, first + max(1, options["classes"] // 2))
+            ]
+        )
+
+        prestataire_poids = _zipf_weights(len(prestataires))
+        formation_poids = _zipf_weights(len(formations))
+        nb_prestations = max(1, options["classes"] // 3)
+        prestations = []
+        first = max_numbered(Prestation, f"{PREFIX}-PS") + 1
+        for i in range(first, first + nb_prestations):
+            effectif = rng.randint(15, 60)
+            prestations.append(
+                Prestation(
+                    code=f"{PREFIX}-PS{i:05d}",
+                    prestataire=rng.choices(prestataires, weights=prestataire_poids)[0],
+                    formation=rng.choices(formations, weights=formation_poids)[0],
+                    beneficiaire=rng.choice(beneficiaires) if beneficiaires and rng.random() < 0.9 else None,
+                    effectif_a_former=effectif,
+                    femmes=int(effectif * rng.uniform(0.2, 0.6)),
+                    duree_prevue_heures=rng.choice([40, 60, 80, 120]),
+                    duree_reelle_heures=rng.choice([36, 40, 60, 80, 120]),
+                )
+            )
+        prestations = Prestation.objects.bulk_create(prestations)
+
+        classes = []
+        first = max_numbered(Classe, f"{PREFIX}-C") + 1
+        for i in range(options["classes"]):
+            prestation = prestations[i % len(prestations)]
+            classes.append(
+                Classe(
+                    code=f"{PREFIX}-C{first + i:05d}",
+                    prestation=prestation,
+                    formation=prestation.formation,
+                    lieu=rng.choice(lieux) if lieux else None,
+                    intitule_formation=prestation.formation.nom,
+                    formateur=rng.choice(formateurs),
+                    fenetre=_weighted(rng, FENETRES),
+                    cohorte=rng.randint(1, 3),
+                    statut=rng.choice(["en_cours", "en_cours", "termine", "non_demarre"]),
+                )
+            )
+        return Classe.objects.bulk_create(classes, batch_size=self.batch_size)
+
+    # Apprenants --------------------------------------------------------------------
+    def _seed_apprenants(self, classes, total):
+        rng = self.rng
+        apprenants = []
+        first = max_numbered(Apprenant, PREFIX) + 1
+        for n in range(total):
+            # Chaque classe recoit au moins un apprenant, le reste au hasard.
+            classe = classes[n] if n < len(classes) else rng.choice(classes)
+            region = _weighted(rng, REGIONS)
+            apprenants.append(
+                Apprenant(
+                    code=f"{PREFIX}{first + n:07d}",
+                    classe=classe,
+                    formation_id=classe.formation_id,
+                    nom_complet=f"Apprenant {first + n:07d}",
+                    genre="F" if rng.random() < 0.42 else "M",
+                    age=rng.randint(18, 55),
+                    telephone1=f"6{first + n:08d}",
+                    region=region,
+                    ville_residence=rng.choice(VILLES[region]),
+                    fenetre=classe.fenetre,
+                    appartenance_beneficiaire=rng.random() < 0.7,
+                )
+            )
+        return Apprenant.objects.bulk_create(apprenants, batch_size=self.batch_size)
+
+    # Presences ---------------------------------------------------------------------
+    def _seed_presences(self, classes, apprenants, total):
+        rng = self.rng
+        # Assiduite propre a chaque classe, centree autour de 80 %.
+        assiduite = {c.pk: rng.betavariate(8, 2) for c in classes}
+        debut = {c.pk: date(2025, 1, 6) + timedelta(days=rng.randint(0, 300)) for c in classes}
+        par_apprenant, reste = divmod(total, len(apprenants))
+        batch = []
+        created = 0
+        for index, apprenant in enumerate(apprenants):
+            seances = par_apprenant + (1 if index < reste else 0)
+            jour = debut[apprenant.classe_id]
+            for _ in range(seances):
+                while jour.weekday() >= 5:
+                    jour += timedelta(days=1)
+                present = rng.random() < assiduite[apprenant.classe_id]
+                batch.append(
+                    Presence(
+                        classe_id=apprenant.classe_id,
+                        apprenant_id=apprenant.pk,
+                        date=jour,
+                        presence="PR" if present else "AB",
+                        statut="present" if present else "absent",
+                    )
+                )
+                jour += timedelta(days=1)
+                if len(batch) >= self.batch_size:
+                    Presence.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+        if batch:
+            Presence.objects.bulk_create(batch)
+            created += len(batch)
+        return created
+
+    # Enquetes ----------------------------------------------------------------------
+    def _notes(self, fields):
+        return {f: self.rng.choices(NOTES, weights=NOTES_POIDS)[0] for f in fields}
+
+    def _seed_enquetes(self, classes, apprenants, taux):
+        rng = self.rng
+        appr_fields = [f.name for f in SatisfactionApprenant._meta.fields if f.name.startswith("q")]
+        form_fields = [f.name for f in SatisfactionFormateur._meta.fields if f.name.startswith("q")]
+        env_fields = [f.name for f in EnqueteEnvironnement._meta.fields if f.get_internal_type() == "BooleanField"]
+        jour = date(2025, 11, 1)
+
+        batch = []
+        nb_sat = 0
+        for apprenant in apprenants:
+            if rng.random() >= taux:
+                continue
+            batch.append(
+                SatisfactionApprenant(
+                    classe_id=apprenant.classe_id, apprenant_id=apprenant.pk, date=jour, **self._notes(appr_fields)
+                )
+            )
+            if len(batch) >= self.batch_size:
+                SatisfactionApprenant.objects.bulk_create(batch)
+                nb_sat += len(batch)
+                batch = []
+        if batch:
+            SatisfactionApprenant.objects.bulk_create(batch)
+            nb_sat += len(batch)
+
+        SatisfactionFormateur.objects.bulk_create(
+            [
+                SatisfactionFormateur(classe=c, formateur_id=c.formateur_id, date=jour, **self._notes(form_fields))
+                for c in classes
+            ],
+            batch_size=self.batch_size,
+        )
+        EnqueteEnvironnement.objects.bulk_create(
+            [
+                EnqueteEnvironnement(classe=c, date=jour, **{f: rng.random() < 0.75 for f in env_fields})
+                for c in classes
+                for _ in range(rng.randint(1, 2))
+            ],
+            batch_size=self.batch_size,
+        )
+        return nb_sat
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_presence_facts(apps, schema_editor):
+    Classe = apps.get_model("formations", "Classe")
+    Presence = apps.get_model("presences", "Presence")
+    PresenceFact = apps.get_model("reporting", "PresenceFact")
+    dimensions = {
+        row[0]: {
+            "classe_id": row[0],
+            "prestation_id": row[1],
+            "prestataire_id": row[2],
+            "beneficiaire_id": row[3],
+            "formation_id": row[4],
+            "lieu_id": row[5],
+            "fenetre": row[6],
+        }
+        for row in Classe.objects.values_list(
+            "id",
+            "prestation_id",
+            "prestation__prestataire_id",
+            "prestation__beneficiaire_id",
+            "formation_id",
+            "lieu_id",
+            "fenetre",
+        )
+    }
+    batch = []
+    for presence_id, classe_id, date, statut in Presence.objects.values_list("id", "classe_id", "date", "presence").iterator():
+        if classe_id in dimensions:
+            batch.append(PresenceFact(presence_id=presence_id, date=date, present=statut == "PR", **dimensions[classe_id]))
+        if len(batch) >= 2000:
+            PresenceFact.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PresenceFact.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formations', '0002_prestation_durees_jalons'),
+        ('presences', '0001_initial'),
+        ('reporting', '0004_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresenceFact',
+            fields=[
+                ('presence', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fact', serialize=False, to='presences.presence')),
+                ('date', models.DateField()),
+                ('fenetre', models.CharField(blank=True, max_length=50)),
+                ('present', models.BooleanField(default=False)),
+                ('beneficiaire', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.beneficiaire')),
+                ('classe', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.classe')),
+                ('formation', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.formation')),
+                ('lieu', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.lieu')),
+                ('prestataire', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.prestataire')),
+                ('prestation', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.prestation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'classe'], name='reporting_p_date_6e1761_idx')],
+            },
+        ),
+        migrations.RunPython(populate_presence_facts, migrations.RunPython.noop),
+    ]
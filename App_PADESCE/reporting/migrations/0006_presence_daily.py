@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DIMENSIONS = ("classe_id", "prestation_id", "prestataire_id", "beneficiaire_id", "formation_id", "lieu_id", "fenetre")
+
+
+def populate_presence_daily(apps, schema_editor):
+    PresenceFact = apps.get_model("reporting", "PresenceFact")
+    PresenceDaily = apps.get_model("reporting", "PresenceDaily")
+    rows = (
+        PresenceFact.objects.values_list(*DIMENSIONS, "date")
+        .annotate(total=models.Count("pk"), nb_present=models.Count("pk", filter=models.Q(present=True)))
+        .order_by()
+    )
+    PresenceDaily.objects.bulk_create(
+        [
+            PresenceDaily(**dict(zip(DIMENSIONS, dims)), date=day, present=present, absent=total - present, total=total)
+            for *dims, day, total, present in rows
+        ],
+        batch_size=2000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formations', '0002_prestation_durees_jalons'),
+        ('reporting', '0005_presence_fact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresenceDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fenetre', models.CharField(blank=True, max_length=50)),
+                ('date', models.DateField()),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('absent', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('beneficiaire', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.beneficiaire')),
+                ('classe', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.classe')),
+                ('formation', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.formation')),
+                ('lieu', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.lieu')),
+                ('prestataire', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.prestataire')),
+                ('prestation', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formations.prestation')),
+            ],
+            options={
+                'ordering': ['date', 'classe'],
+                'indexes': [models.Index(fields=['date'], name='reporting_p_date_762912_idx')],
+                'constraints': [models.UniqueConstraint(fields=('classe', 'date'), name='presence_daily_unique')],
+            },
+        ),
+        migrations.RunPython(populate_presence_daily, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apprenants', '0006_import_columns'),
+        ('reporting', '0007_consolidation_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consolidationjob',
+            name='mode',
+            field=models.CharField(choices=[('replace', 'Remplacement complet'), ('incremental', 'Mise a jour incrementale')], default='replace', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='consolidationjob',
+            name='rows_deleted',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='consolidationjob',
+            name='rows_unchanged',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='consolidationrecord',
+            name='actif',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='consolidationrecord',
+            name='apprenant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='apprenants.apprenant'),
+        ),
+        migrations.AddField(
+            model_name='consolidationrecord',
+            name='row_hash',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='consolidationrecord',
+            name='row_key',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='consolidationrecord',
+            index=models.Index(fields=['row_key'], name='reporting_c_row_key_be41c3_idx'),
+        ),
+    ]
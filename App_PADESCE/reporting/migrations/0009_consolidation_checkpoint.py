@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0008_consolidation_incremental'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consolidationjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='consolidationjob',
+            name='checkpoint_line',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='consolidationjob',
+            name='rows_committed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0009_consolidation_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consolidationjob',
+            name='referentiels',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 
@@ -32,6 +34,14 @@ class ConsolidationRecord(models.Model):
     montant_total_subvention = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
     statut_prestation = models.CharField(max_length=50, blank=True)
 
+    # Empreintes de la ligne pour l'import incremental (voir reporting/consolidation.py).
+    row_key = models.CharField(max_length=40, blank=True)
+    row_hash = models.CharField(max_length=32, blank=True)
+    apprenant = models.ForeignKey(
+        "apprenants.Apprenant", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    actif = models.BooleanField(default=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -39,7 +49,201 @@ class ConsolidationRecord(models.Model):
         indexes = [
             models.Index(fields=["code"]),
             models.Index(fields=["nom_complet"]),
+            models.Index(fields=["row_key"]),
         ]
 
     def __str__(self) -> str:
         return f"{self.code or self.numero} - {self.nom_complet}"
+
+
+class ReportingSnapshot(models.Model):
+    """Indicateurs du tableau de bord reporting, materialises pour une lecture par cle."""
+
+    HOME = "home"
+
+    key = models.CharField(max_length=50, unique=True)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    stale = models.BooleanField(default=True)
+    computed_at = models.DateTimeField(null=True, blank=True)
+    invalidated_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["key"]
+
+    def __str__(self) -> str:
+        state = "obsolete" if self.stale else "a jour"
+        return f"Snapshot {self.key} ({state})"
+
+
+class DataVersion(models.Model):
+    """Version des donnees d'un modele source du reporting, incrementee a chaque ecriture."""
+
+    model = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["model"]
+
+    def __str__(self) -> str:
+        return f"{self.model} v{self.version}"
+
+
+class PresenceFact(models.Model):
+    """
+    Presence mise a plat pour le reporting : identifiants des dimensions de la classe,
+    date et drapeau present. Tenue a jour par signaux (voir reporting/facts.py).
+    """
+
+    presence = models.OneToOneField(
+        "presences.Presence", on_delete=models.CASCADE, primary_key=True, related_name="fact"
+    )
+    classe = models.ForeignKey("formations.Classe", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    prestation = models.ForeignKey(
+        "formations.Prestation", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    prestataire = models.ForeignKey(
+        "formations.Prestataire", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    beneficiaire = models.ForeignKey(
+        "formations.Beneficiaire", on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+"
+    )
+    formation = models.ForeignKey(
+        "formations.Formation", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    lieu = models.ForeignKey(
+        "formations.Lieu", on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+"
+    )
+    date = models.DateField()
+    fenetre = models.CharField(max_length=50, blank=True)
+    present = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["date", "classe"])]
+
+    def __str__(self) -> str:
+        return f"Fait presence {self.presence_id} ({self.date})"
+
+
+class PresenceDaily(models.Model):
+    """
+    Cumul journalier des presences par classe, avec les dimensions de PresenceFact.
+    Maintenu par increments a chaque ecriture de presence (voir reporting/facts.py).
+    """
+
+    classe = models.ForeignKey("formations.Classe", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    prestation = models.ForeignKey(
+        "formations.Prestation", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    prestataire = models.ForeignKey(
+        "formations.Prestataire", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    beneficiaire = models.ForeignKey(
+        "formations.Beneficiaire", on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+"
+    )
+    formation = models.ForeignKey(
+        "formations.Formation", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    lieu = models.ForeignKey(
+        "formations.Lieu", on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+"
+    )
+    fenetre = models.CharField(max_length=50, blank=True)
+    date = models.DateField()
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["date", "classe"]
+        constraints = [models.UniqueConstraint(fields=["classe", "date"], name="presence_daily_unique")]
+        indexes = [models.Index(fields=["date"])]
+
+    def __str__(self) -> str:
+        return f"{self.classe_id} - {self.date} ({self.present}/{self.total})"
+
+
+class ConsolidationJob(models.Model):
+    """Import consolide en arriere-plan, execute par la commande run_consolidation_jobs."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "En attente"),
+        (RUNNING, "En cours"),
+        (DONE, "Termine"),
+        (FAILED, "Echec"),
+    ]
+    ACTIVE = (QUEUED, RUNNING)
+
+    REPLACE = "replace"
+    INCREMENTAL = "incremental"
+    MODE_CHOICES = [
+        (REPLACE, "Remplacement complet"),
+        (INCREMENTAL, "Mise a jour incrementale"),
+    ]
+
+    token = models.CharField(max_length=32)
+    file_name = models.CharField(max_length=255, blank=True)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default=REPLACE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    stage = models.CharField(max_length=30, blank=True)
+    rows_parsed = models.PositiveIntegerField(default=0)
+    referentiels_created = models.PositiveIntegerField(default=0)
+    # Creations par referentiel (modele -> nombre), reprises avec le point de reprise.
+    referentiels = models.JSONField(default=dict, blank=True)
+    apprenants_created = models.PositiveIntegerField(default=0)
+    apprenants_updated = models.PositiveIntegerField(default=0)
+    rows_unchanged = models.PositiveIntegerField(default=0)
+    rows_deleted = models.PositiveIntegerField(default=0)
+    # Point de reprise : lignes du fichier enregistrees (lots valides) et derniere ligne Excel.
+    rows_committed = models.PositiveIntegerField(default=0)
+    checkpoint_line = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    conflicts = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self) -> str:
+        return f"Import {self.file_name or self.token} ({self.get_status_display()})"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.DONE, self.FAILED)
+
+    def progress(self) -> dict:
+        """Etat expose par l'API de suivi."""
+        return {
+            "id": self.pk,
+            "status": self.status,
+            "status_label": self.get_status_display(),
+            "stage": self.stage,
+            "mode": self.mode,
+            "file_name": self.file_name,
+            "rows_parsed": self.rows_parsed,
+            "referentiels_created": self.referentiels_created,
+            "apprenants_created": self.apprenants_created,
+            "apprenants_updated": self.apprenants_updated,
+            "rows_unchanged": self.rows_unchanged,
+            "rows_deleted": self.rows_deleted,
+            "rows_committed": self.rows_committed,
+            "checkpoint_line": self.checkpoint_line,
+            "attempts": self.attempts,
+            "errors": len(self.conflicts) + (1 if self.error else 0),
+            "conflicts": len(self.conflicts),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
@@ -0,0 +1,118 @@
+"""
+Base fantome du remplacement complet de la consolidation (SQLite).
+
+Le remplacement est construit dans un fichier SQLite separe (alias SHADOW_ALIAS) qui
+reprend le schema de la base, tables vides, puis controle. La bascule recopie ensuite les
+tables concernees en une seule transaction (ATTACH, puis DELETE et INSERT ... SELECT par
+table) : jusqu'au COMMIT les lecteurs voient l'etat precedent, jamais un import partiel,
+et le verrou d'ecriture ne dure que le temps de la copie SQL au lieu de tout l'import.
+"""
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Sequence
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+SHADOW_ALIAS = "consolidation_shadow"
+_ATTACHED = "consolidation_shadow"
+
+logger = logging.getLogger(__name__)
+
+
+def shadow_available() -> bool:
+    """
+    Base fantome configuree, base principale et fantome sous SQLite, et pas de transaction
+    englobante (la bascule doit etre appelee hors transaction).
+    """
+    if SHADOW_ALIAS not in settings.DATABASES or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return False
+    return connections[DEFAULT_DB_ALIAS].vendor == "sqlite" and connections[SHADOW_ALIAS].vendor == "sqlite"
+
+
+def _shadow_path() -> Path:
+    return Path(connections[SHADOW_ALIAS].settings_dict["NAME"])
+
+
+def discard_shadow() -> None:
+    connections[SHADOW_ALIAS].close()
+    path = _shadow_path()
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        try:
+            os.unlink(f"{path}{suffix}")
+        except FileNotFoundError:
+            pass
+
+
+def prepare_shadow() -> None:
+    """Recree la base fantome : schema complet de la base, tables vides, compteurs AUTOINCREMENT repris."""
+    discard_shadow()
+    _shadow_path().parent.mkdir(parents=True, exist_ok=True)
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite%%' "
+            "ORDER BY type = 'table' DESC, rowid"
+        )
+        statements = [sql for (sql,) in cursor.fetchall()]
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_sequence'")
+        sequences = []
+        if cursor.fetchone():
+            cursor.execute("SELECT name, seq FROM sqlite_sequence")
+            sequences = cursor.fetchall()
+    with connections[SHADOW_ALIAS].cursor() as cursor:
+        # Fichier jetable : pas de synchronisation disque, journal en memoire (ROLLBACK possible).
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+        cursor.execute("PRAGMA synchronous = OFF")
+        for sql in statements:
+            cursor.execute(sql)
+        if sequences:
+            # Les identifiants continuent ceux de la base : pas de reemploi d'un id supprime.
+            cursor.executemany("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", sequences)
+
+
+def validate_shadow(expected: Dict[type, int]) -> None:
+    """Cles etrangeres coherentes et nombre de lignes attendu par modele, sinon ValueError."""
+    with connections[SHADOW_ALIAS].cursor() as cursor:
+        cursor.execute("PRAGMA foreign_key_check")
+        broken = cursor.fetchmany(5)
+    if broken:
+        raise ValueError(f"Import refuse : cles etrangeres incoherentes dans la base fantome {broken}.")
+    for model, count in expected.items():
+        actual = model.objects.using(SHADOW_ALIAS).count()
+        if actual != count:
+            raise ValueError(
+                f"Import refuse : {actual} lignes {model._meta.verbose_name} dans la base fantome, {count} attendues."
+            )
+
+
+def swap_shadow(models: Sequence[type]) -> float:
+    """
+    Remplace le contenu des tables de `models` par celui de la base fantome, en une
+    transaction. A appeler hors transaction. Renvoie la duree de la transaction (ms).
+    """
+    live = connections[DEFAULT_DB_ALIAS]
+    if live.in_atomic_block:
+        raise RuntimeError("La bascule de la base fantome doit etre appelee hors transaction.")
+    path = str(_shadow_path())
+    connections[SHADOW_ALIAS].close()
+    tables = [live.ops.quote_name(model._meta.db_table) for model in models]
+    with live.cursor() as cursor:
+        cursor.execute(f"ATTACH DATABASE %s AS {_ATTACHED}", [path])
+        try:
+            # Sans effet dans une transaction : a positionner avant (comme le vidage en place).
+            cursor.execute("PRAGMA foreign_keys = OFF")
+            try:
+                started = time.perf_counter()
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    for table in tables:
+                        cursor.execute(f"DELETE FROM main.{table}")
+                        cursor.execute(f"INSERT INTO main.{table} SELECT * FROM {_ATTACHED}.{table}")
+                elapsed = (time.perf_counter() - started) * 1000
+            finally:
+                cursor.execute("PRAGMA foreign_keys = ON")
+        finally:
+            cursor.execute(f"DETACH DATABASE {_ATTACHED}")
+    logger.info("Bascule de la base fantome : %s tables en %.1f ms.", len(tables), elapsed)
+    return elapsed
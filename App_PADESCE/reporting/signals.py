@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save
+
+from App_PADESCE.formations.models import Classe, Prestation
+from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting.cache import invalidate_reporting
+from App_PADESCE.reporting.facts import (
+    apply_daily_change,
+    presence_cell,
+    refresh_classe_facts,
+    refresh_prestation_facts,
+    sync_presence_fact,
+)
+from App_PADESCE.reporting.snapshot import SNAPSHOT_SOURCES
+
+
+def invalidate_reporting_data(sender, origin=None, **kwargs):
+    # Suppression en cascade ou par queryset : une seule invalidation par modele pour l'origine.
+    if origin is not None and not isinstance(origin, sender):
+        invalidated = vars(origin).setdefault("_reporting_invalidated", set())
+        if sender in invalidated:
+            return
+        invalidated.add(sender)
+    invalidate_reporting(sender)
+
+
+def sync_presence_fact_on_save(sender, instance, created=False, **kwargs):
+    apply_daily_change(*sync_presence_fact(instance, created=created))
+
+
+def sync_daily_on_presence_delete(sender, instance, **kwargs):
+    # Le fait est supprime en cascade avant la presence : seule la cellule journaliere reste a decompter.
+    apply_daily_change(presence_cell(instance), None)
+
+
+def refresh_facts_on_classe_save(sender, instance, created=False, **kwargs):
+    if not created:
+        refresh_classe_facts([instance.pk])
+
+
+def refresh_facts_on_prestation_save(sender, instance, created=False, **kwargs):
+    if not created:
+        refresh_prestation_facts(instance)
+
+
+# Les faits sont synchronises avant l'invalidation (ordre de connexion).
+post_save.connect(sync_presence_fact_on_save, sender=Presence, dispatch_uid="reporting_fact_presence_save")
+post_delete.connect(sync_daily_on_presence_delete, sender=Presence, dispatch_uid="reporting_daily_presence_delete")
+post_save.connect(refresh_facts_on_classe_save, sender=Classe, dispatch_uid="reporting_fact_classe_save")
+post_save.connect(refresh_facts_on_prestation_save, sender=Prestation, dispatch_uid="reporting_fact_prestation_save")
+
+for _model in SNAPSHOT_SOURCES:
+    post_save.connect(invalidate_reporting_data, sender=_model, dispatch_uid=f"reporting_snapshot_save_{_model.__name__}")
+    post_delete.connect(
+        invalidate_reporting_data, sender=_model, dispatch_uid=f"reporting_snapshot_delete_{_model.__name__}"
+    )
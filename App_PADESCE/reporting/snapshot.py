@@ -0,0 +1,188 @@
+import logging
+import time
+from typing import Any, Dict
+
+from django.utils import timezone
+
+from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.environnement.models import EnqueteEnvironnement
+from App_PADESCE.formations.models import Beneficiaire, Classe, Formation, Lieu, Prestataire, Prestation
+from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting.aggregation import AggregationEngine, safe_rate
+from App_PADESCE.reporting.models import ReportingSnapshot
+from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
+from App_PADESCE.satisfaction_formateurs.models import SatisfactionFormateur
+
+logger = logging.getLogger(__name__)
+
+# Incremente lorsque la forme ou le calcul du payload change : les snapshots anterieurs sont recalcules.
+SNAPSHOT_SCHEMA = 4
+
+# Modeles dont une ecriture rend le snapshot du tableau de bord obsolete.
+SNAPSHOT_SOURCES = (
+    Presence,
+    SatisfactionApprenant,
+    SatisfactionFormateur,
+    EnqueteEnvironnement,
+    Apprenant,
+    Classe,
+    Prestation,
+    Prestataire,
+    Beneficiaire,
+    Formation,
+    Lieu,
+)
+
+
+# Modeles dont dependent les indicateurs de presence filtres du tableau de bord.
+PRESENCE_SOURCES = (Presence, Classe, Prestation, Prestataire, Beneficiaire, Formation, Lieu)
+
+
+def compute_presence_context(engine: AggregationEngine) -> Dict[str, Any]:
+    """Indicateurs de presence du tableau de bord (ceux que les filtres restreignent)."""
+    presence = engine.presence_totals()
+    return {
+        "nb_enquetes_presence": presence["total"],
+        "taux_presence_global": presence["taux"],
+        "presence_rates": engine.presence_rates("classe")[:10],
+        "taux_presence_prestataire": engine.presence_rates("prestataire"),
+        "taux_presence_prestation": engine.presence_rates("prestation"),
+        "taux_presence_beneficiaire": engine.presence_rates("beneficiaire"),
+        "taux_presence_formation": engine.presence_rates("formation"),
+        "taux_presence_formation_harmo": engine.presence_rates("nom_harmonise"),
+        "presence_semaine": engine.presence_timeline("semaine"),
+        "presence_mois": engine.presence_timeline("mois"),
+    }
+
+
+def with_presence_context(context: Dict[str, Any], presence: Dict[str, Any]) -> Dict[str, Any]:
+    """Remplace les indicateurs de presence du contexte (par exemple par leur version filtree)."""
+    charts = [
+        {**chart, "value": f"{presence['taux_presence_global']} %"} if chart["code"] == "RES00-01" else chart
+        for chart in context["charts"]
+    ]
+    return {**context, **presence, "charts": charts}
+
+
+def filter_options() -> Dict[str, Any]:
+    """Valeurs proposees par les filtres du tableau de bord."""
+    return {
+        "fenetres": list(
+            Classe.objects.exclude(fenetre="").values_list("fenetre", flat=True).distinct().order_by("fenetre")
+        ),
+        "regions": list(Lieu.objects.exclude(region="").values_list("region", flat=True).distinct().order_by("region")),
+        "prestataires": list(Prestataire.objects.values("id", "raison_sociale").order_by("raison_sociale")),
+    }
+
+
+def compute_home_context() -> Dict[str, Any]:
+    """Calcule tous les chiffres du tableau de bord (serialisables en JSON)."""
+    engine = AggregationEngine()
+    presence_context = compute_presence_context(engine)
+    sat_appr = engine.satisfaction_totals("apprenants")
+    sat_form = engine.satisfaction_totals("formateurs")
+
+    # RES00-04 / RES00-05 : somme des notes Q9 rapportee au maximum (5 points)
+    taux_sat_appr_global = safe_rate(sat_appr["somme"], sat_appr["n"] * 5)
+    taux_sat_form_global = safe_rate(sat_form["somme"], sat_form["n"] * 5)
+    # Environnement : moyenne des booleens principaux (8 points indicatifs)
+    env_score = engine.environnement_score()
+
+    env_par_lieu = [
+        {"lieu": r["lieu"], "region": r["region"], "total": r["total"], "score": r["score"]}
+        for r in engine.environnement_par_lieu()
+    ]
+
+    # Durées par prestation
+    prestations_durees = list(
+        Prestation.objects.values("code", "prestataire__raison_sociale", "duree_prevue_heures", "duree_reelle_heures")
+        .order_by("code")
+    )
+
+    # RES03-01
+    carte_lieux = [
+        {"nom": nom, "lat": lat, "lng": lng}
+        for nom, lat, lng in Lieu.objects.filter(actif=True).values_list("nom_lieu", "latitude", "longitude")
+        if lat and lng
+    ]
+
+    charts = [
+        {"code": "RES00-01", "title": "Taux de présence global", "value": f"{presence_context['taux_presence_global']} %"},
+        {"code": "RES00-02", "title": "Synthèse du suivi contractuel", "value": "N/A"},
+        {"code": "RES00-03", "title": "Synthèse de l'évaluation de l'environnement (8 points)", "value": f"{env_score} %"},
+        {"code": "RES00-04", "title": "Taux de satisfaction global apprenants", "value": f"{taux_sat_appr_global} %"},
+        {"code": "RES00-05", "title": "Taux de satisfaction global formateurs", "value": f"{taux_sat_form_global} %"},
+    ]
+
+    return {
+        **presence_context,
+        "schema": SNAPSHOT_SCHEMA,
+        "nb_classes": Classe.objects.count(),
+        "nb_apprenants": Apprenant.objects.filter(actif=True).count(),
+        "nb_formateurs": SatisfactionFormateur.objects.values("formateur").distinct().count(),
+        "nb_sat_apprenants": SatisfactionApprenant.objects.count(),
+        "nb_sat_formateurs": SatisfactionFormateur.objects.count(),
+        "nb_env": EnqueteEnvironnement.objects.count(),
+        "sat_appr_moy": engine.satisfaction_means("apprenants", "classe")[:10],
+        "sat_form_moy": engine.satisfaction_means("formateurs", "classe")[:10],
+        "formations": list(Formation.objects.values("code", "nom").order_by("nom")[:20]),
+        "charts": charts,
+        "carte_lieux": carte_lieux,
+        "sat_appr_prestataire": engine.satisfaction_means("apprenants", "prestataire"),
+        "sat_appr_prestation": engine.satisfaction_means("apprenants", "prestation"),
+        "sat_appr_benef": engine.satisfaction_means("apprenants", "beneficiaire"),
+        "sat_appr_formation": engine.satisfaction_means("apprenants", "formation"),
+        "sat_appr_formation_harmo": engine.satisfaction_means("apprenants", "nom_harmonise"),
+        "sat_form_prestataire": engine.satisfaction_means("formateurs", "prestataire"),
+        "sat_form_prestation": engine.satisfaction_means("formateurs", "prestation"),
+        "sat_form_benef": engine.satisfaction_means("formateurs", "beneficiaire"),
+        "sat_form_formation": engine.satisfaction_means("formateurs", "formation"),
+        "sat_form_formation_harmo": engine.satisfaction_means("formateurs", "nom_harmonise"),
+        "repart_apprenants_ville": engine.repartition("ville"),
+        "repart_apprenants_region": engine.repartition("region"),
+        "repart_apprenants_formation": engine.repartition("formation"),
+        "repart_apprenants_formation_harmo": engine.repartition("nom_harmonise"),
+        "repart_apprenants_benef": engine.repartition("beneficiaire"),
+        "repart_apprenants_prestataire": engine.repartition("prestataire"),
+        # RES02-03, RES02-04, RES02-05
+        "prestations_effectifs": engine.prestation_effectifs(),
+        "prestations_durees": prestations_durees,
+        "env_par_lieu": env_par_lieu,
+        "filter_options": filter_options(),
+    }
+
+
+def refresh_home_snapshot() -> ReportingSnapshot:
+    """Recalcule le snapshot du tableau de bord et l'enregistre."""
+    started_at = timezone.now()
+    started = time.monotonic()
+    payload = compute_home_context()
+    duration_ms = int((time.monotonic() - started) * 1000)
+    snapshot, _ = ReportingSnapshot.objects.update_or_create(
+        key=ReportingSnapshot.HOME,
+        defaults={
+            "payload": payload,
+            "stale": False,
+            "computed_at": started_at,
+            "duration_ms": duration_ms,
+        },
+    )
+    # Une ecriture survenue pendant le calcul doit rester visible comme invalidation.
+    ReportingSnapshot.objects.filter(pk=snapshot.pk, invalidated_at__gte=started_at).update(stale=True)
+    logger.info("Snapshot reporting '%s' recalcule en %s ms", snapshot.key, duration_ms)
+    # Relecture pour servir exactement ce qui est stocke (Decimal -> str, etc.).
+    snapshot.refresh_from_db(fields=["payload"])
+    return snapshot
+
+
+def get_home_context() -> Dict[str, Any]:
+    """Contexte du tableau de bord lu depuis le snapshot, recalcule s'il est obsolete."""
+    snapshot = ReportingSnapshot.objects.filter(key=ReportingSnapshot.HOME).first()
+    if snapshot is None or snapshot.stale or snapshot.payload.get("schema") != SNAPSHOT_SCHEMA:
+        snapshot = refresh_home_snapshot()
+    return {**snapshot.payload, "snapshot_computed_at": snapshot.computed_at}
+
+
+def mark_snapshots_stale() -> None:
+    """Invalide les snapshots (appel cable sur les ecritures et apres les imports en masse)."""
+    ReportingSnapshot.objects.update(stale=True, invalidated_at=timezone.now())
@@ -0,0 +1,175 @@
+"""
+Fichiers de consolidation en attente de validation.
+
+Le classeur televerse est ecrit sur disque (CONSOLIDATION_STAGING_DIR) sous le debut de
+son empreinte SHA-256 : la session ne garde que ce jeton court, et un meme fichier
+recharge reutilise le meme emplacement. Les lignes lues lors de la premiere passe sont
+mises en cache a cote du fichier, en binaire compact (paquets marshal dans un flux gzip) :
+l'extraction et l'enregistrement relisent ce cache au lieu de reanalyser le classeur.
+Les fichiers non utilises depuis CONSOLIDATION_STAGING_TTL secondes sont purges.
+"""
+import gzip
+import hashlib
+import marshal
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+
+TOKEN_LENGTH = 16
+UPLOAD_SUFFIX = ".xlsx"
+ROWS_SUFFIX = ".rows"
+PART_SUFFIX = ".part"
+ROWS_CHUNK = 1000
+
+_TOKEN_RE = re.compile(rf"^[0-9a-f]{{{TOKEN_LENGTH}}}$")
+# Le format marshal peut changer d'une version de Python a l'autre : un cache ecrit par
+# une autre version est ignore (le classeur est alors relu).
+_CACHE_VERSION = f"rows-1-py{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+def staging_dir() -> Path:
+    default = Path(settings.BASE_DIR) / "var" / "consolidation"
+    path = Path(getattr(settings, "CONSOLIDATION_STAGING_DIR", default))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def staging_ttl() -> int:
+    return getattr(settings, "CONSOLIDATION_STAGING_TTL", 21600)
+
+
+def _path(token: str, suffix: str) -> Path:
+    if not isinstance(token, str) or not _TOKEN_RE.match(token):
+        raise ValueError("Jeton de fichier consolide invalide.")
+    return staging_dir() / f"{token}{suffix}"
+
+
+def _touch(token: str) -> None:
+    # La date de modification sert d'horodatage d'usage pour la purge.
+    for suffix in (UPLOAD_SUFFIX, ROWS_SUFFIX):
+        try:
+            os.utime(_path(token, suffix))
+        except FileNotFoundError:
+            pass
+
+
+def store_upload(uploaded_file) -> str:
+    """Ecrit le fichier televerse par morceaux sous son empreinte et renvoie le jeton."""
+    directory = staging_dir()
+    digest = hashlib.sha256()
+    tmp = tempfile.NamedTemporaryFile(dir=directory, suffix=PART_SUFFIX, delete=False)
+    try:
+        with tmp:
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+                tmp.write(chunk)
+        token = digest.hexdigest()[:TOKEN_LENGTH]
+        target = _path(token, UPLOAD_SUFFIX)
+        if target.exists():
+            os.unlink(tmp.name)
+            _touch(token)
+        else:
+            os.replace(tmp.name, target)
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+        raise
+    return token
+
+
+def upload_path(token: str) -> Optional[Path]:
+    """Chemin du classeur en attente, None s'il a expire."""
+    path = _path(token, UPLOAD_SUFFIX)
+    return path if path.exists() else None
+
+
+def cache_rows(token: str, header: list, rows: Iterable[Tuple[int, list]]) -> Iterator[Tuple[int, list]]:
+    """
+    Relaie `rows` (ligne, cellules) en les ecrivant dans le cache du fichier. Le cache
+    n'est publie qu'a la fin d'un parcours complet : un apercu interrompu n'en laisse pas.
+    """
+    target = _path(token, ROWS_SUFFIX)
+    tmp = tempfile.NamedTemporaryFile(dir=target.parent, suffix=PART_SUFFIX, delete=False)
+    complete = False
+    try:
+        with gzip.GzipFile(fileobj=tmp, mode="wb", compresslevel=1) as out:
+            marshal.dump((_CACHE_VERSION, list(header)), out)
+            chunk = []
+            for line, cells in rows:
+                chunk.append((line, cells))
+                if len(chunk) >= ROWS_CHUNK:
+                    marshal.dump(chunk, out)
+                    chunk = []
+                yield line, cells
+            if chunk:
+                marshal.dump(chunk, out)
+        complete = True
+    finally:
+        tmp.close()
+        close = getattr(rows, "close", None)
+        if close:
+            close()
+        if complete:
+            os.replace(tmp.name, target)
+        else:
+            os.unlink(tmp.name)
+
+
+def load_rows(token: str) -> Optional[Tuple[list, Iterator[Tuple[int, list]]]]:
+    """En-tete et iterateur paresseux des lignes en cache, None si le cache est absent ou perime."""
+    path = _path(token, ROWS_SUFFIX)
+    try:
+        fh = gzip.open(path, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        version, header = marshal.load(fh)
+    except (EOFError, OSError, TypeError, ValueError):
+        fh.close()
+        return None
+    if version != _CACHE_VERSION:
+        fh.close()
+        return None
+    _touch(token)
+
+    def body():
+        try:
+            while True:
+                try:
+                    chunk = marshal.load(fh)
+                except EOFError:
+                    return
+                yield from chunk
+        finally:
+            fh.close()
+
+    return header, body()
+
+
+def purge_expired(ttl: int = None, keep: Iterable[str] = ()) -> int:
+    """
+    Supprime les fichiers (classeurs, caches, ecritures interrompues) inutilises depuis
+    `ttl` secondes, sauf ceux des jetons `keep` (fichiers encore attendus par un import).
+    """
+    ttl = staging_ttl() if ttl is None else ttl
+    limit = time.time() - ttl
+    keep = set(keep)
+    removed = 0
+    for entry in os.scandir(staging_dir()):
+        if not entry.is_file() or not entry.name.endswith((UPLOAD_SUFFIX, ROWS_SUFFIX, PART_SUFFIX)):
+            continue
+        if entry.name[:TOKEN_LENGTH] in keep:
+            continue
+        try:
+            if entry.stat().st_mtime < limit:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
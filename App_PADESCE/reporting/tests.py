@@ -1,3 +1,986 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+from datetime import date
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import Workbook, load_workbook
+
+from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.core.middleware import set_current_user
+from App_PADESCE.formations.models import Beneficiaire, Classe, Formation, Lieu, Prestataire, Prestation
+from App_PADESCE.presences.models import Presence
+from App_PADESCE.reporting import consolidation
+from App_PADESCE.reporting.aggregation import CLASSE_AXES, AggregationEngine, PresenceFilters
+from App_PADESCE.reporting.api import get_chart_batch, get_chart_data
+from App_PADESCE.reporting.cache import bump_data_versions, cache_stats, get_reporting_cache, invalidate_reporting
+from App_PADESCE.reporting.consolidation import (
+    apply_incremental,
+    iter_consolidation_sheet,
+    replace_from_staged,
+    save_related_from_payload,
+)
+from App_PADESCE.reporting.facts import rebuild_presence_facts
+from App_PADESCE.reporting.jobs import (
+    MAX_ATTEMPTS,
+    claim_next_job,
+    enqueue_consolidation,
+    purge_staged_uploads,
+    requeue_interrupted_jobs,
+    resume_job,
+    run_job,
+)
+from App_PADESCE.reporting.models import (
+    ConsolidationJob,
+    ConsolidationRecord,
+    DataVersion,
+    PresenceDaily,
+    PresenceFact,
+    ReportingSnapshot,
+)
+from App_PADESCE.reporting.shadow import SHADOW_ALIAS, prepare_shadow
+from App_PADESCE.reporting.snapshot import get_home_context
+from App_PADESCE.reporting.staging import load_rows, purge_expired, staging_dir, store_upload, upload_path
+from App_PADESCE.reporting.views import CONSO_PREVIEW_ROWS, SESSION_KEY_CONSO
+from App_PADESCE.reporting.workbook import XLSX_CONTENT_TYPE
+from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
+
+JOUR_1 = date(2026, 3, 2)
+JOUR_2 = date(2026, 3, 3)
+
+
+class ReportingDataMixin:
+    """Deux prestataires, une classe chacun, deux apprenants par classe, deux jours de presence.
+
+    Classe C1 (Prestataire 1, Centre, Fenetre 1) : 3 presents sur 4.
+    Classe C2 (Prestataire 2, Littoral, Fenetre 2) : 1 present sur 4.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        beneficiaire = Beneficiaire.objects.create(nom_structure="Beneficiaire A")
+        cls.formation = Formation.objects.create(code="F1", nom="Couture", nom_harmonise="Couture")
+        cls.lieux = [
+            Lieu.objects.create(code="LIE001", nom_lieu="Centre Yaounde", region="Centre"),
+            Lieu.objects.create(code="LIE002", nom_lieu="Port Douala", region="Littoral"),
+        ]
+        cls.prestataires = [
+            Prestataire.objects.create(code=f"PR{i}", raison_sociale=f"Prestataire {i}") for i in (1, 2)
+        ]
+        cls.prestations = [
+            Prestation.objects.create(
+                code=f"PS{i}",
+                prestataire=prestataire,
+                formation=cls.formation,
+                beneficiaire=beneficiaire,
+                effectif_a_former=2,
+                femmes=1,
+            )
+            for i, prestataire in enumerate(cls.prestataires, 1)
+        ]
+        cls.classes = [
+            Classe.objects.create(
+                code=f"C{i}",
+                prestation=prestation,
+                formation=cls.formation,
+                lieu=lieu,
+                intitule_formation="Couture",
+                fenetre=f"Fenetre {i}",
+            )
+            for i, (prestation, lieu) in enumerate(zip(cls.prestations, cls.lieux), 1)
+        ]
+        cls.apprenants = [
+            Apprenant.objects.create(
+                code=f"A{n}",
+                classe=cls.classes[n % 2],
+                formation=cls.formation,
+                nom_complet=f"Apprenant {n}",
+                genre="F" if n < 2 else "M",
+                region="Centre",
+            )
+            for n in range(4)
+        ]
+        absents = {(2, JOUR_2), (1, JOUR_1), (3, JOUR_1), (3, JOUR_2)}
+        for n, apprenant in enumerate(cls.apprenants):
+            for jour in (JOUR_1, JOUR_2):
+                Presence.objects.create(
+                    classe=apprenant.classe,
+                    apprenant=apprenant,
+                    date=jour,
+                    presence="AB" if (n, jour) in absents else "PR",
+                )
+
+    def setUp(self):
+        super().setUp()
+        # Cache LocMem partage par tous les tests du processus.
+        get_reporting_cache().clear()
+
+    def login(self):
+        user = get_user_model().objects.create_user(username="reporting", password="x")
+        self.client.force_login(user)
+        # Le middleware garde l'utilisateur de la requete pour l'audit : a oublier apres le test.
+        self.addCleanup(set_current_user, None)
+
+
+class HomeSnapshotTests(ReportingDataMixin, TestCase):
+    def test_dashboard_read_from_snapshot(self):
+        context = get_home_context()
+        self.assertEqual(context["nb_apprenants"], 4)
+        self.assertEqual(context["charts"][0]["value"], "50.0 %")
+        snapshot = ReportingSnapshot.objects.get(key=ReportingSnapshot.HOME)
+        self.assertFalse(snapshot.stale)
+
+        # Snapshot a jour : une seule lecture par cle, aucun recalcul.
+        with self.assertNumQueries(1):
+            again = get_home_context()
+        self.assertEqual(again["snapshot_computed_at"], snapshot.computed_at)
+
+    def test_write_marks_snapshot_stale(self):
+        get_home_context()
+        Presence.objects.filter(apprenant=self.apprenants[3]).update(presence="PR")
+        rebuild_presence_facts()
+        # Mise a jour en masse sans signal : le snapshot sert encore l'ancienne valeur.
+        self.assertEqual(get_home_context()["charts"][0]["value"], "50.0 %")
+
+        Presence.objects.get(apprenant=self.apprenants[1], date=JOUR_1).delete()
+        self.assertTrue(ReportingSnapshot.objects.get(key=ReportingSnapshot.HOME).stale)
+        context = get_home_context()
+        self.assertEqual(context["nb_enquetes_presence"], 7)
+        self.assertEqual(context["charts"][0]["value"], f"{round(6 / 7 * 100, 2)} %")
+
+
+class ChartRegistryTests(ReportingDataMixin, TestCase):
+    def test_presence_rates_by_prestataire(self):
+        series = get_chart_data("res01-01")["series"]
+        self.assertEqual(
+            sorted((row["label"], row["pr"], row["total"], row["taux"]) for row in series),
+            [("Prestataire 1", 3, 4, 75.0), ("Prestataire 2", 1, 4, 25.0)],
+        )
+
+    def test_only_requested_provider_runs(self):
+        with CaptureQueriesContext(connection) as queries:
+            get_chart_data("RES01-01")
+        sql = " ".join(q["sql"] for q in queries.captured_queries)
+        self.assertIn("reporting_presencedaily", sql)
+        self.assertNotIn("presences_presence", sql)
+        self.assertNotIn("apprenants_apprenant", sql)
+        self.assertNotIn("satisfaction", sql)
+
+    def test_api_chart_unknown_code(self):
+        self.login()
+        response = self.client.get(reverse("reporting_api_chart", args=["RES99-99"]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("reporting_api_chart", args=["RES00-01"]))
+        self.assertEqual(response.json(), {"type": "gauge", "value": 50.0, "max": 100})
+
+
+class ChartBatchTests(ReportingDataMixin, TestCase):
+    def test_family_shares_one_grouped_query(self):
+        codes = ["RES00-01", "RES01-01", "RES01-02", "RES01-03", "RES01-04", "RES01-05"]
+        # Versions de donnees, faits groupes lus une fois, six tables de libelles.
+        with self.assertNumQueries(8):
+            batch = get_chart_batch(codes)
+        self.assertEqual(list(batch["charts"]), codes)
+        self.assertEqual(batch["charts"]["RES00-01"]["value"], 50.0)
+        self.assertEqual(batch["charts"]["RES01-05"]["series"], [{"label": "Couture", "pr": 4, "total": 8, "taux": 50.0}])
+        self.assertEqual(batch["charts"], {code: get_chart_data(code) for code in codes})
+
+    def test_api_batch_reports_unknown_codes(self):
+        self.login()
+        url = reverse("reporting_api_batch")
+        response = self.client.get(url, {"codes": "per01-01,RES99-99,PER01-01"})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(list(body["charts"]), ["PER01-01"])
+        self.assertEqual(body["errors"], {"RES99-99": "Code RES99-99 non pris en charge"})
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class AggregationEngineTests(ReportingDataMixin, TestCase):
+    def test_all_presence_axes_from_one_read(self):
+        engine = AggregationEngine()
+        # Faits groupes par cles entieres, puis une lecture par table de libelles.
+        with self.assertNumQueries(7):
+            rates = {axis: engine.presence_rates(axis) for axis in CLASSE_AXES}
+        self.assertEqual(
+            [(row["label"], row["taux"]) for row in rates["region"]],
+            [("Centre", 75.0), ("Littoral", 25.0)],
+        )
+        self.assertEqual([row["label"] for row in rates["fenetre"]], ["Fenetre 1", "Fenetre 2"])
+        self.assertEqual(rates["beneficiaire"], [{"label": "Beneficiaire A", "pr": 4, "total": 8, "taux": 50.0}])
+        self.assertEqual(engine.presence_totals(), {"pr": 4, "total": 8, "taux": 50.0})
+
+    def test_repartition_and_prestation_effectifs(self):
+        engine = AggregationEngine()
+        self.assertEqual(engine.repartition("region"), [{"label": "Centre", "total": 4}])
+        self.assertEqual(
+            engine.repartition("prestataire"),
+            [{"label": "Prestataire 1", "total": 2}, {"label": "Prestataire 2", "total": 2}],
+        )
+        effectifs = {row["code"]: row for row in engine.prestation_effectifs()}
+        self.assertEqual(
+            [(row["appr_total"], row["appr_femmes"], row["respect_femmes"]) for row in effectifs.values()],
+            [(2, 1, True), (2, 1, True)],
+        )
+        self.assertTrue(effectifs["PS1"]["respect_effectif"])
+
+    def test_inactive_apprenants_not_counted(self):
+        # Apprenant desactive par un import incremental (ligne disparue du fichier).
+        Apprenant.objects.filter(pk=Apprenant.objects.order_by("pk").values("pk")[:1]).update(actif=False)
+        self.assertEqual(AggregationEngine().repartition("region"), [{"label": "Centre", "total": 3}])
+        self.assertEqual(get_home_context()["nb_apprenants"], 3)
+
+    def test_empty_database(self):
+        Presence.objects.all().delete()
+        engine = AggregationEngine()
+        self.assertEqual(engine.presence_rates("prestataire"), [])
+        self.assertEqual(engine.presence_totals(), {"pr": 0, "total": 0, "taux": 0.0})
+        self.assertIsNone(engine.satisfaction_totals("apprenants")["moy"])
+
+
+class ReportingCacheTests(ReportingDataMixin, TestCase):
+    def rates(self):
+        return {row["label"]: row["taux"] for row in get_chart_data("RES01-01")["series"]}
+
+    def test_chart_cached_until_data_version_bumped(self):
+        self.assertEqual(self.rates(), {"Prestataire 1": 75.0, "Prestataire 2": 25.0})
+        # Entree a jour : seule la lecture des versions touche la base.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.rates(), {"Prestataire 1": 75.0, "Prestataire 2": 25.0})
+        self.assertEqual(cache_stats()["chart"], {"hits": 1, "misses": 1, "hit_rate": 50.0})
+
+        version = DataVersion.objects.get(model="presences.presence").version
+        presence = Presence.objects.get(apprenant=self.apprenants[3], date=JOUR_1)
+        presence.presence = "PR"
+        presence.save()
+        self.assertEqual(DataVersion.objects.get(model="presences.presence").version, version + 1)
+        self.assertEqual(self.rates(), {"Prestataire 1": 75.0, "Prestataire 2": 50.0})
+
+    def test_bulk_update_needs_explicit_invalidation(self):
+        self.rates()
+        Presence.objects.update(presence="PR")
+        rebuild_presence_facts()
+        self.assertEqual(self.rates()["Prestataire 2"], 25.0)
+        get_home_context()
+        invalidate_reporting(Presence)
+        self.assertEqual(self.rates(), {"Prestataire 1": 100.0, "Prestataire 2": 100.0})
+        self.assertTrue(ReportingSnapshot.objects.get(key=ReportingSnapshot.HOME).stale)
+
+    def test_unrelated_model_keeps_entry(self):
+        self.rates()
+        bump_data_versions(SatisfactionApprenant)
+        self.rates()
+        self.assertEqual(cache_stats()["chart"]["hits"], 1)
+
+
+class ConditionalResponseTests(ReportingDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def test_chart_json_not_modified(self):
+        url = reverse("reporting_api_chart", args=["RES01-01"])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # 304 rendu sur les seules versions : le payload n'est pas meme lu en cache.
+        self.assertEqual(cache_stats()["chart"], {"hits": 0, "misses": 1, "hit_rate": 0.0})
+
+        Presence.objects.filter(apprenant=self.apprenants[3]).first().save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_embed_table_if_modified_since(self):
+        url = reverse("reporting_embed_table", args=["presence-prestataire"])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Prestataire 1")
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        # Donnees dont la table ne depend pas : toujours 304.
+        bump_data_versions(SatisfactionApprenant)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=self.client.get(url)["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_table(self):
+        response = self.client.get(reverse("reporting_embed_table", args=["inconnue"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class PresenceFactTests(ReportingDataMixin, TestCase):
+    def fact(self, apprenant, jour):
+        presence = Presence.objects.get(apprenant=self.apprenants[apprenant], date=jour)
+        return presence, PresenceFact.objects.get(presence=presence)
+
+    def test_facts_copy_classe_dimensions(self):
+        self.assertEqual(PresenceFact.objects.count(), 8)
+        presence, fact = self.fact(1, JOUR_2)
+        classe = self.classes[1]
+        self.assertEqual(
+            (fact.classe_id, fact.prestation_id, fact.prestataire_id, fact.lieu_id, fact.fenetre, fact.present),
+            (classe.pk, classe.prestation_id, classe.prestation.prestataire_id, classe.lieu_id, "Fenetre 2", True),
+        )
+
+    def test_presence_update_and_delete(self):
+        presence, _ = self.fact(3, JOUR_1)
+        presence.presence = "PR"
+        presence.classe = self.classes[0]
+        presence.save()
+        fact = PresenceFact.objects.get(presence=presence)
+        self.assertTrue(fact.present)
+        self.assertEqual(fact.classe_id, self.classes[0].pk)
+        self.assertEqual(fact.lieu_id, self.classes[0].lieu_id)
+        presence.delete()
+        self.assertEqual(PresenceFact.objects.count(), 7)
+
+    def test_presence_save_stays_cheap(self):
+        presence, _ = self.fact(3, JOUR_1)
+        presence.presence = "PR"
+        with CaptureQueriesContext(connection) as queries:
+            presence.save()
+        facts = [q["sql"] for q in queries.captured_queries if "reporting_presencefact" in q["sql"]]
+        self.assertEqual(len(facts), 2)
+
+    def test_dimension_changes_follow(self):
+        classe = self.classes[0]
+        classe.fenetre = "Fenetre 3"
+        classe.lieu = self.classes[1].lieu
+        classe.save()
+        prestation = classe.prestation
+        prestation.prestataire = self.classes[1].prestation.prestataire
+        prestation.save()
+        facts = PresenceFact.objects.filter(classe=classe)
+        self.assertEqual(
+            set(facts.values_list("fenetre", "lieu_id", "prestataire_id")),
+            {("Fenetre 3", classe.lieu_id, prestation.prestataire_id)},
+        )
+        rates = AggregationEngine().presence_rates("prestataire")
+        self.assertEqual(rates, [{"label": "Prestataire 2", "pr": 4, "total": 8, "taux": 50.0}])
+
+    def test_rebuild_command(self):
+        PresenceFact.objects.all().delete()
+        call_command("rebuild_presence_facts", stdout=StringIO())
+        self.assertEqual(PresenceFact.objects.filter(present=True).count(), 4)
+        self.assertEqual(AggregationEngine().presence_totals(), {"pr": 4, "total": 8, "taux": 50.0})
+
+    def test_grouped_read_has_no_join(self):
+        with CaptureQueriesContext(connection) as queries:
+            AggregationEngine().presence_rates("region")
+        self.assertNotIn("JOIN", queries.captured_queries[0]["sql"])
+
+
+class PresenceDailyTests(ReportingDataMixin, TestCase):
+    def cells(self):
+        return {
+            (cell.classe.code, cell.date): (cell.present, cell.absent, cell.total)
+            for cell in PresenceDaily.objects.select_related("classe")
+        }
+
+    def test_rollup_per_classe_and_day(self):
+        self.assertEqual(
+            self.cells(),
+            {
+                ("C1", JOUR_1): (2, 0, 2),
+                ("C1", JOUR_2): (1, 1, 2),
+                ("C2", JOUR_1): (0, 2, 2),
+                ("C2", JOUR_2): (1, 1, 2),
+            },
+        )
+        cell = PresenceDaily.objects.get(classe=self.classes[1], date=JOUR_1)
+        self.assertEqual(
+            (cell.prestataire_id, cell.lieu_id, cell.fenetre),
+            (self.prestataires[1].pk, self.lieux[1].pk, "Fenetre 2"),
+        )
+
+    def test_presence_writes_shift_cells(self):
+        presence = Presence.objects.get(apprenant=self.apprenants[3], date=JOUR_1)
+        presence.presence = "PR"
+        with CaptureQueriesContext(connection) as queries:
+            presence.save()
+        daily = [q["sql"] for q in queries.captured_queries if "reporting_presencedaily" in q["sql"]]
+        self.assertEqual(len(daily), 1)
+        self.assertEqual(self.cells()[("C2", JOUR_1)], (1, 1, 2))
+
+        presence.classe = self.classes[0]
+        presence.save()
+        self.assertEqual(self.cells()[("C2", JOUR_1)], (0, 1, 1))
+        self.assertEqual(self.cells()[("C1", JOUR_1)], (3, 0, 3))
+
+        jour = date(2026, 3, 9)
+        nouvelle = Presence.objects.create(
+            classe=self.classes[1], apprenant=self.apprenants[1], date=jour, presence="AB"
+        )
+        self.assertEqual(self.cells()[("C2", jour)], (0, 1, 1))
+        self.assertEqual(PresenceDaily.objects.get(date=jour).lieu_id, self.lieux[1].pk)
+        nouvelle.delete()
+        self.assertNotIn(("C2", jour), self.cells())
+        Presence.objects.get(apprenant=self.apprenants[2], date=JOUR_2).delete()
+        self.assertEqual(self.cells()[("C1", JOUR_2)], (1, 0, 1))
+
+    def test_rebuild_restores_rollup(self):
+        expected = self.cells()
+        PresenceDaily.objects.all().delete()
+        rebuild_presence_facts()
+        self.assertEqual(self.cells(), expected)
+
+    def test_filters_restrict_presence(self):
+        def totals(**filters):
+            return AggregationEngine(PresenceFilters(**filters)).presence_totals()
+
+        self.assertEqual(totals(date_from=JOUR_2), {"pr": 2, "total": 4, "taux": 50.0})
+        self.assertEqual(totals(date_to=JOUR_1, fenetre="Fenetre 1")["taux"], 100.0)
+        self.assertEqual(totals(region="Littoral")["taux"], 25.0)
+        self.assertEqual(totals(prestataire=self.prestataires[0].pk)["taux"], 75.0)
+
+        classe = self.classes[0]
+        classe.lieu = self.lieux[1]
+        classe.save()
+        self.assertEqual(totals(region="Littoral")["taux"], 50.0)
+
+    def test_timeline(self):
+        engine = AggregationEngine()
+        self.assertEqual(engine.presence_timeline("mois"), [{"label": "2026-03", "pr": 4, "total": 8, "taux": 50.0}])
+        self.assertEqual(
+            engine.presence_timeline("jour"),
+            [
+                {"label": "2026-03-02", "pr": 2, "total": 4, "taux": 50.0},
+                {"label": "2026-03-03", "pr": 2, "total": 4, "taux": 50.0},
+            ],
+        )
+
+    def test_api_chart_filters(self):
+        self.login()
+        url = reverse("reporting_api_chart", args=["RES00-01"])
+        response = self.client.get(url, {"region": "Centre"})
+        self.assertEqual(response.json()["value"], 75.0)
+        self.assertNotEqual(response["ETag"], self.client.get(url)["ETag"])
+        self.assertEqual(self.client.get(url, {"date_from": "2026-03-03", "date_to": "2026-03-02"}).status_code, 400)
+
+    def test_classe_cascade_delete(self):
+        version = DataVersion.objects.get(model="presences.presence").version
+        self.classes[1].delete()
+        self.assertEqual(set(self.cells()), {("C1", JOUR_1), ("C1", JOUR_2)})
+        self.assertEqual(PresenceFact.objects.count(), 4)
+        # Une seule invalidation pour toutes les presences supprimees en cascade.
+        self.assertEqual(DataVersion.objects.get(model="presences.presence").version, version + 1)
+
+
+class SeedReportingDataTests(TestCase):
+    def seed(self, **options):
+        volumes = dict(presences=300, apprenants=30, classes=6, prestataires=3, beneficiaires=2, formations=3, lieux=4)
+        call_command("seed_reporting_data", stdout=StringIO(), **{**volumes, **options})
+
+    def test_seed_fills_facts_and_rollup(self):
+        self.seed()
+        self.assertEqual(Classe.objects.count(), 6)
+        self.assertEqual(Apprenant.objects.count(), 30)
+        presences = Presence.objects.count()
+        self.assertEqual(PresenceFact.objects.count(), presences)
+        self.assertEqual(sum(PresenceDaily.objects.values_list("total", flat=True)), presences)
+        self.assertEqual(AggregationEngine().presence_totals()["total"], presences)
+
+    def test_refuses_non_empty_database(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+    def test_force_continues_after_existing_codes(self):
+        self.seed()
+        self.seed(force=True, seed=7)
+        self.assertEqual(Classe.objects.count(), 12)
+        # Codes numerotes a partir de 1, la relance reprend apres le dernier.
+        self.assertEqual(
+            list(Classe.objects.order_by("code").values_list("code", flat=True)[::11]), ["SYN-C00001", "SYN-C00012"]
+        )
+        self.assertEqual(Apprenant.objects.count(), 60)
+        self.assertEqual(sum(PresenceDaily.objects.values_list("total", flat=True)), Presence.objects.count())
+
+
+class ReportingWorkbookTests(ReportingDataMixin, TestCase):
+    def workbook(self, **params):
+        self.login()
+        response = self.client.get(reverse("reporting_export_excel"), params)
+        self.assertEqual(response["Content-Type"], XLSX_CONTENT_TYPE)
+        self.assertIn('filename="reporting.xlsx"', response["Content-Disposition"])
+        return load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+
+    def rows(self, workbook, title):
+        return list(workbook[title].iter_rows(values_only=True))
+
+    def test_sheets_match_engine(self):
+        workbook = self.workbook()
+        self.assertEqual(
+            workbook.sheetnames,
+            [
+                "Synthese",
+                "Presence",
+                "Presence periodes",
+                "Satisfaction",
+                "Environnement",
+                "Effectifs prestations",
+                "Repartition apprenants",
+            ],
+        )
+        synthese = dict(self.rows(workbook, "Synthese")[1:])
+        self.assertEqual(synthese["Presences (enquetes)"], 8)
+        self.assertEqual(synthese["Taux de presence global (%)"], 50)
+        presence = self.rows(workbook, "Presence")
+        self.assertIn(("prestataire", "Prestataire 1", 3, 4, 75), presence)
+        self.assertIn(("mois", "2026-03", 4, 8, 50), self.rows(workbook, "Presence periodes"))
+        effectifs = self.rows(workbook, "Effectifs prestations")
+        self.assertEqual([row[0] for row in effectifs[1:]], ["PS1", "PS2"])
+
+    def test_presence_filters(self):
+        synthese = dict(self.rows(self.workbook(region="Littoral"), "Synthese")[1:])
+        self.assertEqual(synthese["Taux de presence global (%)"], 25)
+        self.assertEqual(synthese["Filtres presence"], "region=Littoral")
+        invalid = {"date_from": "2026-03-03", "date_to": "2026-03-02"}
+        self.assertEqual(self.client.get(reverse("reporting_export_excel"), invalid).status_code, 400)
+
+
+def payload_item(n: int, **values) -> dict:
+    item = {
+        "nom_complet": f"Apprenant {n:03d}",
+        "beneficiaire": "Beneficiaire A",
+        "age": str(20 + n % 30),
+        "prestataire": f"Prestataire {n % 2}",
+        "intitule_formation_dispensee": "Couture",
+        "fenetre": "Fenetre 1",
+        "region": "Centre",
+        "lieu_formation": "Centre Yaounde",
+        "telephone1": f"6770{n:05d}",
+        "cohorte": "1",
+        "code": f"T{n:03d}",
+    }
+    item.update(values)
+    return item
+
+
+class ConsolidationPipelineTests(TestCase):
+    def save(self, items):
+        with transaction.atomic():
+            return save_related_from_payload(items)
+
+    def test_referentiels_and_apprenants_created(self):
+        result = self.save([payload_item(n) for n in range(1, 6)])
+        self.assertEqual((result.created, result.updated, result.conflicts), (5, 0, []))
+        self.assertEqual(Prestataire.objects.count(), 2)
+        self.assertEqual(Formation.objects.count(), 1)
+        self.assertEqual(Apprenant.objects.get(code="T004").formation.nom, "Couture")
+
+    def test_telephone_updates_existing_apprenant(self):
+        self.save([payload_item(1)])
+        result = self.save([payload_item(1, nom_complet="Apprenant Renomme", code="AUTRE", age="33")])
+        self.assertEqual((result.created, result.updated), (0, 1))
+        apprenant = Apprenant.objects.get()
+        self.assertEqual((apprenant.code, apprenant.nom_complet, apprenant.age), ("T001", "Apprenant Renomme", 33))
+
+    def test_numeric_columns_converted_per_column(self):
+        self.save([payload_item(1, age="25,0", cohorte="2.0", nb_annees_experience=" 3 "), payload_item(2, age="x")])
+        first, second = Apprenant.objects.order_by("code")
+        self.assertEqual((first.age, first.nb_annees_experience, first.classe.cohorte), (25, 3, 2))
+        self.assertEqual((second.age, second.nb_annees_experience), (None, 0))
+
+    def test_conflicts_reported_with_line(self):
+        items = [
+            payload_item(1),
+            payload_item(2, code="T001"),
+            payload_item(3, prestataire=""),
+            payload_item(4, intitule_formation_dispensee=""),
+        ]
+        result = self.save(items)
+        self.assertEqual(result.created, 1)
+        motifs = {conflict["ligne"]: conflict["motif"] for conflict in result.conflicts}
+        self.assertEqual(
+            motifs,
+            {
+                3: "code T001 deja attribue (ligne 2)",
+                4: "prestataire absent : classe et apprenant non crees",
+                5: "formation absente : apprenant non cree",
+            },
+        )
+
+    def test_query_count_independent_of_rows(self):
+        counts = []
+        # Deux fichiers sans referentiel commun, de 10 et 60 lignes.
+        for start, size in ((1, 10), (100, 60)):
+            refs = {"beneficiaire": f"Beneficiaire {start}", "intitule_formation_dispensee": f"Formation {start}"}
+            items = [
+                payload_item(n, prestataire=f"Prestataire {start + n % 2}", lieu_formation=f"Lieu {start + n % 3}", **refs)
+                for n in range(start, start + size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.save(items)
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+# En-tetes du classeur consolide, sous leur forme normalisee (voir CONSOLIDATION_HEADER_MAP).
+HEADERS = [
+    "N",
+    "Nom et prenom 0 Name first name",
+    "Beneficiaires",
+    "Age",
+    "Prestataire",
+    "Formation PADESCE",
+    "Fenetre",
+    "Region",
+    "Lieux",
+    "1er no tel 0 tel no apprenant",
+    "Cohorte",
+    "Code",
+]
+
+
+def consolidation_row(n: int, **values) -> list:
+    row = {
+        "numero": str(n),
+        "nom_complet": f"Apprenant {n:03d}",
+        "beneficiaire": "Beneficiaire A",
+        "age": str(20 + n % 30),
+        "prestataire": f"Prestataire {n % 2}",
+        "formation": "Couture",
+        "fenetre": "Fenetre 1",
+        "region": "Centre",
+        "lieu": "Centre Yaounde",
+        "telephone1": f"6770{n:05d}",
+        "cohorte": "1",
+        "code": f"T{n:03d}",
+    }
+    row.update(values)
+    return list(row.values())
+
+
+def consolidation_workbook(rows, header=HEADERS) -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Consolidation"
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class ConsolidationFileMixin:
+    """Classeurs consolides ecrits dans un repertoire d'attente temporaire."""
+
+    def setUp(self):
+        super().setUp()
+        staging = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging, ignore_errors=True)
+        settings_override = override_settings(CONSOLIDATION_STAGING_DIR=staging)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stage(self, rows) -> str:
+        return store_upload(SimpleUploadedFile("consolidation.xlsx", consolidation_workbook(rows)))
+
+
+class ConsolidationSheetTests(ConsolidationFileMixin, ReportingDataMixin, TestCase):
+    def post(self, rows, **data):
+        self.login()
+        upload = SimpleUploadedFile("consolidation.xlsx", consolidation_workbook(rows))
+        return self.client.post(reverse("consolidation_index"), {"fichier": upload, **data})
+
+    def test_stream_skips_blank_rows_and_reads_wide_columns(self):
+        header = [*HEADERS, *[""] * 22, "Classe ID"]
+        rows = [[*consolidation_row(1), *[""] * 22, "CL-A"], [], consolidation_row(3)]
+        headers, body = iter_consolidation_sheet(BytesIO(consolidation_workbook(rows, header=header)))
+        self.assertEqual(headers[34], "Classe ID")
+        lines = list(body)
+        self.assertEqual([line for line, _ in lines], [2, 4])
+        self.assertEqual(lines[0][1][34], "CL-A")
+
+    def test_preview_only(self):
+        response = self.post([consolidation_row(n) for n in range(1, 101)])
+        self.assertEqual(len(response.context["preview_rows"]), CONSO_PREVIEW_ROWS)
+        self.assertEqual(response.context["analysis"]["missing"][:1], ["arrondissement"])
+        self.assertFalse(Apprenant.objects.filter(code="T001").exists())
+
+    def test_preview_stops_early_and_extract_fills_cache(self):
+        self.post([consolidation_row(n) for n in range(1, 101)])
+        token = self.client.session[SESSION_KEY_CONSO]["token"]
+        # Apercu seul : le classeur n'est pas lu jusqu'au bout, pas de cache de lignes.
+        self.assertIsNone(load_rows(token))
+        response = self.client.post(reverse("consolidation_index"), {"extract_classes": "1"})
+        self.assertEqual(len(response.context["preview_rows"]), CONSO_PREVIEW_ROWS)
+        header, rows = load_rows(token)
+        self.assertEqual(len(list(rows)), 100)
+
+    def test_save_and_extract_classes(self):
+        rows = [consolidation_row(n) for n in range(1, 4)] + [consolidation_row(4, code="T001")]
+        response = self.post(rows, save="1")
+        self.assertEqual(response.context["errors"], [])
+        job = response.context["job"]
+        self.assertEqual(job.status, ConsolidationJob.QUEUED)
+        call_command("run_consolidation_jobs", once=True, stdout=StringIO())
+        self.assertEqual(Apprenant.objects.filter(code__startswith="T").count(), 3)
+        self.assertEqual(ConsolidationRecord.objects.count(), 4)
+        response = self.client.get(reverse("consolidation_index"), {"job": job.pk})
+        self.assertEqual([c["ligne"] for c in response.context["conflicts"]], [5])
+
+        # Le fichier reste en session : extraction des classes sans nouvel envoi.
+        response = self.client.post(reverse("consolidation_index"), {"extract_classes": "1"})
+        self.assertEqual(response.context["errors"], [])
+        self.assertEqual(len(response.context["preview_rows"]), 4)
+
+
+class ConsolidationStagingTests(ConsolidationFileMixin, ReportingDataMixin, TestCase):
+    def test_same_file_same_token(self):
+        rows = [consolidation_row(n) for n in range(1, 4)]
+        token = self.stage(rows)
+        self.assertEqual(self.stage(rows), token)
+        self.assertEqual(sorted(os.listdir(staging_dir())), [f"{token}.xlsx"])
+        with self.assertRaises(ValueError):
+            upload_path("../settings")
+
+    def test_session_keeps_token_and_rows_are_replayed(self):
+        self.login()
+        content = consolidation_workbook([consolidation_row(n) for n in (1, 2)])
+        upload = SimpleUploadedFile("consolidation.xlsx", content)
+        self.client.post(reverse("consolidation_index"), {"fichier": upload, "save": "1"})
+        session = self.client.session[SESSION_KEY_CONSO]
+        self.assertEqual(set(session), {"meta", "token"})
+        header, rows = load_rows(session["token"])
+        self.assertEqual(header[:2], HEADERS[:2])
+        self.assertEqual([line for line, _ in rows], [2, 3])
+
+        # Le classeur n'est plus relu : seul le cache de lignes sert a l'extraction.
+        os.unlink(upload_path(session["token"]))
+        response = self.client.post(reverse("consolidation_index"), {"extract_classes": "1"})
+        self.assertEqual(response.context["errors"], [])
+        self.assertEqual(len(response.context["preview_rows"]), 2)
+
+    def test_purge_expired(self):
+        old, recent = self.stage([consolidation_row(1)]), self.stage([consolidation_row(2)])
+        stamp = time.time() - 3600
+        os.utime(upload_path(old), (stamp, stamp))
+        self.assertEqual(purge_expired(ttl=60), 1)
+        self.assertIsNone(upload_path(old))
+        self.assertIsNotNone(upload_path(recent))
+
+    def test_purge_keeps_files_of_pending_jobs(self):
+        tokens = {status: self.stage([consolidation_row(n)]) for n, (status, _) in enumerate(ConsolidationJob.STATUS_CHOICES)}
+        for status, token in tokens.items():
+            ConsolidationJob.objects.create(token=token, status=status)
+        stamp = time.time() - 3600
+        for token in tokens.values():
+            os.utime(upload_path(token), (stamp, stamp))
+        self.assertEqual(purge_staged_uploads(ttl=60), 1)
+        self.assertEqual(
+            {status for status, token in tokens.items() if upload_path(token)},
+            {ConsolidationJob.QUEUED, ConsolidationJob.RUNNING, ConsolidationJob.FAILED},
+        )
+
+
+class ConsolidationJobTests(ConsolidationFileMixin, TestCase):
+    def test_enqueue_reuses_active_job(self):
+        token = self.stage([consolidation_row(1)])
+        job = enqueue_consolidation(token, "consolidation.xlsx")
+        self.assertEqual(enqueue_consolidation(token).pk, job.pk)
+        ConsolidationJob.objects.filter(pk=job.pk).update(status=ConsolidationJob.DONE)
+        self.assertNotEqual(enqueue_consolidation(token).pk, job.pk)
+
+    def test_claim_is_conditional(self):
+        first = enqueue_consolidation(self.stage([consolidation_row(1)]))
+        second = enqueue_consolidation(self.stage([consolidation_row(2)]))
+        claimed = claim_next_job()
+        self.assertEqual((claimed.pk, claimed.status, claimed.stage), (first.pk, ConsolidationJob.RUNNING, "lecture"))
+        self.assertIsNotNone(claimed.started_at)
+        # Job deja pris par un autre worker entre la lecture et la reservation : ignore.
+        ConsolidationJob.objects.filter(pk=second.pk).update(status=ConsolidationJob.RUNNING)
+        self.assertIsNone(claim_next_job())
+
+    def test_worker_runs_queue(self):
+        rows = [consolidation_row(n) for n in range(1, 5)] + [consolidation_row(5, code="T001")]
+        job = enqueue_consolidation(self.stage(rows), "consolidation.xlsx")
+        missing = enqueue_consolidation("0" * 16)
+        stuck = ConsolidationJob.objects.create(token="1" * 16, status=ConsolidationJob.RUNNING)
+        err = StringIO()
+        call_command("run_consolidation_jobs", once=True, stdout=StringIO(), stderr=err)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ConsolidationJob.DONE)
+        self.assertEqual((job.rows_parsed, job.apprenants_created, len(job.conflicts)), (5, 4, 1))
+        self.assertEqual(Apprenant.objects.count(), 4)
+        missing.refresh_from_db()
+        self.assertEqual(missing.status, ConsolidationJob.FAILED)
+        self.assertIn("expire", missing.error)
+        stuck.refresh_from_db()
+        self.assertEqual(stuck.status, ConsolidationJob.FAILED)
+        self.assertIn("1 job(s) interrompu(s)", err.getvalue())
+
+    def test_status_endpoint(self):
+        job = enqueue_consolidation(self.stage([consolidation_row(1)]), "consolidation.xlsx")
+        user = get_user_model().objects.create_user(username="suivi", password="x")
+        self.client.force_login(user)
+        self.addCleanup(set_current_user, None)
+        body = self.client.get(reverse("consolidation_job_status", args=[job.pk])).json()
+        self.assertEqual((body["status"], body["file_name"], body["errors"]), ("queued", "consolidation.xlsx", 0))
+        self.assertEqual(self.client.get(reverse("consolidation_job_status", args=[job.pk + 1])).status_code, 404)
+
+
+class ShadowReplaceTests(ConsolidationFileMixin, TransactionTestCase):
+    databases = {"default", SHADOW_ALIAS}
+
+    def setUp(self):
+        super().setUp()
+        # La bascule supprime la base fantome : la recreer pour le vidage de fin de test.
+        self.addCleanup(prepare_shadow)
+        replace_from_staged(self.stage([consolidation_row(n) for n in range(1, 4)]))
+
+    def test_replace_swaps_tables(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = replace_from_staged(self.stage([consolidation_row(n) for n in range(4, 6)]))
+        self.assertEqual((result.created, result.conflicts), (2, []))
+        self.assertEqual(sorted(Apprenant.objects.values_list("code", flat=True)), ["T004", "T005"])
+        self.assertEqual(ConsolidationRecord.objects.count(), 2)
+        # Base principale : lecture du schema puis copie, aucune insertion ligne a ligne.
+        inserts = [q["sql"] for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertTrue(inserts)
+        self.assertTrue(all("SELECT * FROM consolidation_shadow." in sql for sql in inserts))
+
+    def test_failed_validation_keeps_live_tables(self):
+        with mock.patch(
+            "App_PADESCE.reporting.consolidation.validate_shadow", side_effect=ValueError("Import refuse")
+        ):
+            with self.assertRaises(ValueError):
+                replace_from_staged(self.stage([consolidation_row(9)]))
+        self.assertEqual(sorted(Apprenant.objects.values_list("code", flat=True)), ["T001", "T002", "T003"])
+        self.assertEqual(ConsolidationRecord.objects.count(), 3)
+
+
+@override_settings(CONSOLIDATION_BATCH_SIZE=2)
+class IncrementalConsolidationTests(ConsolidationFileMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = [consolidation_row(n) for n in range(1, 6)]
+        first = apply_incremental(self.stage(self.rows))
+        self.assertEqual((first.created, first.conflicts), (5, []))
+
+    def test_reimport_same_file_is_noop(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = apply_incremental(self.stage(self.rows))
+        self.assertEqual((result.unchanged, result.created, result.updated, result.deleted), (5, 0, 0, 0))
+        written = [
+            q["sql"]
+            for q in queries.captured_queries
+            if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+            and ("apprenants_apprenant" in q["sql"] or "reporting_consolidationrecord" in q["sql"])
+        ]
+        self.assertEqual(written, [])
+
+    def test_changed_and_removed_rows(self):
+        rows = self.rows[:4]
+        rows[1] = consolidation_row(2, age="41")
+        result = apply_incremental(self.stage(rows))
+        self.assertEqual((result.unchanged, result.updated, result.created, result.deleted), (3, 1, 0, 1))
+        self.assertEqual(Apprenant.objects.get(nom_complet="Apprenant 002").age, 41)
+        self.assertFalse(Apprenant.objects.get(nom_complet="Apprenant 005").actif)
+        self.assertEqual(ConsolidationRecord.objects.filter(actif=True).count(), 4)
+        self.assertEqual(Apprenant.objects.filter(actif=True).count(), 4)
+
+    def test_conflict_row_retried(self):
+        rows = [*self.rows, consolidation_row(6, code="X001")]
+        taken = Apprenant.objects.get(nom_complet="Apprenant 001")
+        Apprenant.objects.filter(pk=taken.pk).update(code="X001")
+        result = apply_incremental(self.stage(rows))
+        self.assertEqual([conflict["ligne"] for conflict in result.conflicts], [7])
+        # Le code est libere : la ligne en conflit, inchangee dans le fichier, est retraitee.
+        Apprenant.objects.filter(pk=taken.pk).update(code="T001")
+        result = apply_incremental(self.stage(rows))
+        self.assertEqual((result.unchanged, result.created, result.conflicts), (5, 1, []))
+        self.assertEqual(Apprenant.objects.get(nom_complet="Apprenant 006").code, "X001")
+
+    def test_removed_row_restored(self):
+        apply_incremental(self.stage(self.rows[:4]))
+        result = apply_incremental(self.stage(self.rows))
+        self.assertEqual((result.unchanged, result.created, result.deleted), (4, 0, 0))
+        self.assertTrue(Apprenant.objects.get(nom_complet="Apprenant 005").actif)
+        self.assertEqual(Apprenant.objects.count(), 5)
+
+
+@override_settings(CONSOLIDATION_BATCH_SIZE=2)
+class ConsolidationResumeTests(ConsolidationFileMixin, TestCase):
+    """Import incremental interrompu : reprise apres le dernier lot valide."""
+
+    def setUp(self):
+        super().setUp()
+        token = self.stage([consolidation_row(n) for n in range(1, 6)])
+        self.job = enqueue_consolidation(token, "consolidation.xlsx", mode=ConsolidationJob.INCREMENTAL)
+
+    def fail_second_batch(self):
+        original = consolidation._apply_batch
+        calls = []
+
+        def flaky(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("panne simulee")
+            return original(*args)
+
+        with mock.patch.object(consolidation, "_apply_batch", side_effect=flaky):
+            with self.assertLogs("App_PADESCE.reporting.jobs", "ERROR"):
+                job = run_job(claim_next_job())
+        self.assertEqual(job.status, ConsolidationJob.FAILED)
+        self.assertEqual((job.rows_committed, job.checkpoint_line, job.apprenants_created), (2, 3, 2))
+        self.assertEqual(Apprenant.objects.count(), 2)
+        return job
+
+    def run_resumed(self):
+        with mock.patch.object(consolidation, "_apply_batch", wraps=consolidation._apply_batch) as spy:
+            job = run_job(claim_next_job())
+        applied = [[lines[i] for i in todo] for todo, _, _, lines, *_ in (c.args for c in spy.call_args_list)]
+        return job, applied
+
+    def test_resume_failed_job_skips_committed_lines(self):
+        job = self.fail_second_batch()
+        self.assertTrue(resume_job(job))
+        job, applied = self.run_resumed()
+        self.assertEqual(job.status, ConsolidationJob.DONE)
+        # Lignes Excel 2 et 3 deja validees : seules les suivantes sont rejouees.
+        self.assertEqual(applied, [[4, 5], [6]])
+        self.assertEqual((job.rows_committed, job.apprenants_created, job.conflicts), (5, 5, []))
+        # Creations de referentiels du premier lot reprises du point de reprise.
+        models = (Beneficiaire, Prestataire, Formation, Lieu, Prestation, Classe)
+        self.assertEqual(job.referentiels, {model._meta.model_name: model.objects.count() for model in models})
+        self.assertEqual(job.referentiels_created, 11)
+        self.assertEqual(Apprenant.objects.count(), 5)
+        self.assertEqual(ConsolidationRecord.objects.count(), 5)
+
+    def test_interrupted_job_requeued_and_resumed(self):
+        job = self.fail_second_batch()
+        # Arret brutal du worker pendant le lot : le job reste "en cours".
+        ConsolidationJob.objects.filter(pk=job.pk).update(status=ConsolidationJob.RUNNING)
+        self.assertEqual(requeue_interrupted_jobs(), (1, 0))
+        job, applied = self.run_resumed()
+        self.assertEqual(job.status, ConsolidationJob.DONE)
+        self.assertEqual(applied, [[4, 5], [6]])
+        self.assertEqual(Apprenant.objects.count(), 5)
+
+    def test_interrupted_job_fails_after_max_attempts(self):
+        ConsolidationJob.objects.filter(pk=self.job.pk).update(
+            status=ConsolidationJob.RUNNING, attempts=MAX_ATTEMPTS
+        )
+        self.assertEqual(requeue_interrupted_jobs(), (0, 1))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ConsolidationJob.FAILED)
+        self.assertIsNone(claim_next_job())
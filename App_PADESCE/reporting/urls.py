@@ -1,7 +1,8 @@
 from django.urls import path
 
-from App_PADESCE.reporting.api import api_chart
+from App_PADESCE.reporting.api import api_cache_stats, api_chart, api_chart_batch
 from App_PADESCE.reporting.views import (
+    consolidation_job_status,
     consolidation_view,
     export_csv,
     export_excel,
@@ -13,8 +14,11 @@ from App_PADESCE.reporting.views import (
 urlpatterns = [
     path("", reporting_home, name="reporting_index"),
     path("consolidation/", consolidation_view, name="consolidation_index"),
+    path("consolidation/jobs/<int:pk>/", consolidation_job_status, name="consolidation_job_status"),
     path("export/csv/", export_csv, name="reporting_export_csv"),
     path("export/excel/", export_excel, name="reporting_export_excel"),
+    path("api/cache/stats/", api_cache_stats, name="reporting_api_cache_stats"),
+    path("api/batch/", api_chart_batch, name="reporting_api_batch"),
     path("api/<str:code>/", api_chart, name="reporting_api_chart"),
     path("embed/<str:code>/", reporting_embed, name="reporting_embed"),
     path("embed/table/<str:code>/", reporting_embed_table, name="reporting_embed_table"),
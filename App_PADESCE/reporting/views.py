@@ -1,370 +1,53 @@
-import base64
 import csv
-import io
-import unicodedata
-from decimal import Decimal, InvalidOperation
+import tempfile
+from collections import deque
+from itertools import islice
 
-from openpyxl import load_workbook
-
-from django.db.models import Avg, Count, Q, Sum
-from django.http import Http404, HttpResponse
-from django.shortcuts import render
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import redirect, render
 from contextlib import contextmanager
-from django.db import connection, transaction, OperationalError
+from django.db import OperationalError
 from django.contrib import messages
-from django.utils.text import slugify
 
-from App_PADESCE.apprenants.models import Apprenant, SmsLog
+from App_PADESCE.apprenants.models import Apprenant
 from App_PADESCE.environnement.models import EnqueteEnvironnement
-from App_PADESCE.formations.models import Classe, Formation, Prestation, Prestataire, Beneficiaire, Lieu
+from App_PADESCE.formations.models import Classe, Prestation, Prestataire, Beneficiaire, Lieu
 from App_PADESCE.presences.models import Presence
 from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
 from App_PADESCE.satisfaction_formateurs.models import SatisfactionFormateur
-from App_PADESCE.reporting.forms import ConsolidationUploadForm
-from App_PADESCE.reporting.models import ConsolidationRecord
-
-
-def _normalize_cell(value) -> str:
-    if value is None:
-        return ""
-    if isinstance(value, (int, float)):
-        if isinstance(value, float) and value.is_integer():
-            return str(int(value))
-        return str(value)
-    return str(value).strip()
-
-
-def _normalize_header(value: str) -> str:
-    if not value:
-        return ""
-    normalized = unicodedata.normalize("NFKD", str(value))
-    ascii_only = "".join(ch for ch in normalized if not unicodedata.combining(ch))
-    ascii_only = ascii_only.lower().replace("&", "and").replace("’", "'")
-    ascii_only = "".join(ch if ch.isalnum() or ch.isspace() else " " for ch in ascii_only)
-    return " ".join(ascii_only.split())
-
-
-MAX_CONSO_COLS = 40  # Augmenté pour être sûr de ne pas couper la colonne Classe ID
-
-# Mapping plus tolérant pour "Classe ID"
-CONSOLIDATION_HEADER_MAP = {
-    "n": "numero",
-    "nom et prenom 0 name first name": "nom_complet",
-    "nom et prenom 0 name and first name": "nom_complet",
-    "beneficiaires": "beneficiaire",
-    "genre h0f 0 gender m0f": "genre",
-    "age": "age",
-    "fonction d c e m b": "fonction",
-    "qualification chiffre 0 1 2 etc": "qualification",
-    "nb d annees d experience chiffre 0 1 2 etc": "nb_annees_experience",
-    "ville de residence de l appprenant": "ville_residence",
-    "prestataire": "prestataire",
-    "type de formation declaree": "intitule_formation_solicitee",
-    "formation padesce": "intitule_formation_dispensee",
-    "fenetre": "fenetre",
-    "ville de la formation": "ville_formation",
-    "arrondissement": "arrondissement",
-    "departement": "departement",
-    "region": "region",
-    "lieux": "lieu_formation",
-    "precision sur le lieu 0 quartier de formation": "precision_lieu",
-    "coordonnees gps du lieu de formation longitude": "longitude",
-    "coordonnees gps du lieu de formation latitude": "latitude",
-    "1er no tel 0 tel no apprenant": "telephone1",
-    "2e no tel 0 tel no apprenant si disponible": "telephone2",
-    "cohorte": "cohorte",
-    "tel formateur 0 point focal sur place": "tel_formateur",
-    "code": "code",
-    "cout unitaire subvention mcdc ttc": "cout_unitaire_subvention",
-    "montant total subvention mcdc ttc": "montant_total_subvention",
-    "statut de la prestation": "statut_prestation",
-
-    # Variantes pour Classe ID – très tolérant
-    "classe id": "classe_id",
-    "class id": "classe_id",
-    "classeid": "classe_id",
-    "classid": "classe_id",
-    "id classe": "classe_id",
-    "classe": "classe_id",               # fallback si "ID" est absent
-    "classe_id": "classe_id",
-    "id de classe": "classe_id",
-    "numero classe": "classe_id",
-    "code classe": "classe_id",
-}
+from App_PADESCE.reporting.aggregation import DIMENSION_MODELS, AggregationEngine, PresenceFilters
+from App_PADESCE.core.importing import normalize_header
+from App_PADESCE.reporting.consolidation import (
+    CONSOLIDATION_HEADER_MAP,
+    CONSOLIDATION_INDEX,
+    rows_to_records,
+    staged_sheet,
+)
+from App_PADESCE.reporting.forms import ConsolidationUploadForm, PresenceFilterForm
+from App_PADESCE.reporting.models import ConsolidationJob, ReportingSnapshot
+from App_PADESCE.reporting.api import chart_sources
+from App_PADESCE.reporting.jobs import enqueue_consolidation, purge_staged_uploads, resume_job
+from App_PADESCE.reporting.cache import (
+    DataVersions,
+    cached_payload,
+    data_condition,
+    request_versions,
+)
+from App_PADESCE.reporting.staging import store_upload
+from App_PADESCE.reporting.workbook import XLSX_CONTENT_TYPE, write_reporting_workbook
+from App_PADESCE.reporting.snapshot import (
+    PRESENCE_SOURCES,
+    SNAPSHOT_SOURCES,
+    compute_presence_context,
+    get_home_context,
+    with_presence_context,
+)
 
 
 SESSION_KEY_CONSO = "consolidation_upload"
 
 
-def _ensure_prestataire(name: str) -> Prestataire | None:
-    if not name:
-        return None
-    raw = str(name).strip()
-    if not raw:
-        return None
-    code = raw[:50]
-    obj, _ = Prestataire.objects.get_or_create(code=code, defaults={"raison_sociale": raw})
-    if obj.raison_sociale != raw:
-        obj.raison_sociale = raw
-        obj.save(update_fields=["raison_sociale"])
-    return obj
-
-
-def _reset_consolidation_tables():
-    """
-    Empty the tables that are rebuilt from consolidation imports using raw SQL to avoid
-    instantiating large querysets and keep the request from timing out.
-    """
-    tables = (
-        SatisfactionApprenant,
-        SatisfactionFormateur,
-        Presence,
-        SmsLog,
-        Apprenant,
-        Classe,
-        Prestation,
-        Formation,
-        Prestataire,
-        Beneficiaire,
-        Lieu,
-    )
-    with connection.cursor() as cursor:
-        needs_toggle = connection.vendor in {"sqlite", "mysql"}
-        if needs_toggle:
-            if connection.vendor == "sqlite":
-                cursor.execute("PRAGMA foreign_keys = OFF")
-            else:
-                cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
-        for model in tables:
-            table_name = connection.ops.quote_name(model._meta.db_table)
-            cursor.execute(f"DELETE FROM {table_name}")
-        if needs_toggle:
-            if connection.vendor == "sqlite":
-                cursor.execute("PRAGMA foreign_keys = ON")
-            else:
-                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
-
-
-def _ensure_formation(intitule: str, fenetre: str = "") -> Formation | None:
-    if not intitule:
-        return None
-    raw = str(intitule).strip()
-    if not raw:
-        return None
-    code = raw[:50]
-    obj, _ = Formation.objects.get_or_create(code=code, defaults={"nom": raw, "fenetre": fenetre})
-    if obj.nom != raw or (fenetre and obj.fenetre != fenetre):
-        obj.nom = raw
-        if fenetre:
-            obj.fenetre = fenetre
-        obj.save(update_fields=["nom", "fenetre"])
-    return obj
-
-
-def _ensure_beneficiaire(name: str, region: str = "", departement: str = "", arrondissement: str = "", ville: str = "") -> Beneficiaire | None:
-    if not name:
-        return None
-    raw = str(name).strip()
-    if not raw:
-        return None
-    obj, _ = Beneficiaire.objects.get_or_create(
-        nom_structure=raw,
-        defaults={"region": region, "departement": departement, "arrondissement": arrondissement, "ville": ville},
-    )
-    return obj
-
-
-def _ensure_lieu(nom: str, region: str = "", departement: str = "", arrondissement: str = "", ville: str = "", longitude: str = "", latitude: str = "", precision: str = "") -> Lieu | None:
-    if not nom:
-        return None
-    raw = str(nom).strip()
-    if not raw:
-        return None
-    code = raw[:50]
-    obj, _ = Lieu.objects.get_or_create(
-        code=code,
-        defaults={
-            "nom_lieu": raw,
-            "region": region,
-            "departement": departement,
-            "arrondissement": arrondissement,
-            "ville": ville,
-            "longitude": longitude,
-            "latitude": latitude,
-            "precision": precision,
-        },
-    )
-    return obj
-
-
-def _ensure_prestation(prestataire: Prestataire | None, formation: Formation | None, beneficiaire: Beneficiaire | None, code_hint: str = "") -> Prestation | None:
-    if not prestataire or not formation:
-        return None
-    code_raw = (code_hint or "").strip()
-    code = (code_raw or "null")[:50]
-    obj, _ = Prestation.objects.get_or_create(
-        code=code,
-        defaults={"prestataire": prestataire, "formation": formation, "beneficiaire": beneficiaire},
-    )
-    return obj
-
-
-def _ensure_classe(
-    prestation: Prestation | None,
-    formation: Formation | None,
-    fenetre: str = "",
-    cohorte: str = "",
-    classe_id: str = "",
-) -> Classe | None:
-    if not prestation or not formation:
-        return None
-
-    # Priorité : utiliser classe_id comme code si présent et non vide
-    code_raw = (classe_id or "").strip()
-    if not code_raw:
-        # Fallback si classe_id absent → code court unique
-        code_raw = f"CL-{formation.code[:6] or 'XX'}-{fenetre or 'X'}-{cohorte or '1'}"
-
-    code = code_raw[:20]
-
-    # Construction du nom/intitulé lisible
-    formation_nom = formation.nom.strip()
-    if len(formation_nom) > 120:
-        formation_nom = formation_nom[:117] + "..."
-
-    # Format préféré : CLAxxx — Nom de la formation
-    classe_nom = f"{code} — {formation_nom}"
-
-    # Si cohorte > 1, on peut l'ajouter pour plus de clarté (optionnel)
-    cohorte_int = _to_int(cohorte)
-    if cohorte_int and cohorte_int > 1:
-        classe_nom += f" (cohorte {cohorte_int})"
-
-    obj, created = Classe.objects.get_or_create(
-        code=code,
-        defaults={
-            "prestation": prestation,
-            "formation": formation,
-            "intitule_formation": formation_nom,
-            "fenetre": fenetre or "",
-            "cohorte": cohorte_int if cohorte_int else 1,
-        },
-    )
-
-    # Mise à jour si déjà existant mais nom différent
-    if not created:
-        updated = False
-        if obj.intitule_formation != formation_nom:
-            obj.intitule_formation = formation_nom
-            updated = True
-        if updated:
-            obj.save(update_fields=["intitule_formation"])
-
-    return obj
-
-def _to_int(value):
-    try:
-        if value is None or value == "":
-            return None
-        val = str(value).strip().replace(" ", "")
-        return int(float(val))
-    except (ValueError, TypeError):
-        return None
-
-
-def _to_decimal(value):
-    if value in (None, ""):
-        return None
-    try:
-        cleaned = str(value).replace(" ", "").replace(",", ".")
-        return Decimal(cleaned)
-    except (InvalidOperation, ValueError):
-        return None
-
-
-def _read_consolidation_sheet(file_obj, max_rows: int | None = 60):
-    wb = load_workbook(file_obj, data_only=True)
-    if "Consolidation" not in wb.sheetnames:
-        raise ValueError("Feuille 'Consolidation' introuvable dans le fichier.")
-    ws = wb["Consolidation"]
-    header = None
-    rows = []
-    for r_idx, row in enumerate(ws.iter_rows(values_only=True)):
-        cells = [_normalize_cell(c) for c in row][:MAX_CONSO_COLS]
-        if header is None:
-            header = cells
-            continue
-        if not any(cells):
-            continue
-        rows.append(cells)
-        if max_rows and len(rows) >= max_rows:
-            break
-    return header or [], rows
-
-
-def _rows_to_records(header, rows):
-    header_norm = [_normalize_header(h) for h in header]
-    
-    # Mapping index → field
-    header_map = {}
-    for idx, h in enumerate(header_norm):
-        field = CONSOLIDATION_HEADER_MAP.get(h)
-        if field:
-            header_map[idx] = field
-    
-    records = []
-    related_payload = []
-    
-    for row in rows:
-        cells = [_normalize_cell(c) for c in row]
-        if not any(cells):
-            continue
-            
-        data = {}
-        for idx, field in header_map.items():
-            if idx < len(cells):
-                data[field] = cells[idx]
-                
-        # Debug rapide (à commenter après test)
-        # if "classe_id" not in data or not data["classe_id"]:
-        #     print("Ligne sans classe_id →", data.get("nom_complet", "inconnu"))
-                
-        records.append(
-            ConsolidationRecord(
-                numero=data.get("numero", ""),
-                nom_complet=data.get("nom_complet", ""),
-                beneficiaire=data.get("beneficiaire", ""),
-                genre=data.get("genre", ""),
-                age=_to_int(data.get("age")),
-                fonction=data.get("fonction", ""),
-                qualification=data.get("qualification", ""),
-                nb_annees_experience=_to_int(data.get("nb_annees_experience")),
-                ville_residence=data.get("ville_residence", ""),
-                prestataire=data.get("prestataire", ""),
-                intitule_formation_solicitee=data.get("intitule_formation_solicitee", ""),
-                intitule_formation_dispensee=data.get("intitule_formation_dispensee", ""),
-                fenetre=data.get("fenetre", ""),
-                ville_formation=data.get("ville_formation", ""),
-                arrondissement=data.get("arrondissement", ""),
-                departement=data.get("departement", ""),
-                region=data.get("region", ""),
-                lieu_formation=data.get("lieu_formation", ""),
-                precision_lieu=data.get("precision_lieu", ""),
-                longitude=data.get("longitude", ""),
-                latitude=data.get("latitude", ""),
-                telephone1=data.get("telephone1", ""),
-                telephone2=data.get("telephone2", ""),
-                cohorte=data.get("cohorte", ""),
-                tel_formateur=data.get("tel_formateur", ""),
-                code=data.get("code", ""),
-                cout_unitaire_subvention=_to_decimal(data.get("cout_unitaire_subvention")),
-                montant_total_subvention=_to_decimal(data.get("montant_total_subvention")),
-                statut_prestation=data.get("statut_prestation", ""),
-            )
-        )
-        related_payload.append(data)
-    
-    return records, related_payload
+CONSO_PREVIEW_ROWS = 60
 
 
 def _extract_unique_classe_ids(payload: list[dict]) -> list[str]:
@@ -372,458 +55,112 @@ def _extract_unique_classe_ids(payload: list[dict]) -> list[str]:
     return sorted(code for code in classes if code)
 
 
-def _save_related_from_payload(payload: list[dict]):
-    seen_benef = {}
-    seen_prest = {}
-    seen_form = {}
-    seen_lieu = {}
-    seen_classe = {}
-    created_apprenants = 0
-
-    for item in payload:
-        ben_name = item.get("beneficiaire", "").strip()
-        ben_key = ben_name.lower()
-        prest_name = item.get("prestataire", "").strip()
-        prest_key = prest_name.lower()
-        intitule = item.get("intitule_formation_dispensee") or item.get("intitule_formation_solicitee") or ""
-        intitule_key = intitule.lower()
-        fenetre = item.get("fenetre", "") or ""
-        lieu_nom = item.get("lieu_formation", "").strip()
-        lieu_key = lieu_nom.lower()
-        classe_id = (item.get("classe_id") or "").strip()
-        cohorte_raw = item.get("cohorte", "")
-
-        region = item.get("region", "").strip()
-        departement = item.get("departement", "").strip()
-        arrondissement = item.get("arrondissement", "").strip()
-        ville = item.get("ville_formation", "").strip()
-
-        beneficiaire = seen_benef.get(ben_key) or _ensure_beneficiaire(
-            ben_name, region=region, departement=departement, arrondissement=arrondissement, ville=ville
-        )
-        if beneficiaire:
-            seen_benef[ben_key] = beneficiaire
-
-        prestataire = seen_prest.get(prest_key) or _ensure_prestataire(prest_name)
-        if prestataire:
-            seen_prest[prest_key] = prestataire
-
-        formation = seen_form.get(intitule_key) or _ensure_formation(intitule, fenetre=fenetre)
-        if formation:
-            seen_form[intitule_key] = formation
-
-        lieu = seen_lieu.get(lieu_key) or _ensure_lieu(
-            lieu_nom,
-            region=region,
-            departement=departement,
-            arrondissement=arrondissement,
-            ville=ville,
-            longitude=item.get("longitude", ""),
-            latitude=item.get("latitude", ""),
-            precision=item.get("precision_lieu", ""),
-        )
-        if lieu:
-            seen_lieu[lieu_key] = lieu
-
-        prestation = _ensure_prestation(prestataire, formation, beneficiaire, code_hint=item.get("code", ""))
-        
-        # Clé unique pour la classe : on priorise classe_id si présent
-        classe_key = classe_id.lower() if classe_id else f"{prestation.id if prestation else 'noprest'}-{fenetre}-{cohorte_raw}".lower()
-        
-        classe = seen_classe.get(classe_key)
-        if not classe:
-            classe = _ensure_classe(
-                prestation,
-                formation,
-                fenetre=fenetre,
-                cohorte=cohorte_raw,
-                classe_id=classe_id,
-            )
-            if classe:
-                seen_classe[classe_key] = classe
-
-        if classe and formation:
-            code_appr = (item.get("code") or "").strip()
-            if not code_appr:
-                code_appr = f"AP-{slugify(item.get('nom_complet','')[:12])}-{classe.code[:8]}"
-            tel1 = (item.get("telephone1") or "").strip()
-            tel2 = (item.get("telephone2") or "").strip()
-            defaults = {
-                "nom_complet": item.get("nom_complet", ""),
-                "genre": item.get("genre", ""),
-                "age": _to_int(item.get("age")),
-                "fonction": item.get("fonction", ""),
-                "qualification": item.get("qualification", ""),
-                "nb_annees_experience": _to_int(item.get("nb_annees_experience")) or 0,
-                "fenetre": fenetre,
-                "telephone1": tel1 or None,
-                "telephone2": tel2 or None,
-                "ville_residence": item.get("ville_residence", ""),
-                "region": region,
-                "departement": departement,
-                "arrondissement": arrondissement,
-                "code_ville": item.get("ville_formation", ""),
-                "appartenance_beneficiaire": True,
-            }
-            try:
-                existing = None
-                if tel1:
-                    existing = Apprenant.objects.filter(formation=formation, telephone1=tel1).first()
-                if existing:
-                    for field, val in defaults.items():
-                        setattr(existing, field, val)
-                    existing.classe = classe
-                    existing.formation = formation
-                    existing.save()
-                else:
-                    obj, created = Apprenant.objects.get_or_create(
-                        code=code_appr,
-                        defaults={**defaults, "classe": classe, "formation": formation},
-                    )
-                    if created:
-                        created_apprenants += 1
-            except Exception:
-                continue  # on saute la ligne en cas de conflit unique
-
-    return created_apprenants
-
-
-def consolidation_view(request):
-    form = ConsolidationUploadForm(request.POST or None, request.FILES or None)
-    headers = []
-    preview_rows = []
-    analysis = {"mapped": [], "missing": [], "extras": []}
-    errors = []
-    file_meta = request.session.get(SESSION_KEY_CONSO, {}).get("meta", {})
-    save_requested = bool(request.POST.get("save"))
-    extract_requested = bool(request.POST.get("extract_classes"))
-    unique_classe_ids: list[str] = []
-
-    if request.method == "POST" and form.is_valid():
-        fichier = form.cleaned_data.get("fichier")
-        try:
-            content = None
-            if fichier:
-                content = fichier.read()
-                file_meta = {
-                    "name": getattr(fichier, "name", ""),
-                    "size": getattr(fichier, "size", 0),
-                }
-                request.session[SESSION_KEY_CONSO] = {
-                    "meta": file_meta,
-                    "b64": base64.b64encode(content).decode("ascii"),
-                }
-                request.session.modified = True
-            elif save_requested and request.session.get(SESSION_KEY_CONSO):
-                cached = request.session.get(SESSION_KEY_CONSO, {})
-                b64 = cached.get("b64")
-                if b64:
-                    content = base64.b64decode(b64)
-                    file_meta = cached.get("meta", {})
-            if not content:
-                raise ValueError("Veuillez charger un fichier consolidé avant de valider.")
-
-            buffer_preview = io.BytesIO(content)
-            headers, preview_rows = _read_consolidation_sheet(buffer_preview, max_rows=60)
-            analysis = _analyze_headers(headers)
-            if save_requested or extract_requested:
-                buffer_full = io.BytesIO(content)
-                full_headers, all_rows = _read_consolidation_sheet(buffer_full, max_rows=None)
-                records, payload = _rows_to_records(full_headers, all_rows)
-                if not records:
-                    raise ValueError("Aucune ligne valide à enregistrer.")
-                unique_classe_ids = _extract_unique_classe_ids(payload)
-                if save_requested:
-                    try:
-                        _reset_consolidation_tables()
-                        ConsolidationRecord.objects.all().delete()
-                        with transaction.atomic():
-                            ConsolidationRecord.objects.bulk_create(records, ignore_conflicts=False)
-                            created = _save_related_from_payload(payload)
-                        messages.success(request, f"{len(records)} lignes importées → {created} apprenants créés/mis à jour (remplacement complet).")
-                    except OperationalError:
-                        errors.append("Base de données occupée (database locked). Réessayez dans un instant.")
-        except Exception as exc:
-            errors.append(str(exc))
-            preview_rows = []
-
-    return render(
-        request,
-        "reporting/consolidation.html",
-        {
-            "form": form,
-            "headers": headers,
-            "preview_rows": preview_rows,
-            "analysis": analysis,
-        "errors": errors,
-        "file_meta": file_meta,
-        "unique_classe_ids": unique_classe_ids,
-        },
-    )
-
-
-# Les autres fonctions (reporting_home, get_table_data, etc.) restent inchangées
-# (je ne les ai pas recopiées ici pour ne pas alourdir, mais elles doivent rester dans le fichier)
-
-# Fonction d'analyse des headers (à conserver ou à réactiver pour debug)
 def _analyze_headers(headers):
-    normalized_headers = [_normalize_header(h or "") for h in headers]
-    mapped_fields = set()
-    for h in normalized_headers:
-        mapped = CONSOLIDATION_HEADER_MAP.get(h)
-        if mapped:
-            mapped_fields.add(mapped)
+    columns = CONSOLIDATION_INDEX.resolve(headers)
+    mapped_fields = set(columns.positions)
     expected = {v for v in CONSOLIDATION_HEADER_MAP.values() if not v.startswith("cout") and not v.startswith("montant") and not v.startswith("statut")}
     missing = sorted(expected - mapped_fields)
-    extras = [headers[idx] for idx, h in enumerate(normalized_headers) if h not in CONSOLIDATION_HEADER_MAP and h]
+    # Colonnes non lues : inconnues, ou doublon d'un champ deja pris par un meilleur alias.
+    used = set(columns.positions.values())
+    extras = [header for idx, header in enumerate(headers) if idx not in used and normalize_header(header)]
     return {
         "mapped": sorted(mapped_fields),
         "missing": missing,
-        "extras": [e for e in extras if e],
+        "extras": extras,
     }
-def _read_consolidation_sheet(file_obj, max_rows: int | None = 60):
-    wb = load_workbook(file_obj, data_only=True)
-    if "Consolidation" not in wb.sheetnames:
-        raise ValueError("Feuille 'Consolidation' introuvable dans le fichier.")
-    ws = wb["Consolidation"]
-    header = None
-    rows = []
-    for r_idx, row in enumerate(ws.iter_rows(values_only=True)):
-        # Stop after the expected columns, including "Classe ID".
-        cells = [_normalize_cell(c) for c in row][:MAX_CONSO_COLS]
-        if header is None:
-            header = cells
-            continue
-        if not any(cells):
-            continue
-        rows.append(cells)
-        if max_rows and len(rows) >= max_rows:
-            break
-    return header or [], rows
-
-
-def _rows_to_records(header, rows):
-    header_norm = [_normalize_header(h) for h in header[:MAX_CONSO_COLS]]
-    header_map = {idx: CONSOLIDATION_HEADER_MAP[h] for idx, h in enumerate(header_norm) if h in CONSOLIDATION_HEADER_MAP}
-    records = []
-    related_payload = []
-    for row in rows:
-        cells = [_normalize_cell(c) for c in row][:29]
-        if not any(cells):
-            continue
-        data = {}
-        for idx, field in header_map.items():
-            if idx < len(cells):
-                data[field] = cells[idx]
-        records.append(
-            ConsolidationRecord(
-                numero=data.get("numero", ""),
-                nom_complet=data.get("nom_complet", ""),
-                beneficiaire=data.get("beneficiaire", ""),
-                genre=data.get("genre", ""),
-                age=_to_int(data.get("age")),
-                fonction=data.get("fonction", ""),
-                qualification=data.get("qualification", ""),
-                nb_annees_experience=_to_int(data.get("nb_annees_experience")),
-                ville_residence=data.get("ville_residence", ""),
-                prestataire=data.get("prestataire", ""),
-                intitule_formation_solicitee=data.get("intitule_formation_solicitee", ""),
-                intitule_formation_dispensee=data.get("intitule_formation_dispensee", ""),
-                fenetre=data.get("fenetre", ""),
-                ville_formation=data.get("ville_formation", ""),
-                arrondissement=data.get("arrondissement", ""),
-                departement=data.get("departement", ""),
-                region=data.get("region", ""),
-                lieu_formation=data.get("lieu_formation", ""),
-                precision_lieu=data.get("precision_lieu", ""),
-                longitude=data.get("longitude", ""),
-                latitude=data.get("latitude", ""),
-                telephone1=data.get("telephone1", ""),
-                telephone2=data.get("telephone2", ""),
-                cohorte=data.get("cohorte", ""),
-                tel_formateur=data.get("tel_formateur", ""),
-                code=data.get("code", ""),
-                cout_unitaire_subvention=_to_decimal(data.get("cout_unitaire_subvention")),
-                montant_total_subvention=_to_decimal(data.get("montant_total_subvention")),
-                statut_prestation=data.get("statut_prestation", ""),
-            )
-        )
-        related_payload.append(data)
-    return records, related_payload
-
-
-def _save_related_from_payload(payload: list[dict]):
-    # Deduplicate creations for speed.
-    seen_benef = {}
-    seen_prest = {}
-    seen_form = {}
-    seen_lieu = {}
-    seen_classe = {}
-    created_apprenants = 0
-
-    for item in payload:
-        ben_name = item.get("beneficiaire", "").strip()
-        ben_key = ben_name.lower()
-        prest_name = item.get("prestataire", "").strip()
-        prest_key = prest_name.lower()
-        intitule = item.get("intitule_formation_dispensee") or item.get("intitule_formation_solicitee") or ""
-        intitule_key = intitule.lower()
-        fenetre = item.get("fenetre", "") or ""
-        lieu_nom = item.get("lieu_formation", "").strip()
-        lieu_key = lieu_nom.lower()
-        classe_id = (item.get("classe_id") or "").strip()
-        classe_id_key = classe_id.lower()
-        cohorte_raw = item.get("cohorte", "")
-
-        region = item.get("region", "").strip()
-        departement = item.get("departement", "").strip()
-        arrondissement = item.get("arrondissement", "").strip()
-        ville = item.get("ville_formation", "").strip()
-
-        beneficiaire = seen_benef.get(ben_key) or _ensure_beneficiaire(
-            ben_name, region=region, departement=departement, arrondissement=arrondissement, ville=ville
-        )
-        if beneficiaire:
-            seen_benef[ben_key] = beneficiaire
-
-        prestataire = seen_prest.get(prest_key) or _ensure_prestataire(prest_name)
-        if prestataire:
-            seen_prest[prest_key] = prestataire
-
-        formation = seen_form.get(intitule_key) or _ensure_formation(intitule, fenetre=fenetre)
-        if formation:
-            seen_form[intitule_key] = formation
 
-        lieu = seen_lieu.get(lieu_key) or _ensure_lieu(
-            lieu_nom,
-            region=region,
-            departement=departement,
-            arrondissement=arrondissement,
-            ville=ville,
-            longitude=item.get("longitude", ""),
-            latitude=item.get("latitude", ""),
-            precision=item.get("precision_lieu", ""),
-        )
-        if lieu:
-            seen_lieu[lieu_key] = lieu
-
-        prestation = _ensure_prestation(prestataire, formation, beneficiaire, code_hint=item.get("code", ""))
-        classe_key = classe_id_key or f"{prestation.id if prestation else 'noprest'}-{fenetre}-{cohorte_raw}".lower()
-        classe = seen_classe.get(classe_key)
-        if not classe:
-            classe = _ensure_classe(
-                prestation,
-                formation,
-                fenetre=fenetre,
-                cohorte=cohorte_raw,
-                classe_id=classe_id,
-            )
-            if classe:
-                seen_classe[classe_key] = classe
 
-        if classe and formation:
-            code_appr = (item.get("code") or "").strip()
-            if not code_appr:
-                code_appr = f"AP-{slugify(item.get('nom_complet',''))[:6]}-{classe.code[:6]}"
-            tel1 = (item.get("telephone1") or "").strip()
-            tel2 = (item.get("telephone2") or "").strip()
-            defaults = {
-                "nom_complet": item.get("nom_complet", ""),
-                "genre": item.get("genre", ""),
-                "age": _to_int(item.get("age")),
-                "fonction": item.get("fonction", ""),
-                "qualification": item.get("qualification", ""),
-                "nb_annees_experience": _to_int(item.get("nb_annees_experience")) or 0,
-                "fenetre": fenetre,
-                "telephone1": tel1 or None,
-                "telephone2": tel2 or None,
-                "ville_residence": item.get("ville_residence", ""),
-                "region": region,
-                "departement": departement,
-                "arrondissement": arrondissement,
-                "code_ville": item.get("ville_formation", ""),
-                "appartenance_beneficiaire": True,
-            }
-            try:
-                # Si un apprenant existe deja avec le meme tel1 dans la formation, on le met a jour.
-                existing = None
-                if tel1:
-                    existing = Apprenant.objects.filter(formation=formation, telephone1=tel1).first()
-                if existing:
-                    for field, val in defaults.items():
-                        setattr(existing, field, val)
-                    existing.classe = classe
-                    existing.formation = formation
-                    existing.save()
-                else:
-                    obj, created = Apprenant.objects.get_or_create(
-                        code=code_appr,
-                        defaults={**defaults, "classe": classe, "formation": formation},
-                    )
-                    if created:
-                        created_apprenants += 1
-            except Exception:
-                # En cas de conflit unique, on ignore la ligne pour ne pas casser l'import.
-                continue
-    return created_apprenants
+def _requested_job(request):
+    job_id = request.GET.get("job", "")
+    if not job_id.isdigit():
+        return None
+    return ConsolidationJob.objects.filter(pk=int(job_id)).first()
 
 
 def consolidation_view(request):
+    resume_id = request.POST.get("resume", "") if request.method == "POST" else ""
+    if resume_id.isdigit():
+        job = ConsolidationJob.objects.filter(pk=int(resume_id)).first()
+        if job is None:
+            raise Http404("Import introuvable.")
+        if resume_job(job):
+            messages.info(request, f"Import {job.pk} relance : reprise apres la ligne {job.checkpoint_line or '-'}.")
+        return redirect(f"{request.path}?job={job.pk}")
+
     form = ConsolidationUploadForm(request.POST or None, request.FILES or None)
     headers = []
     preview_rows = []
     analysis = {"mapped": [], "missing": [], "extras": []}
     errors = []
+    conflicts = []
+    unique_classe_ids: list[str] = []
     file_meta = request.session.get(SESSION_KEY_CONSO, {}).get("meta", {})
     save_requested = bool(request.POST.get("save"))
+    extract_requested = bool(request.POST.get("extract_classes"))
+    job = _requested_job(request)
 
     if request.method == "POST" and form.is_valid():
         fichier = form.cleaned_data.get("fichier")
         try:
-            content = None
+            token = None
             if fichier:
-                content = fichier.read()
+                # Le fichier va sur disque ; la session ne garde que son jeton.
+                token = store_upload(fichier)
+                purge_staged_uploads()
                 file_meta = {
                     "name": getattr(fichier, "name", ""),
                     "size": getattr(fichier, "size", 0),
                 }
-                request.session[SESSION_KEY_CONSO] = {
-                    "meta": file_meta,
-                    "b64": base64.b64encode(content).decode("ascii"),
-                }
+                request.session[SESSION_KEY_CONSO] = {"meta": file_meta, "token": token}
                 request.session.modified = True
-            elif save_requested and request.session.get(SESSION_KEY_CONSO):
+            elif (save_requested or extract_requested) and request.session.get(SESSION_KEY_CONSO):
                 cached = request.session.get(SESSION_KEY_CONSO, {})
-                b64 = cached.get("b64")
-                if b64:
-                    content = base64.b64decode(b64)
-                    file_meta = cached.get("meta", {})
-            if not content:
+                token = cached.get("token")
+                file_meta = cached.get("meta", {})
+            if not token:
                 raise ValueError("Veuillez charger un fichier consolide avant de valider.")
 
-            buffer_preview = io.BytesIO(content)
-            headers, preview_rows = _read_consolidation_sheet(buffer_preview, max_rows=60)
+            # Une seule lecture du classeur : l'apercu est pris au passage. Les lignes ne
+            # sont mises en cache que pour l'extraction et l'enregistrement.
+            headers, rows, from_cache = staged_sheet(token)
             analysis = _analyze_headers(headers)
+            if extract_requested:
+
+                def with_preview(source):
+                    for line, cells in source:
+                        if len(preview_rows) < CONSO_PREVIEW_ROWS:
+                            preview_rows.append(cells)
+                        yield line, cells
+
+                _, payload, _ = rows_to_records(headers, with_preview(rows))
+                unique_classe_ids = _extract_unique_classe_ids(payload)
+            else:
+                preview_rows = [cells for _, cells in islice(rows, CONSO_PREVIEW_ROWS)]
+                if save_requested and not from_cache:
+                    # Fin du classeur lue pour remplir le cache ; un apercu seul s'arrete la.
+                    deque(rows, maxlen=0)
+                rows.close()
+            if (save_requested or extract_requested) and not preview_rows:
+                raise ValueError("Aucune ligne valide a enregistrer.")
             if save_requested:
-                buffer_full = io.BytesIO(content)
-                full_headers, all_rows = _read_consolidation_sheet(buffer_full, max_rows=None)
-                records, payload = _rows_to_records(full_headers, all_rows)
-                if not records:
-                    raise ValueError("Aucune ligne valide a enregistrer.")
+                # Vidage et reconstruction tournent dans le worker (run_consolidation_jobs).
                 try:
-                    # Always wipe before inserting, even if the insert later fails, to behave like a seed/replace.
-                    _reset_consolidation_tables()
-                    ConsolidationRecord.objects.all().delete()
-                    with transaction.atomic():
-                        ConsolidationRecord.objects.bulk_create(records, ignore_conflicts=False)
-                        _save_related_from_payload(payload)
-                    messages.success(request, f"{len(records)} lignes consolidees enregistrees (remplacement complet).")
+                    mode = (
+                        ConsolidationJob.INCREMENTAL
+                        if request.POST.get("save") == ConsolidationJob.INCREMENTAL
+                        else ConsolidationJob.REPLACE
+                    )
+                    job = enqueue_consolidation(token, file_meta.get("name", ""), request.user, mode=mode)
+                    messages.info(request, f"Import {job.pk} en file d'attente : l'avancement s'affiche ci-dessous.")
                 except OperationalError:
                     errors.append("Base de donnees occupee (database locked). Reessayez dans un instant.")
         except Exception as exc:  # pragma: no cover - runtime feedback
             errors.append(str(exc))
             preview_rows = []
 
+    if job is not None and job.status == ConsolidationJob.DONE:
+        conflicts = job.conflicts
+
     return render(
         request,
         "reporting/consolidation.html",
@@ -833,430 +170,151 @@ def consolidation_view(request):
             "preview_rows": preview_rows,
             "analysis": analysis,
             "errors": errors,
+            "conflicts": conflicts,
+            "unique_classe_ids": unique_classe_ids,
             "file_meta": file_meta,
+            "job": job,
         },
     )
 
 
-def safe_rate(num: float, den: float) -> float:
-    return round((num / den) * 100, 2) if den else 0.0
+def consolidation_job_status(request, pk: int):
+    job = ConsolidationJob.objects.filter(pk=pk).first()
+    if job is None:
+        raise Http404("Import introuvable.")
+    return JsonResponse(job.progress())
 
 
 def reporting_home(request):
-    nb_classes = Classe.objects.count()
-    nb_apprenants = Apprenant.objects.count()
-    nb_formateurs = SatisfactionFormateur.objects.values("formateur").distinct().count()
-    nb_enquetes_presence = Presence.objects.count()
-    nb_sat_apprenants = SatisfactionApprenant.objects.count()
-    nb_sat_formateurs = SatisfactionFormateur.objects.count()
-    nb_env = EnqueteEnvironnement.objects.count()
-
-    presence_rates = (
-        Presence.objects.values("classe__code")
-        .annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR")))
-        .order_by("-total")[:10]
-    )
-    sat_appr_moy = (
-        SatisfactionApprenant.objects.values("classe__code")
-        .annotate(moy=Avg("q9_satisfaction_globale"))
-        .order_by("-moy")[:10]
-    )
-    sat_form_moy = (
-        SatisfactionFormateur.objects.values("classe__code")
-        .annotate(moy=Avg("q9_satisfaction_globale_prestataire"))
-        .order_by("-moy")[:10]
-    )
-
-    # Synthèses globales
-    total_pres = Presence.objects.count()
-    total_pr = Presence.objects.filter(presence="PR").count()
-    taux_presence_global = safe_rate(total_pr, total_pres)
-
-    # RES00-04
-    sat_appr_agg = SatisfactionApprenant.objects.aggregate(total_q9=Sum("q9_satisfaction_globale"), count=Count("id"))
-    sat_appr_sum = sat_appr_agg["total_q9"] or 0
-    sat_appr_count = sat_appr_agg["count"] or 0
-    taux_sat_appr_global = safe_rate(sat_appr_sum, sat_appr_count * 5)
-    # RES00-05
-    sat_form_agg = SatisfactionFormateur.objects.aggregate(total_q9=Sum("q9_satisfaction_globale_prestataire"), count=Count("id"))
-    sat_form_sum = sat_form_agg["total_q9"] or 0
-    sat_form_count = sat_form_agg["count"] or 0
-    taux_sat_form_global = safe_rate(sat_form_sum, sat_form_count * 5)
-
-    # Environnement : moyenne des booleens principaux (8 points indicatifs)
-    env_bool_fields = [
-        "tables",
-        "chaises",
-        "ecran",
-        "videoprojecteur",
-        "ventilation",
-        "eclairage",
-        "salle_propre",
-        "salle_securisee",
-    ]
-    env_counts = EnqueteEnvironnement.objects.aggregate(
-        total=Count("id"), **{f: Sum(f) for f in env_bool_fields}
-    )
-    env_score = safe_rate(
-        sum((env_counts.get(f) or 0) for f in env_bool_fields),
-        (env_counts.get("total") or 0) * len(env_bool_fields),
-    )
-
-    # Taux presence par axes
-    def with_rate(qs):
-        return [{**r, "taux": safe_rate(r.get("pr") or 0, r.get("total") or 0)} for r in qs]
-
-    taux_presence_prestataire = with_rate(
-        Presence.objects.values("classe__prestation__prestataire__raison_sociale")
-        .annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR")))
-        .order_by("-total")
-    )
-    taux_presence_prestation = with_rate(
-        Presence.objects.values("classe__prestation__code")
-        .annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR")))
-        .order_by("-total")
-    )
-    taux_presence_beneficiaire = with_rate(
-        Presence.objects.values("classe__prestation__beneficiaire__nom_structure")
-        .annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR")))
-        .order_by("-total")
-    )
-    taux_presence_formation = with_rate(
-        Presence.objects.values("classe__formation__nom")
-        .annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR")))
-        .order_by("-total")
-    )
-    taux_presence_formation_harmo = with_rate(
-        Presence.objects.values("classe__formation__nom_harmonise")
-        .annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR")))
-        .order_by("-total")
+    filter_form = PresenceFilterForm(request.GET or None)
+    filters = filter_form.to_filters()
+    versions = DataVersions()
+    context = cached_payload("home", ReportingSnapshot.HOME, SNAPSHOT_SOURCES, get_home_context, versions=versions)
+    if filters:
+        presence = cached_payload(
+            "home",
+            f"presence:{filters.key()}",
+            PRESENCE_SOURCES,
+            lambda: compute_presence_context(AggregationEngine(filters)),
+            versions=versions,
+        )
+        context = with_presence_context(context, presence)
+    context.update(
+        filter_form=filter_form,
+        filters_active=bool(filters),
+        filter_query=request.GET.urlencode() if filters else "",
     )
+    return render(request, "reporting/index.html", context)
 
-    # Satisfaction globale par axes (apprenants)
-    sat_appr_prestataire = (
-        SatisfactionApprenant.objects.values("classe__prestation__prestataire__raison_sociale")
-        .annotate(moy=Avg("q9_satisfaction_globale"))
-        .order_by("-moy")
-    )
-    sat_appr_prestation = (
-        SatisfactionApprenant.objects.values("classe__prestation__code")
-        .annotate(moy=Avg("q9_satisfaction_globale"))
-        .order_by("-moy")
-    )
-    sat_appr_benef = (
-        SatisfactionApprenant.objects.values("classe__prestation__beneficiaire__nom_structure")
-        .annotate(moy=Avg("q9_satisfaction_globale"))
-        .order_by("-moy")
-    )
-    sat_appr_formation = (
-        SatisfactionApprenant.objects.values("classe__formation__nom")
-        .annotate(moy=Avg("q9_satisfaction_globale"))
-        .order_by("-moy")
-    )
-    sat_appr_formation_harmo = (
-        SatisfactionApprenant.objects.values("classe__formation__nom_harmonise")
-        .annotate(moy=Avg("q9_satisfaction_globale"))
-        .order_by("-moy")
-    )
 
-    # Satisfaction globale par axes (formateurs)
-    sat_form_prestataire = (
-        SatisfactionFormateur.objects.values("classe__prestation__prestataire__raison_sociale")
-        .annotate(moy=Avg("q9_satisfaction_globale_prestataire"))
-        .order_by("-moy")
-    )
-    sat_form_prestation = (
-        SatisfactionFormateur.objects.values("classe__prestation__code")
-        .annotate(moy=Avg("q9_satisfaction_globale_prestataire"))
-        .order_by("-moy")
-    )
-    sat_form_benef = (
-        SatisfactionFormateur.objects.values("classe__prestation__beneficiaire__nom_structure")
-        .annotate(moy=Avg("q9_satisfaction_globale_prestataire"))
-        .order_by("-moy")
-    )
-    sat_form_formation = (
-        SatisfactionFormateur.objects.values("classe__formation__nom")
-        .annotate(moy=Avg("q9_satisfaction_globale_prestataire"))
-        .order_by("-moy")
-    )
-    sat_form_formation_harmo = (
-        SatisfactionFormateur.objects.values("classe__formation__nom_harmonise")
-        .annotate(moy=Avg("q9_satisfaction_globale_prestataire"))
-        .order_by("-moy")
-    )
+# Tables embarquees : code -> (titre, entete de l'axe, axe du moteur d'agregation).
+PRESENCE_TABLES = {
+    "presence-prestataire": ("Presence par prestataire", "Prestataire", "prestataire"),
+    "presence-prestation": ("Presence par prestation", "Prestation", "prestation"),
+    "presence-beneficiaire": ("Presence par beneficiaire", "Beneficiaire", "beneficiaire"),
+    "presence-formation": ("Presence par formation", "Formation", "formation"),
+    "presence-formation-harmo": ("Presence par formation harmonisee", "Formation harmo.", "nom_harmonise"),
+}
+REPART_TABLES = {
+    "repart-ville": ("Repartition apprenants (villes)", "Ville", "ville"),
+    "repart-region": ("Repartition apprenants (regions)", "Region", "region"),
+    "repart-formation": ("Repartition formations", "Formation", "formation"),
+    "repart-formation-harmo": ("Repartition formations harmonisees", "Formation harmonisee", "nom_harmonise"),
+    "repart-beneficiaire": ("Repartition beneficiaires", "Beneficiaire", "beneficiaire"),
+    "repart-prestataire": ("Repartition prestataires", "Prestataire", "prestataire"),
+}
 
-    repart_apprenants_ville = Apprenant.objects.values("ville_residence").annotate(total=Count("id")).order_by("-total")
-    repart_apprenants_region = Apprenant.objects.values("region").annotate(total=Count("id")).order_by("-total")
-    repart_apprenants_formation = (
-        Apprenant.objects.values("formation__nom")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-    repart_apprenants_formation_harmo = (
-        Apprenant.objects.values("formation__nom_harmonise")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-    repart_apprenants_benef = (
-        Apprenant.objects.values("classe__prestation__beneficiaire__nom_structure")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-    repart_apprenants_prestataire = (
-        Apprenant.objects.values("classe__prestation__prestataire__raison_sociale")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
 
-    # Effectifs / femmes / appartenance par prestation
-    prestations_effectifs = (
-        Prestation.objects.annotate(
-            appr_total=Count("classes__apprenants", distinct=True),
-            appr_femmes=Count("classes__apprenants", filter=Q(classes__apprenants__genre__iexact="f"), distinct=True),
-            appr_appart=Count(
-                "classes__apprenants",
-                filter=Q(classes__apprenants__appartenance_beneficiaire=True),
-                distinct=True,
-            ),
-        )
-        .values(
-            "code",
-            "effectif_a_former",
-            "femmes",
-            "appr_total",
-            "appr_femmes",
-            "appr_appart",
-            "prestataire__raison_sociale",
-            "beneficiaire__nom_structure",
-        )
-        .order_by("code")
-    )
+def _sat_rows(rows):
+    return [[r["label"], round(r["moy"] or 0, 2)] for r in rows]
 
-    # Durées par prestation
-    prestations_durees = Prestation.objects.values(
-        "code", "prestataire__raison_sociale", "duree_prevue_heures", "duree_reelle_heures"
-    ).order_by("code")
 
-    # Environnement par lieu
-    env_fields = [
-        "tables",
-        "chaises",
-        "ecran",
-        "videoprojecteur",
-        "ventilation",
-        "eclairage",
-        "salle_propre",
-        "salle_securisee",
-    ]
-    env_qs = (
-        EnqueteEnvironnement.objects.values("classe__lieu__nom_lieu", "classe__lieu__region")
-        .annotate(
-            total=Count("id"),
-            **{f: Sum(f) for f in env_fields},
-        )
-        .order_by("-total")
-    )
-    env_par_lieu = []
-    for row in env_qs:
-        total = row.get("total") or 0
-        somme = sum((row.get(f) or 0) for f in env_fields)
-        score = safe_rate(somme, total * len(env_fields))
-        env_par_lieu.append(
-            {
-                "lieu": row.get("classe__lieu__nom_lieu"),
-                "region": row.get("classe__lieu__region"),
-                "total": total,
-                "score": score,
-            }
-        )
+# Modeles dont depend chaque table embarquee (cle de cache).
+TABLE_SOURCES = {
+    "presence-classe": PRESENCE_SOURCES,
+    "sat-appr-q9": (SatisfactionApprenant, Classe),
+    "sat-form-q9": (SatisfactionFormateur, Classe),
+    **{code: PRESENCE_SOURCES for code in PRESENCE_TABLES},
+    "sat-appr-prestataire": (SatisfactionApprenant, Classe, Prestation, Prestataire),
+    "sat-form-prestataire": (SatisfactionFormateur, Classe, Prestation, Prestataire),
+    "prestations-effectifs": (Apprenant, Classe, Prestation, Prestataire, Beneficiaire),
+    "prestations-durees": (Prestation,),
+    **{code: (Apprenant, *DIMENSION_MODELS) for code in REPART_TABLES},
+    "env-lieu": (EnqueteEnvironnement, Classe, Lieu),
+}
 
-    # Logic for RES02-03, RES02-04, RES02-05
-    prestations_effectifs_list = []
-    for p in prestations_effectifs:
-        eff_ok = (p["appr_total"] or 0) >= (p["effectif_a_former"] or 0)
-        femmes_ok = (p["appr_femmes"] or 0) >= (p["femmes"] or 0)
-        p["respect_effectif"] = eff_ok
-        p["respect_femmes"] = femmes_ok
-        p["taux_appartenance"] = safe_rate(p["appr_appart"] or 0, p["appr_total"] or 0)
-        prestations_effectifs_list.append(p)
 
-    # Logic for RES03-01
-    from App_PADESCE.formations.models import Lieu
-    carte_lieux = []
-    for l in Lieu.objects.filter(actif=True):
-        if l.latitude and l.longitude:
-             carte_lieux.append({"nom": l.nom_lieu, "lat": l.latitude, "lng": l.longitude})
+# Tables de presence acceptant les filtres periode/fenetre/region/prestataire.
+FILTERABLE_TABLES = {"presence-classe", *PRESENCE_TABLES}
 
-    charts = [
-        {"code": "RES00-01", "title": "Taux de présence global", "value": f"{taux_presence_global} %"},
-        {"code": "RES00-02", "title": "Synthèse du suivi contractuel", "value": "N/A"},
-        {"code": "RES00-03", "title": "Synthèse de l'évaluation de l'environnement (8 points)", "value": f"{env_score} %"},
-        {"code": "RES00-04", "title": "Taux de satisfaction global apprenants", "value": f"{taux_sat_appr_global} %"},
-        {"code": "RES00-05", "title": "Taux de satisfaction global formateurs", "value": f"{taux_sat_form_global} %"},
-    ]
 
-    context = {
-        "nb_classes": nb_classes,
-        "nb_apprenants": nb_apprenants,
-        "nb_formateurs": nb_formateurs,
-        "nb_enquetes_presence": nb_enquetes_presence,
-        "nb_sat_apprenants": nb_sat_apprenants,
-        "nb_sat_formateurs": nb_sat_formateurs,
-        "nb_env": nb_env,
-        "presence_rates": presence_rates,
-        "sat_appr_moy": sat_appr_moy,
-        "sat_form_moy": sat_form_moy,
-        "formations": Formation.objects.all().order_by("nom")[:20],
-        "charts": charts,
-        "carte_lieux": carte_lieux,
-        "taux_presence_prestataire": taux_presence_prestataire,
-        "taux_presence_prestation": taux_presence_prestation,
-        "taux_presence_beneficiaire": taux_presence_beneficiaire,
-        "taux_presence_formation": taux_presence_formation,
-        "taux_presence_formation_harmo": taux_presence_formation_harmo,
-        "sat_appr_prestataire": sat_appr_prestataire,
-        "sat_appr_prestation": sat_appr_prestation,
-        "sat_appr_benef": sat_appr_benef,
-        "sat_appr_formation": sat_appr_formation,
-        "sat_appr_formation_harmo": sat_appr_formation_harmo,
-        "sat_form_prestataire": sat_form_prestataire,
-        "sat_form_prestation": sat_form_prestation,
-        "sat_form_benef": sat_form_benef,
-        "sat_form_formation": sat_form_formation,
-        "sat_form_formation_harmo": sat_form_formation_harmo,
-        "repart_apprenants_ville": repart_apprenants_ville,
-        "repart_apprenants_region": repart_apprenants_region,
-        "repart_apprenants_formation": repart_apprenants_formation,
-        "repart_apprenants_formation_harmo": repart_apprenants_formation_harmo,
-        "repart_apprenants_benef": repart_apprenants_benef,
-        "repart_apprenants_prestataire": repart_apprenants_prestataire,
-        "prestations_effectifs": prestations_effectifs_list,
-        "prestations_durees": prestations_durees,
-        "env_par_lieu": env_par_lieu,
-    }
-    return render(request, "reporting/index.html", context)
+def table_sources(code: str):
+    return TABLE_SOURCES.get(code.lower())
 
 
-def _table_presence_rates(field: str):
-    return Presence.objects.values(field).annotate(total=Count("id"), pr=Count("id", filter=Q(presence="PR"))).order_by(
-        "-total"
+def get_table_data(code: str, versions=None, filters: PresenceFilters = None) -> dict:
+    code = code.lower()
+    if code not in TABLE_SOURCES:
+        raise Http404("Table inconnue")
+    filters = filters if code in FILTERABLE_TABLES and filters else PresenceFilters()
+    key = f"{code}:{filters.key()}" if filters else code
+    return cached_payload(
+        "table",
+        key,
+        TABLE_SOURCES[code],
+        lambda: _compute_table_data(code, AggregationEngine(filters)),
+        versions=versions,
     )
 
 
-def _table_sat_avg(model, field: str, display: str):
-    return model.objects.values(display).annotate(moy=Avg(field)).order_by("-moy")
-
-
-def get_table_data(code: str) -> dict:
-    code = code.lower()
+def _compute_table_data(code: str, engine: AggregationEngine) -> dict:
     if code == "presence-classe":
-        qs = _table_presence_rates("classe__code")[:10]
         return {
             "title": "Top presence (classe)",
             "headers": ["Classe", "PR", "Total"],
-            "rows": [[r["classe__code"], r["pr"], r["total"]] for r in qs],
+            "rows": [[r["label"], r["pr"], r["total"]] for r in engine.presence_rates("classe")[:10]],
         }
     if code == "sat-appr-q9":
-        qs = _table_sat_avg(SatisfactionApprenant, "q9_satisfaction_globale", "classe__code")[:10]
         return {
             "title": "Sat. apprenants (Q9)",
             "headers": ["Classe", "Moyenne"],
-            "rows": [[r["classe__code"], round(r["moy"] or 0, 2)] for r in qs],
+            "rows": _sat_rows(engine.satisfaction_means("apprenants", "classe")[:10]),
         }
     if code == "sat-form-q9":
-        qs = _table_sat_avg(SatisfactionFormateur, "q9_satisfaction_globale_prestataire", "classe__code")[:10]
         return {
             "title": "Sat. formateurs (Q9)",
             "headers": ["Classe", "Moyenne"],
-            "rows": [[r["classe__code"], round(r["moy"] or 0, 2)] for r in qs],
-        }
-    if code == "presence-prestataire":
-        qs = _table_presence_rates("classe__prestation__prestataire__raison_sociale")
-        return {
-            "title": "Presence par prestataire",
-            "headers": ["Prestataire", "PR", "Total", "Taux %"],
-            "rows": [
-                [r["classe__prestation__prestataire__raison_sociale"], r["pr"], r["total"], safe_rate(r["pr"], r["total"])]
-                for r in qs
-            ],
-        }
-    if code == "presence-prestation":
-        qs = _table_presence_rates("classe__prestation__code")
-        return {
-            "title": "Presence par prestation",
-            "headers": ["Prestation", "PR", "Total", "Taux %"],
-            "rows": [[r["classe__prestation__code"], r["pr"], r["total"], safe_rate(r["pr"], r["total"])] for r in qs],
-        }
-    if code == "presence-beneficiaire":
-        qs = _table_presence_rates("classe__prestation__beneficiaire__nom_structure")
-        return {
-            "title": "Presence par beneficiaire",
-            "headers": ["Beneficiaire", "PR", "Total", "Taux %"],
-            "rows": [
-                [r["classe__prestation__beneficiaire__nom_structure"], r["pr"], r["total"], safe_rate(r["pr"], r["total"])]
-                for r in qs
-            ],
+            "rows": _sat_rows(engine.satisfaction_means("formateurs", "classe")[:10]),
         }
-    if code == "presence-formation":
-        qs = _table_presence_rates("classe__formation__nom")
+    if code in PRESENCE_TABLES:
+        title, header, axis = PRESENCE_TABLES[code]
         return {
-            "title": "Presence par formation",
-            "headers": ["Formation", "PR", "Total", "Taux %"],
-            "rows": [[r["classe__formation__nom"], r["pr"], r["total"], safe_rate(r["pr"], r["total"])] for r in qs],
-        }
-    if code == "presence-formation-harmo":
-        qs = _table_presence_rates("classe__formation__nom_harmonise")
-        return {
-            "title": "Presence par formation harmonisee",
-            "headers": ["Formation harmo.", "PR", "Total", "Taux %"],
-            "rows": [
-                [r["classe__formation__nom_harmonise"], r["pr"], r["total"], safe_rate(r["pr"], r["total"])] for r in qs
-            ],
+            "title": title,
+            "headers": [header, "PR", "Total", "Taux %"],
+            "rows": [[r["label"], r["pr"], r["total"], r["taux"]] for r in engine.presence_rates(axis)],
         }
     if code == "sat-appr-prestataire":
-        qs = _table_sat_avg(
-            SatisfactionApprenant, "q9_satisfaction_globale", "classe__prestation__prestataire__raison_sociale"
-        )
         return {
             "title": "Satisfaction apprenants par axes",
             "headers": ["Groupe", "Moyenne"],
-            "rows": [[r["classe__prestation__prestataire__raison_sociale"], round(r["moy"] or 0, 2)] for r in qs],
+            "rows": _sat_rows(engine.satisfaction_means("apprenants", "prestataire")),
         }
     if code == "sat-form-prestataire":
-        qs = _table_sat_avg(
-            SatisfactionFormateur, "q9_satisfaction_globale_prestataire", "classe__prestation__prestataire__raison_sociale"
-        )
         return {
             "title": "Satisfaction formateurs par axes",
             "headers": ["Groupe", "Moyenne"],
-            "rows": [[r["classe__prestation__prestataire__raison_sociale"], round(r["moy"] or 0, 2)] for r in qs],
+            "rows": _sat_rows(engine.satisfaction_means("formateurs", "prestataire")),
         }
     if code == "prestations-effectifs":
-        qs = (
-            Prestation.objects.annotate(
-                appr_total=Count("classes__apprenants", distinct=True),
-                appr_femmes=Count(
-                    "classes__apprenants", filter=Q(classes__apprenants__genre__iexact="f"), distinct=True
-                ),
-                appr_appart=Count(
-                    "classes__apprenants", filter=Q(classes__apprenants__appartenance_beneficiaire=True), distinct=True
-                ),
-            )
-            .values("code", "effectif_a_former", "femmes", "appr_total", "appr_femmes", "appr_appart")
-            .order_by("code")
-        )
-        rows = []
-        for r in qs:
-             eff_ok = (r["appr_total"] or 0) >= (r["effectif_a_former"] or 0)
-             femmes_ok = (r["appr_femmes"] or 0) >= (r["femmes"] or 0)
-             appart_rate = safe_rate(r["appr_appart"] or 0, r["appr_total"] or 0)
-             rows.append([
-                 r["code"],
-                 r["effectif_a_former"], r["appr_total"], "OK" if eff_ok else "NOK",
-                 r["femmes"], r["appr_femmes"], "OK" if femmes_ok else "NOK",
-                 r["appr_appart"], f"{appart_rate} %"
-             ])
+        rows = [
+            [
+                r["code"],
+                r["effectif_a_former"], r["appr_total"], "OK" if r["respect_effectif"] else "NOK",
+                r["femmes"], r["appr_femmes"], "OK" if r["respect_femmes"] else "NOK",
+                r["appr_appart"], f"{r['taux_appartenance']} %",
+            ]
+            for r in engine.prestation_effectifs()
+        ]
         return {
             "title": "Effectifs / Femmes / Appartenance par prestation",
             "headers": ["Prestation", "Eff. prevu", "Eff. reel", "Resp. Eff", "Fem. prevues", "Fem. reelles", "Resp. Fem", "Appart.", "Taux App."],
@@ -1269,88 +327,18 @@ def get_table_data(code: str) -> dict:
             "headers": ["Prestation", "Duree prevue (h)", "Duree reelle (h)"],
             "rows": [[r["code"], r["duree_prevue_heures"], r["duree_reelle_heures"]] for r in qs],
         }
-    if code == "repart-ville":
-        qs = Apprenant.objects.values("ville_residence").annotate(total=Count("id")).order_by("-total")
-        return {
-            "title": "Repartition apprenants (villes)",
-            "headers": ["Ville", "Total"],
-            "rows": [[r["ville_residence"], r["total"]] for r in qs],
-        }
-    if code == "repart-region":
-        qs = Apprenant.objects.values("region").annotate(total=Count("id")).order_by("-total")
-        return {
-            "title": "Repartition apprenants (regions)",
-            "headers": ["Region", "Total"],
-            "rows": [[r["region"], r["total"]] for r in qs],
-        }
-    if code == "repart-formation":
-        qs = Apprenant.objects.values("formation__nom").annotate(total=Count("id")).order_by("-total")
+    if code in REPART_TABLES:
+        title, header, axis = REPART_TABLES[code]
         return {
-            "title": "Repartition formations",
-            "headers": ["Formation", "Total"],
-            "rows": [[r["formation__nom"], r["total"]] for r in qs],
-        }
-    if code == "repart-formation-harmo":
-        qs = Apprenant.objects.values("formation__nom_harmonise").annotate(total=Count("id")).order_by("-total")
-        return {
-            "title": "Repartition formations harmonisees",
-            "headers": ["Formation harmonisee", "Total"],
-            "rows": [[r["formation__nom_harmonise"], r["total"]] for r in qs],
-        }
-    if code == "repart-beneficiaire":
-        qs = (
-            Apprenant.objects.values("classe__prestation__beneficiaire__nom_structure")
-            .annotate(total=Count("id"))
-            .order_by("-total")
-        )
-        return {
-            "title": "Repartition beneficiaires",
-            "headers": ["Beneficiaire", "Total"],
-            "rows": [[r["classe__prestation__beneficiaire__nom_structure"], r["total"]] for r in qs],
-        }
-    if code == "repart-prestataire":
-        qs = (
-            Apprenant.objects.values("classe__prestation__prestataire__raison_sociale")
-            .annotate(total=Count("id"))
-            .order_by("-total")
-        )
-        return {
-            "title": "Repartition prestataires",
-            "headers": ["Prestataire", "Total"],
-            "rows": [[r["classe__prestation__prestataire__raison_sociale"], r["total"]] for r in qs],
+            "title": title,
+            "headers": [header, "Total"],
+            "rows": [[r["label"], r["total"]] for r in engine.repartition(axis)],
         }
     if code == "env-lieu":
-        env_fields = [
-            "tables",
-            "chaises",
-            "ecran",
-            "videoprojecteur",
-            "ventilation",
-            "eclairage",
-            "salle_propre",
-            "salle_securisee",
-        ]
-        env_qs = (
-            EnqueteEnvironnement.objects.values("classe__lieu__nom_lieu", "classe__lieu__region")
-            .annotate(total=Count("id"), **{f: Sum(f) for f in env_fields})
-            .order_by("-total")
-        )
-        rows = []
-        for row in env_qs:
-            total = row.get("total") or 0
-            somme = sum((row.get(f) or 0) for f in env_fields)
-            rows.append(
-                [
-                    row.get("classe__lieu__nom_lieu"),
-                    row.get("classe__lieu__region"),
-                    total,
-                    safe_rate(somme, total * len(env_fields)),
-                ]
-            )
         return {
             "title": "Environnement par lieu",
             "headers": ["Lieu", "Region", "Nb enquetes", "Score (8 pts)"],
-            "rows": rows,
+            "rows": [[r["lieu"], r["region"], r["total"], r["score"]] for r in engine.environnement_par_lieu()],
         }
     raise Http404("Table inconnue")
 
@@ -1361,7 +349,7 @@ def export_csv(request):
     writer = csv.writer(response)
     writer.writerow(["type", "label", "valeur"])
     writer.writerow(["nb_classes", "Classes", Classe.objects.count()])
-    writer.writerow(["nb_apprenants", "Apprenants", Apprenant.objects.count()])
+    writer.writerow(["nb_apprenants", "Apprenants", Apprenant.objects.filter(actif=True).count()])
     writer.writerow(["nb_presences", "Enquetes presence", Presence.objects.count()])
     writer.writerow(["nb_sat_appr", "Sat apprenants", SatisfactionApprenant.objects.count()])
     writer.writerow(["nb_sat_form", "Sat formateurs", SatisfactionFormateur.objects.count()])
@@ -1370,20 +358,29 @@ def export_csv(request):
 
 
 def export_excel(request):
-    # Simplified: reuse CSV content with .xls extension to keep it lightweight here.
-    response = export_csv(request)
-    response["Content-Disposition"] = "attachment; filename=reporting_summary.xls"
-    return response
+    filter_form = PresenceFilterForm(request.GET or None)
+    if filter_form.is_bound and not filter_form.is_valid():
+        return HttpResponseBadRequest("Filtres invalides.")
+    # Fichier temporaire : le classeur n'est jamais entierement en memoire.
+    handle = tempfile.TemporaryFile()
+    write_reporting_workbook(AggregationEngine(filter_form.to_filters()), handle)
+    handle.seek(0)
+    return FileResponse(handle, as_attachment=True, filename="reporting.xlsx", content_type=XLSX_CONTENT_TYPE)
 
 
+@data_condition("embed", chart_sources)
 def reporting_embed(request, code: str):
     response = render(request, "reporting/embed.html", {"code": code.upper()})
     response["X-Frame-Options"] = "ALLOWALL"
     return response
 
 
+@data_condition("table", table_sources)
 def reporting_embed_table(request, code: str):
-    payload = get_table_data(code)
+    filter_form = PresenceFilterForm(request.GET or None)
+    if filter_form.is_bound and not filter_form.is_valid():
+        return HttpResponseBadRequest("Filtres invalides.")
+    payload = get_table_data(code, versions=request_versions(request), filters=filter_form.to_filters())
     response = render(request, "reporting/embed_table.html", payload)
     response["X-Frame-Options"] = "ALLOWALL"
     return response
@@ -0,0 +1,157 @@
+"""
+Classeur Excel du reporting (multi-feuilles).
+
+Toutes les feuilles sont alimentees par `AggregationEngine` : memes chiffres que le
+tableau de bord et l'API graphique. Le classeur est ecrit en mode `write_only`
+d'openpyxl, ligne par ligne, vers un fichier : la memoire ne depend pas du nombre de
+classes ou d'apprenants.
+"""
+from dataclasses import asdict
+from typing import IO, Iterable, Sequence
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.environnement.models import EnqueteEnvironnement
+from App_PADESCE.formations.models import Classe
+from App_PADESCE.reporting.aggregation import (
+    CLASSE_AXES,
+    ENV_FIELDS,
+    REPART_AXES,
+    SATISFACTION_SOURCES,
+    AggregationEngine,
+    safe_rate,
+)
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+TIMELINE_GRANULARITES = ("semaine", "mois")
+
+_HEADER_FONT = Font(bold=True)
+
+
+def _sheet(workbook: Workbook, title: str, header: Sequence[str]):
+    sheet = workbook.create_sheet(title=title)
+    row = []
+    for value in header:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = _HEADER_FONT
+        row.append(cell)
+    sheet.append(row)
+    return sheet
+
+
+def _append_rows(sheet, rows: Iterable[Sequence]) -> None:
+    for row in rows:
+        sheet.append(list(row))
+
+
+def _synthese(workbook: Workbook, engine: AggregationEngine) -> None:
+    sheet = _sheet(workbook, "Synthese", ["Indicateur", "Valeur"])
+    presence = engine.presence_totals()
+    rows = [
+        ("Classes", Classe.objects.count()),
+        ("Apprenants", Apprenant.objects.filter(actif=True).count()),
+        ("Presences (enquetes)", presence["total"]),
+        ("Taux de presence global (%)", presence["taux"]),
+    ]
+    for kind in SATISFACTION_SOURCES:
+        totals = engine.satisfaction_totals(kind)
+        rows.append((f"Enquetes satisfaction {kind}", totals["n"]))
+        rows.append((f"Taux de satisfaction global {kind} (%)", safe_rate(totals["somme"], totals["n"] * 5)))
+    rows.append(("Enquetes environnement", EnqueteEnvironnement.objects.count()))
+    rows.append(("Score environnement (%)", engine.environnement_score()))
+    if engine.filters:
+        actifs = {k: v for k, v in asdict(engine.filters).items() if v not in (None, "")}
+        rows.append(("Filtres presence", ", ".join(f"{k}={v}" for k, v in actifs.items())))
+    _append_rows(sheet, rows)
+
+
+def _presence(workbook: Workbook, engine: AggregationEngine) -> None:
+    sheet = _sheet(workbook, "Presence", ["Axe", "Libelle", "Presents", "Total", "Taux (%)"])
+    for axis in CLASSE_AXES:
+        _append_rows(sheet, ((axis, r["label"], r["pr"], r["total"], r["taux"]) for r in engine.presence_rates(axis)))
+
+    sheet = _sheet(workbook, "Presence periodes", ["Granularite", "Periode", "Presents", "Total", "Taux (%)"])
+    for granularite in TIMELINE_GRANULARITES:
+        _append_rows(
+            sheet,
+            ((granularite, r["label"], r["pr"], r["total"], r["taux"]) for r in engine.presence_timeline(granularite)),
+        )
+
+
+def _satisfaction(workbook: Workbook, engine: AggregationEngine) -> None:
+    sheet = _sheet(workbook, "Satisfaction", ["Source", "Axe", "Libelle", "Moyenne Q9 (/5)"])
+    for kind in SATISFACTION_SOURCES:
+        for axis in CLASSE_AXES:
+            _append_rows(
+                sheet,
+                (
+                    (kind, axis, r["label"], round(r["moy"], 2) if r["moy"] is not None else None)
+                    for r in engine.satisfaction_means(kind, axis)
+                ),
+            )
+
+
+def _environnement(workbook: Workbook, engine: AggregationEngine) -> None:
+    sheet = _sheet(workbook, "Environnement", ["Lieu", "Region", "Enquetes", "Score (%)", *ENV_FIELDS])
+    _append_rows(
+        sheet,
+        (
+            (r["lieu"], r["region"], r["total"], r["score"], *(r[f] for f in ENV_FIELDS))
+            for r in engine.environnement_par_lieu()
+        ),
+    )
+
+
+def _effectifs(workbook: Workbook, engine: AggregationEngine) -> None:
+    sheet = _sheet(
+        workbook,
+        "Effectifs prestations",
+        [
+            "Prestation",
+            "Prestataire",
+            "Beneficiaire",
+            "Effectif a former",
+            "Femmes prevues",
+            "Apprenants",
+            "Apprenantes",
+            "Appartenance beneficiaire",
+            "Effectif respecte",
+            "Femmes respecte",
+            "Taux appartenance (%)",
+        ],
+    )
+    _append_rows(
+        sheet,
+        (
+            (
+                r["code"],
+                r["prestataire__raison_sociale"],
+                r["beneficiaire__nom_structure"],
+                r["effectif_a_former"],
+                r["femmes"],
+                r["appr_total"],
+                r["appr_femmes"],
+                r["appr_appart"],
+                "Oui" if r["respect_effectif"] else "Non",
+                "Oui" if r["respect_femmes"] else "Non",
+                r["taux_appartenance"],
+            )
+            for r in engine.prestation_effectifs()
+        ),
+    )
+
+    sheet = _sheet(workbook, "Repartition apprenants", ["Axe", "Libelle", "Apprenants"])
+    for axis in REPART_AXES:
+        _append_rows(sheet, ((axis, r["label"], r["total"]) for r in engine.repartition(axis)))
+
+
+def write_reporting_workbook(engine: AggregationEngine, target: IO[bytes]) -> None:
+    """Ecrit le classeur reporting dans `target` (fichier binaire ouvert)."""
+    workbook = Workbook(write_only=True)
+    for write in (_synthese, _presence, _satisfaction, _environnement, _effectifs):
+        write(workbook, engine)
+    workbook.save(target)
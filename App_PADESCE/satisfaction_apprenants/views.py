@@ -1,5 +1,4 @@
 import base64
-import csv
 import hashlib
 import json
 import logging
@@ -13,10 +12,10 @@ import requests
 from django.contrib import messages
 from django.core.files.storage import default_storage
 from django.core.paginator import Paginator
-from django.http import HttpResponse
 from django.shortcuts import redirect, render
 
 from App_PADESCE.apprenants.models import Apprenant
+from App_PADESCE.core.exports import Label, csv_response, user_label
 from App_PADESCE.formations.models import Classe
 from App_PADESCE.satisfaction_apprenants.forms import SatisfactionApprenantForm
 from App_PADESCE.satisfaction_apprenants.models import SatisfactionApprenant
@@ -420,54 +419,27 @@ def satisfaction_apprenants(request):
 
 def satisfaction_apprenants_export_csv(request):
     filter_classe = request.GET.get("classe")
-    qs = SatisfactionApprenant.objects.select_related("classe", "apprenant", "inspecteur", "enqueteur").order_by("-date")
+    qs = SatisfactionApprenant.objects.order_by("-date")
     if filter_classe:
         qs = qs.filter(classe_id=filter_classe)
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = "attachment; filename=satisfaction_apprenants.csv"
-    writer = csv.writer(response)
-    writer.writerow(
-        [
-            "classe",
-            "apprenant",
-            "inspecteur",
-            "enqueteur",
-            "date",
-            "heure",
-            "q1",
-            "q2",
-            "q3",
-            "q4",
-            "q5",
-            "q6",
-            "q7",
-            "q8",
-            "q9",
-            "commentaire",
-            "recommandations",
-        ]
-    )
-    for s in qs:
-        writer.writerow(
-            [
-                s.classe,
-                s.apprenant,
-                s.inspecteur,
-                s.enqueteur,
-                s.date,
-                s.heure,
-                s.q1_clarte_exposes,
-                s.q2_interaction_formateur,
-                s.q3_rythme_formation,
-                s.q4_qualite_supports,
-                s.q5_applicabilite_contenu,
-                s.q6_organisation_logistique,
-                s.q7_respect_programme,
-                s.q8_adequation_besoins,
-                s.q9_satisfaction_globale,
-                s.commentaire,
-                s.recommandations,
-            ]
-        )
-    return response
+    columns = [
+        ("classe", Label("classe__code", "classe__intitule_formation")),
+        ("apprenant", Label("apprenant__code", "apprenant__nom_complet")),
+        ("inspecteur", Label("inspecteur__code", "inspecteur__nom_complet")),
+        ("enqueteur", user_label("enqueteur")),
+        ("date", "date"),
+        ("heure", "heure"),
+        ("q1", "q1_clarte_exposes"),
+        ("q2", "q2_interaction_formateur"),
+        ("q3", "q3_rythme_formation"),
+        ("q4", "q4_qualite_supports"),
+        ("q5", "q5_applicabilite_contenu"),
+        ("q6", "q6_organisation_logistique"),
+        ("q7", "q7_respect_programme"),
+        ("q8", "q8_adequation_besoins"),
+        ("q9", "q9_satisfaction_globale"),
+        ("commentaire", "commentaire"),
+        ("recommandations", "recommandations"),
+    ]
+    return csv_response(qs, columns, "satisfaction_apprenants.csv")
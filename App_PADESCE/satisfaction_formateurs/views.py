@@ -1,5 +1,4 @@
 import base64
-import csv
 import hashlib
 import logging
 import os
@@ -11,9 +10,9 @@ import requests
 from django.contrib import messages
 from django.core.files.storage import default_storage
 from django.core.paginator import Paginator
-from django.http import HttpResponse
 from django.shortcuts import redirect, render
 
+from App_PADESCE.core.exports import Label, csv_response, user_label
 from App_PADESCE.formations.models import Classe, Formateur
 from App_PADESCE.satisfaction_formateurs.forms import SatisfactionFormateurForm
 from App_PADESCE.satisfaction_formateurs.models import SatisfactionFormateur
@@ -351,54 +350,27 @@ def satisfaction_formateurs(request):
 
 def satisfaction_formateurs_export_csv(request):
     filter_classe = request.GET.get("classe")
-    qs = SatisfactionFormateur.objects.select_related("classe", "formateur", "inspecteur", "enqueteur").order_by("-date")
+    qs = SatisfactionFormateur.objects.order_by("-date")
     if filter_classe:
         qs = qs.filter(classe_id=filter_classe)
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = "attachment; filename=satisfaction_formateurs.csv"
-    writer = csv.writer(response)
-    writer.writerow(
-        [
-            "classe",
-            "formateur",
-            "inspecteur",
-            "enqueteur",
-            "date",
-            "heure",
-            "q1",
-            "q2",
-            "q3",
-            "q4",
-            "q5",
-            "q6",
-            "q7",
-            "q8",
-            "q9",
-            "commentaires",
-            "recommandations",
-        ]
-    )
-    for s in qs:
-        writer.writerow(
-            [
-                s.classe,
-                s.formateur,
-                s.inspecteur,
-                s.enqueteur,
-                s.date,
-                s.heure,
-                s.q1_motivation_apprenants,
-                s.q2_niveau_prerequis,
-                s.q3,
-                s.q4,
-                s.q5,
-                s.q6,
-                s.q7,
-                s.q8,
-                s.q9_satisfaction_globale_prestataire,
-                s.commentaires,
-                s.recommandations,
-            ]
-        )
-    return response
+    columns = [
+        ("classe", Label("classe__code", "classe__intitule_formation")),
+        ("formateur", Label("formateur__code", "formateur__nom_complet")),
+        ("inspecteur", Label("inspecteur__code", "inspecteur__nom_complet")),
+        ("enqueteur", user_label("enqueteur")),
+        ("date", "date"),
+        ("heure", "heure"),
+        ("q1", "q1_motivation_apprenants"),
+        ("q2", "q2_niveau_prerequis"),
+        ("q3", "q3"),
+        ("q4", "q4"),
+        ("q5", "q5"),
+        ("q6", "q6"),
+        ("q7", "q7"),
+        ("q8", "q8"),
+        ("q9", "q9_satisfaction_globale_prestataire"),
+        ("commentaires", "commentaires"),
+        ("recommandations", "recommandations"),
+    ]
+    return csv_response(qs, columns, "satisfaction_formateurs.csv")
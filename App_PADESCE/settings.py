@@ -120,6 +120,32 @@ DATABASES = {
 }
 
 
+# Cache : payloads reporting indexes sur les versions de donnees (voir reporting/cache.py).
+# LocMem par defaut ; DJANGO_CACHE_BACKEND/DJANGO_CACHE_LOCATION pour un cache partage (Redis, fichiers...).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("DJANGO_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("DJANGO_CACHE_LOCATION", 'padesce-default'),
+    }
+}
+REPORTING_CACHE_TIMEOUT = int(os.getenv("REPORTING_CACHE_TIMEOUT", "21600"))
+
+# Fichiers de consolidation en attente de validation (hors MEDIA_ROOT : donnees personnelles).
+CONSOLIDATION_STAGING_DIR = Path(os.getenv("CONSOLIDATION_STAGING_DIR", BASE_DIR / "var" / "consolidation"))
+CONSOLIDATION_STAGING_TTL = int(os.getenv("CONSOLIDATION_STAGING_TTL", "21600"))
+# Lignes par transaction en mise a jour incrementale (verrou rendu entre deux lots, point de reprise).
+CONSOLIDATION_BATCH_SIZE = int(os.getenv("CONSOLIDATION_BATCH_SIZE", "2000"))
+# Base jetable ou le remplacement complet est construit avant bascule (voir reporting/shadow.py).
+DATABASES["consolidation_shadow"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": CONSOLIDATION_STAGING_DIR / "shadow.sqlite3",
+    # Fichier aussi en test : la bascule attache la base par son chemin puis la supprime.
+    "TEST": {"NAME": CONSOLIDATION_STAGING_DIR / "test_shadow.sqlite3"},
+}
+# Imports d'apprenants en cours de correction (sessions) purges apres ce delai d'inactivite.
+APPRENANT_IMPORT_SESSION_TTL = int(os.getenv("APPRENANT_IMPORT_SESSION_TTL", "86400"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -219,3 +245,14 @@ OBIT_API_KEY = os.getenv("OBIT_API_KEY", "613ylj929ogzcqg574ayla2sh4e5lhwa")
 OBIT_SENDER = os.getenv("OBIT_SENDER", "NAUMUR")
 OBIT_API_URL = os.getenv("OBIT_API_URL", "https://obitsms.com/api/v2/bulksms")
 OBIT_COUNTRY = os.getenv("OBIT_COUNTRY", "237")
+# Messages par seconde acceptes par l'API Obit (0 : sans limite).
+OBIT_RATE_LIMIT = float(os.getenv("OBIT_RATE_LIMIT", "5"))
+# File d'envoi des SMS (commande run_sms_outbox) : "obit", ou "fake" pour tester hors ligne.
+SMS_PROVIDER = os.getenv("SMS_PROVIDER", "obit")
+SMS_WORKERS = int(os.getenv("SMS_WORKERS", "8"))
+SMS_MAX_ATTEMPTS = int(os.getenv("SMS_MAX_ATTEMPTS", "5"))
+# Attente avant la 2e tentative (s), doublee a chaque echec passager, plafonnee a SMS_RETRY_MAX_DELAY.
+SMS_RETRY_DELAY = int(os.getenv("SMS_RETRY_DELAY", "30"))
+SMS_RETRY_MAX_DELAY = int(os.getenv("SMS_RETRY_MAX_DELAY", "3600"))
+SMS_FAKE_LATENCY = float(os.getenv("SMS_FAKE_LATENCY", "0.05"))
+SMS_FAKE_RATE_LIMIT = float(os.getenv("SMS_FAKE_RATE_LIMIT", "0"))